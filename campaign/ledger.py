@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# ledger.py
+"""
+Completion ledger for resumable campaigns.
+
+For every energy point (and every cycle on the SHIELD-HIT side) the ledger
+checks that the artifacts a finished job leaves behind exist and are
+well-formed:
+    FLUKA       output/<PROJ>/<PROJ>_<E>/compiled_<sp>_<Etag>_<N>...
+                per species: USRYIELD (101+i) and USRTRACK (81+i) as _tab.lis
+                or _tab.npz, USRBIN (60+i) as .bnn, _bin.npz or .ascii
+    SHIELD-HIT  output/E_<E>/dd_<TAG>_<cycle>.<FILE_TYPE> for every
+                Output tag in detect.dat.template and cycle 1..CYCLES
+Artifacts staged into ``results_<jobid>.zip`` archives (stage.py) are
+checked in place. Results go to ``<jobs-dir>/<name>/ledger.json`` with the size and mtime of
+each verified file, so complete points are not re-read on the next check.
+slurm_array.py ``--resume`` submits only the missing energies (and, for
+SHIELD-HIT, only their missing cycles).
+
+Show the state of a sweep:
+    python ledger.py shieldhit --energies 5 6 7 --cycles 100 --name sh_po16
+"""
+import argparse
+import json
+import pathlib
+import re
+import struct
+import zipfile
+
+from stage import archives, open_source, source_exists, source_stat, split_member
+
+LEDGER_NAME = "ledger.json"
+# written by the SHIELD-HIT runner in adaptive mode: {"converged", "cycles", ...}
+ADAPTIVE_MARKER = "adaptive.json"
+# USR* unit offsets per species index, as in fluka_mc/scripts/runner_script.py
+USRBIN_FIRST, USRTRACK_FIRST, USRYIELD_FIRST = 60, 81, 101
+DETECT_OUTPUT_RX = re.compile(r"^Filename\s+dd_(?P<tag>[^_\s]+)_\{CYCLES\}", re.MULTILINE)
+
+
+def energy_tag(energy_gev):
+    """compiler.sh file tag: energy in eV, zero padded to 10 digits."""
+    return f"{int(round(abs(float(energy_gev)) * 1e9)):010d}"
+
+
+def fortran_records_ok(path):
+    """True if path (file or archive member) is a complete sequence of Fortran unformatted records."""
+    pos = 0
+    with open_source(path) as fh:
+        size = fh.seek(0, 2)
+        fh.seek(0)
+        while pos < size:
+            head = fh.read(4)
+            if len(head) < 4:
+                return False
+            (n,) = struct.unpack("=i", head)
+            if n < 0 or pos + 8 + n > size:
+                return False
+            fh.seek(n, 1)
+            if fh.read(4) != head:
+                return False
+            pos += 8 + n
+    return size > 0
+
+
+def well_formed(path):
+    """Cheap per-format sanity check of one artifact (plain file or archive member)."""
+    if not source_exists(path) or source_stat(path)[0] == 0:
+        return False
+    name = pathlib.PurePath(split_member(path)[1]).name
+    if name.endswith(".npz"):
+        with open_source(path) as fh:
+            return zipfile.is_zipfile(fh)
+    if name.endswith(".lis"):
+        with open_source(path) as fh:
+            return b"Detector" in fh.read(4096)
+    if name.endswith(".bnn"):
+        return fortran_records_ok(path)
+    if name.endswith(".ascii"):
+        with open_source(path) as fh:
+            return sum(1 for _ in fh) >= 15  # usbrea: dose on line 10, error on line 14
+    return True
+
+
+def with_archives(e_dir, names):
+    """Candidates for one artifact: the plain files, then the members of staged archives (newest first)."""
+    staged = archives(e_dir)[::-1]
+    return [e_dir / n for n in names] + [f"{a}/{n}" for a in staged for n in names]
+
+
+def fluka_expected(out_root, proj, energy, species):
+    """{label: [candidate paths]} for one FLUKA energy point; any candidate will do."""
+    e_dir = pathlib.Path(out_root) / proj / f"{proj}_{energy}"
+    tag = energy_tag(energy)
+    expected = {}
+    for i, sp in enumerate(species):
+        stem = f"compiled_{sp.lower()}_{tag}"
+        expected[f"usryield {sp}"] = with_archives(
+            e_dir, [f"{stem}_{USRYIELD_FIRST + i}_tab.{ext}" for ext in ("lis", "npz")])
+        expected[f"usrtrack {sp}"] = with_archives(
+            e_dir, [f"{stem}_{USRTRACK_FIRST + i}_tab.{ext}" for ext in ("lis", "npz")])
+        expected[f"usrbin {sp}"] = with_archives(
+            e_dir, [f"{stem}_{USRBIN_FIRST + i}{sfx}" for sfx in (".bnn", "_bin.npz", ".ascii")])
+    return expected
+
+
+def shieldhit_tags(detect_template):
+    """Output tags (PRO, NEU, ...) of the active Output blocks in detect.dat.template."""
+    return DETECT_OUTPUT_RX.findall(pathlib.Path(detect_template).read_text())
+
+
+def shieldhit_expected(out_root, energy, tags, cycle, file_type):
+    e_dir = pathlib.Path(out_root) / f"E_{energy}"
+    return {f"{t} cycle {cycle}": with_archives(e_dir, [f"dd_{t}_{cycle}.{file_type}"]) for t in tags}
+
+
+def shieldhit_cycles(out_root, energy, cycles):
+    """
+    Cycles an energy point needs: 1..cycles, or only those run before an
+    adaptive run reached its target precision.
+    """
+    e_dir = pathlib.Path(out_root) / f"E_{energy}"
+    marker = next((m for m in with_archives(e_dir, [ADAPTIVE_MARKER]) if source_exists(m)), None)
+    if marker is not None:
+        with open_source(marker) as fh:
+            doc = json.load(fh)
+        if doc.get("converged"):
+            return [c for c in doc["cycles"] if c <= cycles]
+    return list(range(1, cycles + 1))
+
+
+def check(expected, cached=None):
+    """
+    Verify {label: candidates}. Returns (missing labels, {path: stamp} of the
+    files found). A cached file list whose stamps are unchanged is trusted.
+    """
+    if cached and all(source_exists(p) and list(source_stat(p)) == s for p, s in cached.items()):
+        return [], cached
+    missing, found = [], {}
+    for label, candidates in expected.items():
+        hit = next((p for p in candidates if well_formed(p)), None)
+        if hit is None:
+            missing.append(label)
+        else:
+            found[str(hit)] = list(source_stat(hit))
+    return missing, found
+
+
+class Ledger:
+    """ledger.json in a campaign dir: {energy: {"complete", "missing", "files", "expected", "cycles"}}."""
+
+    def __init__(self, job_dir):
+        self.path = pathlib.Path(job_dir) / LEDGER_NAME
+        self.points = json.loads(self.path.read_text()) if self.path.is_file() else {}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.points, indent=1, sort_keys=True))
+        tmp.replace(self.path)
+
+    @staticmethod
+    def _cached(entry, expected):
+        """Files of a complete entry checked against the same expectations, else None."""
+        if entry.get("complete") and entry.get("expected") == sorted(expected):
+            return entry.get("files")
+        return None
+
+    def update_fluka(self, out_root, proj, energy, species):
+        expected = fluka_expected(out_root, proj, energy, species)
+        missing, files = check(expected, self._cached(self.points.get(str(energy), {}), expected))
+        self.points[str(energy)] = {"complete": not missing, "missing": missing, "files": files,
+                                    "expected": sorted(expected)}
+        return not missing
+
+    def update_shieldhit(self, out_root, energy, tags, cycles, file_type):
+        """Returns the list of cycles still to run for this energy."""
+        old = self.points.get(str(energy), {}).get("cycles", {})
+        entry, todo = {}, []
+        for c in shieldhit_cycles(out_root, energy, cycles):
+            expected = shieldhit_expected(out_root, energy, tags, c, file_type)
+            missing, files = check(expected, self._cached(old.get(str(c), {}), expected))
+            entry[str(c)] = {"complete": not missing, "files": files, "expected": sorted(expected)}
+            if missing:
+                todo.append(c)
+        self.points[str(energy)] = {"complete": not todo, "missing": [f"cycle {c}" for c in todo],
+                                    "cycles": entry}
+        return todo
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Check which energy points of a campaign are complete.")
+    ap.add_argument("engine", choices=["fluka", "shieldhit"])
+    ap.add_argument("--energies", nargs="+", required=True)
+    ap.add_argument("--name", required=True, help="Campaign name (jobs/<name>/ledger.json)")
+    ap.add_argument("--jobs-dir", default="jobs")
+    ap.add_argument("--out-root", default="output")
+    ap.add_argument("--species", default="", help="FLUKA: SPECIES_N list")
+    ap.add_argument("--cycles", type=int, default=1, help="SHIELD-HIT: cycles per energy")
+    ap.add_argument("--file-type", default="bdo", help="SHIELD-HIT: FILE_TYPE")
+    ap.add_argument("--detect-template", default="dat_templates/detect.dat.template")
+    args = ap.parse_args()
+
+    ledger = Ledger(pathlib.Path(args.jobs_dir) / args.name)
+    tags = shieldhit_tags(args.detect_template) if args.engine == "shieldhit" else None
+    for E in args.energies:
+        if args.engine == "fluka":
+            ledger.update_fluka(args.out_root, args.name, E, args.species.split())
+        else:
+            ledger.update_shieldhit(args.out_root, E, tags, args.cycles, args.file_type)
+        p = ledger.points[str(E)]
+        print(f"  E = {E:<10} {'complete' if p['complete'] else 'missing: ' + ', '.join(p['missing'][:6])}")
+    ledger.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# runtime_model.py
+"""
+Per-project runtime model for campaign submission.
+
+Every array task written by slurm_array.py appends one line per finished
+energy to ``<jobs-dir>/<name>/timings.tsv`` (energy, wall seconds, exit code,
+array job id, the cost parameters of that run and a note); ``campaign.json``
+next to it names the project and template. From these the model fits
+
+    log(t / work) = b0 + b1 log(E) + b2 log(n_species) + beam-type offsets
+
+with ``work = N_PRIMARIES * ceil(CYCLES / cpus)`` (runtime taken to scale
+linearly with primaries per core). Terms without spread in the history are
+left out, so a single-project history still gives a usable E dependence.
+Only runs that exited 0 are fitted: the wall time of a failed energy (the
+per-energy scripts exit with the code of the failed stage) says nothing
+about its cost. Nor does that of a FLUKA deck-cache hit (logged as a
+``DECK_CACHE_HIT`` line, noted ``cache_hit``), which skipped rfluka.
+
+slurm_array.py uses the predictions to set ``--time`` (safety factor, rounded
+up, capped by the old fixed walltime) and to pack energies of similar cost
+into the same array task, one array per walltime class.
+
+Inspect a history:
+    python runtime_model.py jobs/apo16 --energies 0.1 0.2 0.3
+"""
+import argparse
+import json
+import math
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+TIMINGS_NAME = "timings.tsv"
+CAMPAIGN_NAME = "campaign.json"
+TIMING_COLUMNS = ["energy", "seconds", "rc", "job_id", "primaries", "cycles", "n_species", "beam", "cpus",
+                  "note"]
+# log line of a job template whose run was skipped, and its note in timings.tsv
+CACHE_HIT_MARKER, CACHE_HIT_NOTE = "DECK_CACHE_HIT", "cache_hit"
+# template keys holding the cost drivers (FLUKA and SHIELD-HIT templates)
+PRIMARIES_KEY, CYCLES_KEY, SPECIES_KEY, BEAM_KEY = "N_PRIMARIES", "CYCLES", "SPECIES_N", "BEAM_TYPE"
+RIDGE = 1e-6
+
+
+def campaign_params(subs, cpus_per_energy):
+    """Cost-relevant parameters of one campaign, from its template substitutions."""
+    return {
+        "primaries": float(subs.get(PRIMARIES_KEY, 1.0)),
+        "cycles": int(float(subs.get(CYCLES_KEY, 1))),
+        "n_species": max(1, len(str(subs.get(SPECIES_KEY, "")).split())),
+        "beam": str(subs.get(BEAM_KEY) or "-"),
+        "cpus": int(cpus_per_energy),
+    }
+
+
+def load_history(jobs_root, project=None, template=None):
+    """
+    All timings of successful runs (no cache hits) under jobs_root as one frame (energy, seconds,
+    primaries, cycles, n_species, beam, cpus, project). Campaigns of the
+    given project are used when there are any, else those of the same template.
+    """
+    rows = []
+    for meta_path in sorted(pathlib.Path(jobs_root).glob(f"*/{CAMPAIGN_NAME}")):
+        timings = meta_path.with_name(TIMINGS_NAME)
+        if not timings.is_file() or timings.stat().st_size == 0:
+            continue
+        meta = json.loads(meta_path.read_text())
+        # older files have no note column; it reads as NaN there
+        t = pd.read_csv(timings, sep="\t", header=None, names=TIMING_COLUMNS,
+                        dtype={"beam": str, "note": str})
+        t = t[(t["rc"] == 0) & (t["note"] != CACHE_HIT_NOTE)]
+        t["project"] = meta["project"]
+        t["template"] = meta["template"]
+        rows.append(t)
+    if not rows:
+        return pd.DataFrame(columns=TIMING_COLUMNS)
+    hist = pd.concat(rows, ignore_index=True)
+    if project is not None and (hist["project"] == project).any():
+        return hist[hist["project"] == project]
+    if template is not None:
+        return hist[hist["template"] == template]
+    return hist
+
+
+def work_units(primaries, cycles, cpus):
+    return primaries * math.ceil(cycles / max(cpus, 1))
+
+
+class RuntimeModel:
+    """Least-squares fit of log runtime per unit of work (see module docstring)."""
+
+    def __init__(self):
+        self.terms, self.beams, self.coef = [], [], None
+
+    def _design(self, energy, n_species, beam):
+        cols = [np.ones(len(energy))]
+        if "logE" in self.terms:
+            cols.append(np.log(energy))
+        if "logS" in self.terms:
+            cols.append(np.log(n_species))
+        for b in self.beams[1:]:
+            cols.append((beam == b).astype(float))
+        return np.stack(cols, axis=1)
+
+    def fit(self, hist):
+        h = hist[(hist["energy"] > 0) & (hist["seconds"] > 0)]
+        if "rc" in h:
+            h = h[h["rc"] == 0]
+        if "note" in h:
+            h = h[h["note"] != CACHE_HIT_NOTE]
+        if h.empty:
+            raise ValueError("no usable timings in history")
+        energy = h["energy"].to_numpy(float)
+        n_species = h["n_species"].to_numpy(float)
+        beam = h["beam"].astype(str).to_numpy()
+        self.terms = [name for name, x in (("logE", energy), ("logS", n_species)) if np.ptp(x) > 0]
+        self.beams = sorted(set(beam))
+
+        X = self._design(energy, n_species, beam)
+        y = np.log(h["seconds"].to_numpy(float) / [
+            work_units(p, c, n) for p, c, n in zip(h["primaries"], h["cycles"], h["cpus"])
+        ])
+        # tiny ridge keeps collinear / short histories solvable
+        A = X.T @ X + RIDGE * np.eye(X.shape[1])
+        self.coef = np.linalg.solve(A, X.T @ y)
+        self.n_points = len(h)
+        return self
+
+    def predict(self, energies, params):
+        """Predicted wall seconds for each energy under the campaign params."""
+        energies = np.asarray(energies, dtype=float)
+        n = len(energies)
+        beam = params["beam"] if params["beam"] in self.beams else self.beams[0]
+        X = self._design(energies, np.full(n, float(params["n_species"])), np.full(n, beam))
+        work = work_units(params["primaries"], params["cycles"], params["cpus"])
+        return np.exp(X @ self.coef) * work
+
+
+def parse_walltime(text):
+    """Slurm time ('D-HH:MM:SS', 'HH:MM:SS', 'MM:SS' or minutes) -> seconds."""
+    days, _, rest = str(text).rpartition("-")
+    parts = [int(p) for p in rest.split(":")]
+    if len(parts) == 1:
+        parts = [0, parts[0], 0]
+    elif len(parts) == 2:
+        parts = [0] + parts
+    h, m, s = parts
+    return (int(days or 0) * 24 + h) * 3600 + m * 60 + s
+
+
+def format_walltime(seconds):
+    seconds = int(math.ceil(seconds))
+    d, rem = divmod(seconds, 86400)
+    h, rem = divmod(rem, 3600)
+    m, s = divmod(rem, 60)
+    return f"{d}-{h:02d}:{m:02d}:{s:02d}" if d else f"{h:02d}:{m:02d}:{s:02d}"
+
+
+def walltime(predicted, safety=1.5, step=900, cap=None):
+    """Requested seconds: predicted * safety, rounded up to step, at least step, at most cap."""
+    t = max(step, math.ceil(predicted * safety / step) * step)
+    return min(t, cap) if cap else t
+
+
+def pack(energies, costs, per_task):
+    """
+    Group energies into tasks of per_task similar-cost energies. Energies in a
+    task run side by side, so a task lasts as long as its slowest member;
+    sorting by cost before chunking keeps the idle cores to a minimum.
+    Returns a list of (energies, task cost), cheapest first.
+    """
+    order = np.argsort(costs, kind="stable")
+    tasks = []
+    for i in range(0, len(order), per_task):
+        idx = order[i:i + per_task]
+        tasks.append(([energies[j] for j in idx], float(np.max(np.asarray(costs)[idx]))))
+    return tasks
+
+
+def time_classes(tasks, n_classes, safety=1.5, step=900, cap=None):
+    """
+    Split packed tasks into at most n_classes groups of similar walltime.
+    Returns a list of (walltime seconds, [energies of each task]).
+    """
+    if not tasks:
+        return []
+    bounds = np.array_split(np.arange(len(tasks)), min(n_classes, len(tasks)))
+    classes = []
+    for b in bounds:
+        group = [tasks[i] for i in b]
+        classes.append((walltime(max(c for _, c in group), safety, step, cap), [e for e, _ in group]))
+    # merge neighbours that ended up with the same walltime
+    merged = []
+    for t, grp in classes:
+        if merged and merged[-1][0] == t:
+            merged[-1][1].extend(grp)
+        else:
+            merged.append((t, grp))
+    return merged
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fit and query the campaign runtime model.")
+    ap.add_argument("campaign", help="Campaign dir (jobs/<name>) whose params to predict for")
+    ap.add_argument("--energies", nargs="+", type=float, required=True)
+    ap.add_argument("--safety", type=float, default=1.5)
+    args = ap.parse_args()
+
+    cdir = pathlib.Path(args.campaign)
+    meta = json.loads((cdir / CAMPAIGN_NAME).read_text())
+    hist = load_history(cdir.parent, project=meta["project"], template=meta["template"])
+    model = RuntimeModel().fit(hist)
+    print(f"[INFO] fitted on {model.n_points} timings, terms: {['const'] + model.terms + model.beams[1:]}")
+    for E, t in zip(args.energies, model.predict(args.energies, meta["params"])):
+        print(f"  E = {E:<10g} predicted {format_walltime(t)}  request {format_walltime(walltime(t, args.safety))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# slurm_array.py
+"""
+Submit a FLUKA or SHIELD-HIT energy sweep as one Slurm job array.
+
+The per-energy job template (``__KEY__`` placeholders, as rendered by the old
+sed loops in executor.sh) is rendered once per energy into
+``<jobs-dir>/<name>/E_<E>.sh``. A single array script then runs a chunk of
+``--per-task`` energies per array task side by side, each with
+``--cpus-per-energy`` cores, so a 42-energy sweep is one ``sbatch`` call
+instead of 42. ``--max-parallel N`` adds the ``%N`` concurrency cap.
+
+Called from the executors, e.g. in fluka_mc/:
+    python3 ../campaign/slurm_array.py --template templates/cluster_run_template.pbs \\
+        --name apo16 --energies 0.1 0.2 0.3 --per-task 2 --cpus-per-energy 4 \\
+        --set PROJ_NAME=apo16 --set N_PRIMARIES=1E7 ...
+``--sbatch`` selects the submit command (a recording stub works for dry runs),
+``--dry-run`` only writes the scripts.
+
+Each array task logs the wall time of every energy to ``timings.tsv`` (runs
+whose log has a ``DECK_CACHE_HIT`` line are noted as cache hits). With
+``--model`` those timings (runtime_model.py) set the walltime and pack
+energies of similar predicted cost together, submitting one array per
+walltime class (``array_<k>.sh``); ``--time`` is then the upper cap.
+
+``--resume fluka|shieldhit`` checks the completion ledger (ledger.py) first
+and submits only energy points whose outputs are missing or malformed; a
+SHIELD-HIT point gets ``__CYCLE_LIST__`` set to just its missing cycles.
+"""
+import argparse
+import json
+import pathlib
+import re
+import shlex
+import subprocess
+
+from ledger import Ledger, shieldhit_tags
+from runtime_model import (
+    CACHE_HIT_MARKER, CACHE_HIT_NOTE, CAMPAIGN_NAME, TIMINGS_NAME, RuntimeModel, campaign_params,
+    format_walltime, load_history, pack, parse_walltime, time_classes,
+)
+
+PLACEHOLDER_RX = re.compile(r"__([A-Z][A-Z0-9_]*?)__")
+MEM_RX = re.compile(r"^(?P<n>\d+(?:\.\d+)?)(?P<unit>[KMGT]?)B?$", re.IGNORECASE)
+
+
+def render(template, subs):
+    """Replace every ``__KEY__`` in template; unknown placeholders are an error."""
+    missing = sorted({m for m in PLACEHOLDER_RX.findall(template) if m not in subs})
+    if missing:
+        raise ValueError(f"template placeholders without a value: {', '.join(missing)}")
+    return PLACEHOLDER_RX.sub(lambda m: str(subs[m.group(1)]), template)
+
+
+def chunk(energies, per_task):
+    """Split energies into array tasks of at most per_task energies, in order."""
+    if per_task < 1:
+        raise ValueError("per_task must be >= 1")
+    return [list(energies[i:i + per_task]) for i in range(0, len(energies), per_task)]
+
+
+def scale_mem(mem, factor):
+    """'2G' * 3 -> '6G' (Slurm memory strings; unit kept, fractions rounded up to M)."""
+    m = MEM_RX.match(str(mem).strip())
+    if not m:
+        raise ValueError(f"cannot parse memory '{mem}'")
+    n, unit = float(m["n"]) * factor, (m["unit"] or "M").upper()
+    if n.is_integer():
+        return f"{int(n)}{unit}"
+    steps = "KMGT"
+    mb = n * 1024 ** (steps.index(unit) - 1)
+    return f"{int(-(-mb // 1))}M"
+
+
+def array_script(name, tasks, job_dir, cpus_per_energy, partition, time, mem_per_energy,
+                 max_parallel=None, params=None):
+    """
+    Text of the array driver: task i runs tasks[i] energies concurrently and
+    fails if any fails. Every energy appends its wall time to timings.tsv.
+    """
+    p = params or {}
+    cost = "\t".join(str(p.get(k, "")) for k in ("primaries", "cycles", "n_species", "beam", "cpus"))
+    per_task = max(len(t) for t in tasks)
+    array = f"0-{len(tasks) - 1}" + (f"%{max_parallel}" if max_parallel else "")
+    task_lines = "\n".join(f'  "{" ".join(t)}"' for t in tasks)
+    job_dir = shlex.quote(str(job_dir))
+    return f"""#!/bin/bash
+#SBATCH --job-name={name}
+#SBATCH --partition={partition}
+#SBATCH --array={array}
+#SBATCH --ntasks=1
+#SBATCH --ntasks-per-node=1
+#SBATCH --cpus-per-task={per_task * cpus_per_energy}
+#SBATCH --mem={scale_mem(mem_per_energy, per_task)}
+#SBATCH --time={time}
+#SBATCH --output={job_dir}/slurm-%A_%a.out
+
+cd "$SLURM_SUBMIT_DIR"
+
+# energies handled by each array task
+TASKS=(
+{task_lines}
+)
+read -r -a ENERGIES <<< "${{TASKS[$SLURM_ARRAY_TASK_ID]}}"
+echo "Array task ${{SLURM_ARRAY_TASK_ID}}: E = ${{ENERGIES[*]}}"
+
+pids=()
+for E in "${{ENERGIES[@]}}"; do
+    (
+        start=$(date +%s)
+        SLURM_CPUS_PER_TASK={cpus_per_energy} bash {job_dir}/E_"${{E}}".sh > {job_dir}/E_"${{E}}".log 2>&1
+        rc=$?
+        note=""
+        grep -q '^{CACHE_HIT_MARKER}' {job_dir}/E_"${{E}}".log && note={CACHE_HIT_NOTE}
+        printf '%s\t%s\t%s\t%s\t{cost}\t%s\n' "$E" "$(( $(date +%s) - start ))" "$rc" \
+            "${{SLURM_ARRAY_JOB_ID:-0}}" "$note" >> {job_dir}/{TIMINGS_NAME}
+        exit $rc
+    ) &
+    pids+=( $! )
+done
+
+fail=0
+for i in "${{!pids[@]}}"; do
+    if ! wait "${{pids[i]}}"; then
+        echo "FAILED E = ${{ENERGIES[i]}} (log: {job_dir}/E_${{ENERGIES[i]}}.log)"
+        fail=1
+    fi
+done
+exit $fail
+"""
+
+
+def write_campaign(template_path, name, energies, subs, jobs_dir, cpus_per_energy, time,
+                   mem_per_energy, energy_key="ENERGY", per_energy=None):
+    """
+    Render E_<E>.sh for every energy and campaign.json; returns the campaign dir.
+    per_energy optionally maps an energy to extra substitutions for its script.
+    """
+    template = pathlib.Path(template_path).read_text()
+    job_dir = pathlib.Path(jobs_dir) / name
+    job_dir.mkdir(parents=True, exist_ok=True)
+
+    base = dict(subs, CPUS=cpus_per_energy, TIME=time, MEM=mem_per_energy)
+    for E in energies:
+        script = job_dir / f"E_{E}.sh"
+        extra = (per_energy or {}).get(E, {})
+        script.write_text(render(template, dict(base, **extra, **{energy_key: E})))
+        script.chmod(0o755)
+
+    meta = {"project": name, "template": pathlib.Path(template_path).name,
+            "params": campaign_params(subs, cpus_per_energy), "subs": subs}
+    (job_dir / CAMPAIGN_NAME).write_text(json.dumps(meta, indent=1))
+    return job_dir
+
+
+def write_arrays(job_dir, name, classes, cpus_per_energy, partition, mem_per_energy,
+                 max_parallel=None, params=None):
+    """
+    One array script per (walltime, tasks) class: array.sh for a single class,
+    array_<k>.sh otherwise. Returns the script paths.
+    """
+    job_dir = pathlib.Path(job_dir)
+    for old in job_dir.glob("array*.sh"):
+        old.unlink()
+    paths = []
+    for k, (time, tasks) in enumerate(classes):
+        path = job_dir / ("array.sh" if len(classes) == 1 else f"array_{k}.sh")
+        path.write_text(array_script(name, tasks, job_dir.resolve(), cpus_per_energy, partition,
+                                     time, mem_per_energy, max_parallel, params))
+        paths.append(path)
+    return paths
+
+
+def model_classes(jobs_dir, name, template_path, energies, params, per_task, cap, n_classes, safety):
+    """
+    [(walltime, tasks)] from the runtime model, or None without usable history.
+    """
+    hist = load_history(jobs_dir, project=name, template=pathlib.Path(template_path).name)
+    try:
+        model = RuntimeModel().fit(hist)
+    except ValueError:
+        return None
+    costs = model.predict([float(e) for e in energies], params)
+    packed = pack(list(energies), costs, per_task)
+    classes = time_classes(packed, n_classes, safety=safety, cap=parse_walltime(cap))
+    print(f"[INFO] runtime model: {model.n_points} timings, predicted "
+          f"{format_walltime(min(costs))} .. {format_walltime(max(costs))} per energy")
+    return [(format_walltime(t), tasks) for t, tasks in classes]
+
+
+def resume_plan(engine, name, energies, subs, jobs_dir, out_root, detect_template):
+    """
+    Update the campaign ledger and return (energies still to run, per-energy
+    substitutions). SHIELD-HIT points only rerun their missing cycles.
+    """
+    ledger = Ledger(pathlib.Path(jobs_dir) / name)
+    todo, per_energy = [], {}
+    if engine == "fluka":
+        species = subs.get("SPECIES_N", "").split()
+        proj = subs.get("PROJ_NAME", name)
+        todo = [E for E in energies if not ledger.update_fluka(out_root, proj, E, species)]
+    else:
+        tags = shieldhit_tags(detect_template)
+        cycles = int(subs.get("CYCLES", 1))
+        for E in energies:
+            missing = ledger.update_shieldhit(out_root, E, tags, cycles, subs.get("FILE_TYPE", "bdo"))
+            if missing:
+                todo.append(E)
+                per_energy[E] = {"CYCLE_LIST": "all" if len(missing) == cycles else " ".join(map(str, missing))}
+    ledger.save()
+    return todo, per_energy
+
+
+def submit(script, sbatch="sbatch", extra=()):
+    """sbatch --parsable <script>; returns the job id string."""
+    out = subprocess.run([*shlex.split(sbatch), "--parsable", *extra, str(script)],
+                         check=True, capture_output=True, text=True).stdout
+    return out.strip().split(";")[0]
+
+
+def parse_sets(items):
+    subs = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"[FATAL] --set expects KEY=VALUE, got '{item}'")
+        subs[key] = value
+    return subs
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Submit an energy sweep as one Slurm job array.")
+    ap.add_argument("--template", required=True, help="Per-energy job template with __KEY__ placeholders")
+    ap.add_argument("--name", required=True, help="Campaign / job name")
+    ap.add_argument("--energies", nargs="+", required=True, help="Energy values, as written into __ENERGY__")
+    ap.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                    help="Template substitution (repeatable)")
+    ap.add_argument("--per-task", type=int, default=1, help="Energies packed into one array task")
+    ap.add_argument("--cpus-per-energy", type=int, default=1, help="Cores for each energy in a task")
+    ap.add_argument("--mem-per-energy", default="2G", help="Memory for each energy in a task")
+    ap.add_argument("--time", default="10:00:00", help="Walltime of one array task")
+    ap.add_argument("--partition", default="q48")
+    ap.add_argument("--max-parallel", type=int, default=None, help="Array concurrency cap (%%N)")
+    ap.add_argument("--jobs-dir", default="jobs", help="Where rendered scripts and logs go")
+    ap.add_argument("--resume", choices=["fluka", "shieldhit"], default=None,
+                    help="Submit only energy points (cycles) the completion ledger finds missing")
+    ap.add_argument("--out-root", default="output", help="Campaign output root checked by --resume")
+    ap.add_argument("--detect-template", default="dat_templates/detect.dat.template",
+                    help="SHIELD-HIT detect.dat template listing the expected outputs (--resume)")
+    ap.add_argument("--model", action="store_true",
+                    help="Set walltimes / packing from the recorded timings (--time becomes the cap)")
+    ap.add_argument("--time-classes", type=int, default=3, help="Max arrays (walltime classes) with --model")
+    ap.add_argument("--safety", type=float, default=1.5, help="Walltime = predicted runtime x safety")
+    ap.add_argument("--sbatch", default="sbatch", help="Submit command")
+    ap.add_argument("--dry-run", action="store_true", help="Write the scripts, do not submit")
+    args = ap.parse_args()
+
+    subs = parse_sets(args.set)
+    energies, per_energy = args.energies, None
+    if args.resume:
+        energies, per_energy = resume_plan(args.resume, args.name, args.energies, subs, args.jobs_dir,
+                                           args.out_root, args.detect_template)
+        print(f"[INFO] ledger: {len(args.energies) - len(energies)} of {len(args.energies)} "
+              f"energy points complete")
+        if not energies:
+            print("[OK] nothing to submit")
+            return
+    try:
+        job_dir = write_campaign(
+            args.template, args.name, energies, subs, args.jobs_dir,
+            args.cpus_per_energy, args.time, args.mem_per_energy, per_energy=per_energy,
+        )
+    except ValueError as e:
+        raise SystemExit(f"[FATAL] {e}")
+    params = campaign_params(subs, args.cpus_per_energy)
+
+    classes = None
+    if args.model:
+        classes = model_classes(args.jobs_dir, args.name, args.template, energies, params,
+                                args.per_task, args.time, args.time_classes, args.safety)
+        if classes is None:
+            print(f"[WARN] no timings recorded for {args.name} yet, using --time {args.time}")
+    if classes is None:
+        classes = [(args.time, chunk(energies, args.per_task))]
+
+    arrays = write_arrays(job_dir, args.name, classes, args.cpus_per_energy, args.partition,
+                          args.mem_per_energy, args.max_parallel, params)
+    for path, (time, tasks) in zip(arrays, classes):
+        print(f"[INFO] {sum(map(len, tasks))} energies -> {len(tasks)} array tasks "
+              f"({args.per_task} per task, {args.cpus_per_energy} cores each, --time {time}): {path}")
+    if args.dry_run:
+        return
+    for path in arrays:
+        job_id = submit(path, args.sbatch)
+        print(f"[OK] submitted array job {job_id} ({path.name})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# stage.py
+"""
+Bulk staging of job results from /scratch to the submit directory.
+
+Instead of copying every output back on its own (thousands of small-file
+writes on the shared filesystem per job), a job packs them into one zip
+archive on /scratch, with a SHA256SUMS member, and moves that single file:
+    python3 stage.py pack output/E_100/results_<jobid>.zip dd_* adaptive.*
+The archive is written next to the files, copied to the output directory
+under a dot-prefixed temporary name, verified against its checksums and
+renamed into place. Members are stored flat and compressed one by one, so
+readers open them straight from the archive without extracting anything.
+
+Members are addressed as ``<dir>/results_<jobid>.zip/<member>``. This module
+owns that convention (split_member, open_source, source_stat): the readers
+(ledger.py, fluka_mc/scripts/tab_reader.py, shieldhit_mc/bdo_reader.py)
+import them from here. Check an archive, or unpack members for tools
+that only read plain files (shieldhit_mc/run_convertmc.sh):
+    python3 stage.py verify output/E_100/results_<jobid>.zip
+    python3 stage.py extract output/E_100/results_<jobid>.zip /tmp/E_100 "*.bdo"
+"""
+import argparse
+import fnmatch
+import glob
+import hashlib
+import io
+import os
+import pathlib
+import shutil
+import zipfile
+
+ARCHIVE_GLOB = "results_*.zip"
+SUMS_NAME = "SHA256SUMS"
+# already compressed: deflating again only costs time
+STORED_SUFFIXES = (".gz", ".zip")
+
+
+def split_member(path):
+    """(archive, member) for '<dir>/<name>.zip/<member>', else (None, path)."""
+    s = str(path)
+    i = s.rfind(".zip/")
+    if i < 0:
+        return None, s
+    return s[:i + 4], s[i + 5:]
+
+
+def open_source(path):
+    """Binary file object for a plain file or an archive member (read into memory)."""
+    archive, member = split_member(path)
+    if archive is None:
+        return open(path, "rb")
+    with zipfile.ZipFile(archive) as zf:
+        return io.BytesIO(zf.read(member))
+
+
+def source_exists(path):
+    archive, member = split_member(path)
+    if archive is None:
+        return os.path.isfile(path)
+    if not os.path.isfile(archive):
+        return False
+    with zipfile.ZipFile(archive) as zf:
+        return member in zf.NameToInfo
+
+
+def source_stat(path):
+    """(size, mtime_ns) of a plain file; (member size, archive mtime_ns) of an archive member."""
+    archive, member = split_member(path)
+    if archive is None:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    with zipfile.ZipFile(archive) as zf:
+        size = zf.getinfo(member).file_size
+    return size, os.stat(archive).st_mtime_ns
+
+
+def archives(directory):
+    return sorted(glob.glob(os.path.join(str(directory), ARCHIVE_GLOB)))
+
+
+def members(archive, pattern="*"):
+    """Member paths of archive whose names match pattern."""
+    with zipfile.ZipFile(archive) as zf:
+        names = [n for n in zf.namelist() if n != SUMS_NAME and fnmatch.fnmatch(n, pattern)]
+    return [f"{archive}/{n}" for n in sorted(names)]
+
+
+def _sha256(fh, chunk=1 << 20):
+    h = hashlib.sha256()
+    for buf in iter(lambda: fh.read(chunk), b""):
+        h.update(buf)
+    return h.hexdigest()
+
+
+def pack(archive, files):
+    """Write files (flat, by base name) plus SHA256SUMS into archive; returns the member count."""
+    sums = []
+    with zipfile.ZipFile(archive, "w") as zf:
+        for f in sorted(set(map(str, files))):
+            name = os.path.basename(f)
+            with open(f, "rb") as fh:
+                sums.append(f"{_sha256(fh)}  {name}")
+            ctype = zipfile.ZIP_STORED if name.endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+            zf.write(f, name, compress_type=ctype)
+        zf.writestr(SUMS_NAME, "\n".join(sums) + "\n", compress_type=zipfile.ZIP_DEFLATED)
+    return len(sums)
+
+
+def verify(archive):
+    """Names of the members whose content does not match SHA256SUMS (empty: archive is good)."""
+    bad = []
+    with zipfile.ZipFile(archive) as zf:
+        if SUMS_NAME not in zf.NameToInfo:
+            return [SUMS_NAME]
+        for line in zf.read(SUMS_NAME).decode().splitlines():
+            digest, name = line.split("  ", 1)
+            try:
+                with zf.open(name) as fh:
+                    ok = _sha256(fh) == digest
+            except (KeyError, zipfile.BadZipFile):
+                ok = False
+            if not ok:
+                bad.append(name)
+    return bad
+
+
+def extract(archive, dest, pattern="*"):
+    """Unpack the members of archive matching pattern into dest; returns the written paths."""
+    dest = pathlib.Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    out = []
+    with zipfile.ZipFile(archive) as zf:
+        for name in sorted(zf.namelist()):
+            if name == SUMS_NAME or not fnmatch.fnmatch(name, pattern):
+                continue
+            path = dest / os.path.basename(name)
+            with zf.open(name) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            out.append(path)
+    return out
+
+
+def stage(files, dest, workdir="."):
+    """Pack files into workdir, copy the archive to dest and verify it there."""
+    dest = pathlib.Path(dest)
+    local = pathlib.Path(workdir) / dest.name
+    n = pack(local, files)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.tmp")
+    shutil.copyfile(local, tmp)
+    bad = verify(tmp)
+    if bad:
+        raise IOError(f"{tmp}: checksum mismatch after copy: {', '.join(bad[:5])}")
+    os.replace(tmp, dest)
+    local.unlink()
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Stage job results as one checksummed archive.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="Pack files into an archive and move it into place")
+    p.add_argument("archive", help="Destination, e.g. output/E_100/results_<jobid>.zip")
+    p.add_argument("files", nargs="*", help="Files to pack (unmatched shell globs are ignored)")
+    v = sub.add_parser("verify", help="Check the members of an archive against SHA256SUMS")
+    v.add_argument("archive")
+    x = sub.add_parser("extract", help="Unpack matching members into a directory")
+    x.add_argument("archive")
+    x.add_argument("dest")
+    x.add_argument("pattern", nargs="?", default="*", help="Member name glob (default: all)")
+    args = ap.parse_args()
+
+    if args.cmd == "pack":
+        files = [f for f in args.files if os.path.isfile(f)]
+        if not files:
+            print(f"[WARN] nothing to stage into {args.archive}")
+            return
+        n = stage(files, args.archive)
+        print(f"[OK] staged {n} files into {args.archive}")
+    elif args.cmd == "extract":
+        paths = extract(args.archive, args.dest, args.pattern)
+        print(f"[OK] extracted {len(paths)} members of {args.archive} into {args.dest}")
+    else:
+        bad = verify(args.archive)
+        if bad:
+            raise SystemExit(f"[FATAL] {args.archive}: {len(bad)} bad members: {', '.join(bad[:10])}")
+        print(f"[OK] {args.archive} verified")
+
+
+if __name__ == "__main__":
+    main()
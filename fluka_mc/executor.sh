@@ -6,7 +6,20 @@ PARTITION=q48
 BEAM_TYPE=APROTON
 NPRIM=1.0E7
 CYCLES=1
+CPUS=1 # cycles run as concurrent rfluka -M1 processes (one core each)
+FORT_MERGE=text # text: usysuw/ustsuw/usbsuw, numpy: scripts/fort_reader.py (no text round-trip)
 TIME=10:00:00
+MEM=2G # per energy
+PER_TASK=1 # energies packed into one array task
+MAX_PARALLEL= # optional cap on concurrently running array tasks
+STAGE=archive # archive: one checksummed results_<jobid>.zip per energy; files: copy outputs back one by one
+DECK_CACHE= # e.g. cache/decks: reuse compiled outputs of identical decks across projects (empty: off)
+DECK_CACHE_GB=50 # LRU-evicted above this size
+ADAPTIVE_TARGET= # max USRYIELD rel_err in %: CYCLES becomes the budget, run in batches (empty: off)
+ADAPTIVE_BATCH=2 # cycles per batch
+ADAPTIVE_DETECTORS= # species whose yields must converge (empty: all of SPECIES_N)
+FRESH=0 # 1 = wipe output/ and rerun every energy; 0 = resume, submit only missing work
+RUNTIME_MODEL= # --model: walltime + packing from recorded timings (TIME is then the cap)
 
 #ENVIROMENT=/home/dcpt/bashrc.dcpt
 #ENVIROMENT=/home/mortenmj/opt/fluka_infn/env_fluka_infn.sh
@@ -36,6 +49,7 @@ SPECIES_N=(PROTON NEUTRON DEUTERON PHOTON 4-HELIUM TRITON PIZERO PION+ PION- APR
 
 
 
+if [[ "$FRESH" == 1 ]]; then rm -rf "output/${PROJ_NAME}" "jobs/${PROJ_NAME}/ledger.json"; fi
 mkdir -p output
 
 # = PARTICLE THERAPY SET-UP = #
@@ -45,28 +59,37 @@ mkdir -p output
 #E_LIST=(0.000000001 0.00000001 0.0000001 0.000001 0.00001 0.0001 0.001) #1eV -> 1MeV
 E_LIST=(0.00001)
 
-for E in "${E_LIST[@]}"; do
-    echo "Submitting E = ${E} GeV"
-
-    # generate PBS file with substitutions
-    sed -e "s/__ENERGY__/${E}/g" \
-        -e "s/__N_PRIMARIES__/${NPRIM}/g" \
-        -e "s/__ANG_BINS__/${ANG_BINS}/g" \
-        -e "s/__E_BIN_WIDTH__/${E_BIN_WIDTH}/g" \
-        -e "s/__SPECIES_N__/${SPECIES_N[*]}/g" \
-        -e "s/__PROJ_NAME__/${PROJ_NAME}/g" \
-        -e "s/__BEAM_TYPE__/${BEAM_TYPE}/g" \
-        -e "s/__TARG_TYPE__/${TARG_TYPE}/g" \
-        -e "s/__CYCLES__/${CYCLES}/g" \
-        -e "s#__ENVIROMENT__#${ENVIROMENT}#g" \
-        -e "s#__TARG_THICKNESS__#${TARG_THICKNESS}#g" \
-        -e "s#__TARG_WIDTH__#${TARG_WIDTH}#g" \
-        -e "s/__TIME__/${TIME}/g" \
-        -e "s/__E_BIN_MIN__/${E_BIN_MIN}/g" \
-        -e "s/__E_LIST__/${E_LIST}/g" \
-        -e "s/__MAX_E_SCORE__/${MAX_E_SCORE}/g" \
-        templates/cluster_run_template.pbs > cluster_run_E${E}.pbs
-
-    sbatch -p "$PARTITION" cluster_run_E${E}.pbs
-done
-rm cluster_run_E*
\ No newline at end of file
+# one job array for the whole sweep: PER_TASK energies share one task, CPUS cores each
+python3 ../campaign/slurm_array.py \
+    --template templates/cluster_run_template.pbs \
+    --name "${PROJ_NAME}" \
+    --energies "${E_LIST[@]}" \
+    --per-task "${PER_TASK}" \
+    --cpus-per-energy "${CPUS}" \
+    --mem-per-energy "${MEM}" \
+    --time "${TIME}" \
+    --partition "${PARTITION}" \
+    ${MAX_PARALLEL:+--max-parallel "${MAX_PARALLEL}"} \
+    ${RUNTIME_MODEL} \
+    --resume fluka \
+    --set "N_PRIMARIES=${NPRIM}" \
+    --set "ANG_BINS=${ANG_BINS}" \
+    --set "E_BIN_WIDTH=${E_BIN_WIDTH}" \
+    --set "SPECIES_N=${SPECIES_N[*]}" \
+    --set "PROJ_NAME=${PROJ_NAME}" \
+    --set "BEAM_TYPE=${BEAM_TYPE}" \
+    --set "TARG_TYPE=${TARG_TYPE}" \
+    --set "CYCLES=${CYCLES}" \
+    --set "FORT_MERGE=${FORT_MERGE}" \
+    --set "STAGE=${STAGE}" \
+    --set "DECK_CACHE=${DECK_CACHE}" \
+    --set "DECK_CACHE_GB=${DECK_CACHE_GB}" \
+    --set "ADAPTIVE_TARGET=${ADAPTIVE_TARGET}" \
+    --set "ADAPTIVE_BATCH=${ADAPTIVE_BATCH}" \
+    --set "ADAPTIVE_DETECTORS=${ADAPTIVE_DETECTORS}" \
+    --set "ENVIROMENT=${ENVIROMENT}" \
+    --set "TARG_THICKNESS=${TARG_THICKNESS}" \
+    --set "TARG_WIDTH=${TARG_WIDTH}" \
+    --set "E_BIN_MIN=${E_BIN_MIN}" \
+    --set "E_LIST=${E_LIST}" \
+    --set "MAX_E_SCORE=${MAX_E_SCORE}"
@@ -8,12 +8,25 @@ shopt -s nullglob
 # Respect existing QUIET; default to quiet if not set
 #QUIET=${QUIET:-0}
 
+# Max concurrent merge tools; defaults to the cores Slurm gave us
+JOBS=${JOBS:-${SLURM_CPUS_PER_TASK:-$(nproc)}}
+# 0 = stop at the binary .bnn for USRBIN (parquet_creater_usrbin.py reads it directly)
+USBREA=${USBREA:-1}
+
 #read -r -a Es <<< "$2" # List of proton beam energies
 E="$2"
 echo "Primary E recieved by compiler: $E"
 read -r -a sp <<< "$1" # List of secondary species
 sp_naming_tags=( "${sp[@]}" )
 
+#E_tag=${E//./}        # remove decimal point
+E_tag=$(
+  awk -v E="$E" 'BEGIN {
+    ev = E * 1e9;                # GeV -> eV
+    if (ev < 0) ev = -ev;        # optional: remove if you want signed
+    printf "%010.0f", ev         # integer, zero-padded to 10 chars
+  }'
+)
 
 # Collect unique fort numbers robustly, even if filenames have extra suffixes (e.g., *_fort.102.dat)
 echo "#=== Running compiler ===#"
@@ -26,33 +39,16 @@ mapfile -t FORT_NUMS < <(
 
 
 ((${#FORT_NUMS[@]})) || { echo "No *_fort.# files found"; exit 1; }
-echo " Forts found: ${#FORT_NUMS[@]}"
+echo " Forts found: ${#FORT_NUMS[@]} (jobs: ${JOBS})"
 
-COMP=usysuw
 COMP2=usbrea
 
-for ((i=0; i<${#FORT_NUMS[@]}; i++)); do
-  N=${FORT_NUMS[i]}
-  if (( N >= 100 && N < 120 )); then COMP="usysuw" #USRYIELD
-  elif (( N >= 80 && N < 100 )); then COMP="ustsuw" #USRBDX
-  elif (( N >= 60 && N < 80 )); then COMP="usbsuw" #USRBIN
-  else                                COMP="usysuw"
-  fi
-  #E_tag=${E//./}        # remove decimal point
-  E_tag=$(
-    awk -v E="$E" 'BEGIN {
-      ev = E * 1e9;                # GeV -> eV
-      if (ev < 0) ev = -ev;        # optional: remove if you want signed
-      printf "%010.0f", ev         # integer, zero-padded to 10 chars
-    }'
-  )
-
-  j=$(( i % ${#sp_naming_tags[@]} ))
-  sp_name_tag="${sp_naming_tags[j],,}"
-
-  in_files=( deck_*_fort."${N}" )
-  out_file=compiled_"${sp_name_tag}"_"${E_tag}"_"${N}".out
-  out_file2=compiled_"${sp_name_tag}"_"${E_tag}"_"${N}"
+# compile_fort <fort number> <merge tool> <species tag>
+compile_fort() {
+  local N=$1 COMP=$2 sp_name_tag=$3
+  local in_files=( deck_*_fort."${N}" )
+  local out_file=compiled_"${sp_name_tag}"_"${E_tag}"_"${N}".out
+  local out_file2=compiled_"${sp_name_tag}"_"${E_tag}"_"${N}"
   if [[ "$COMP" == "usbsuw" ]]; then out_file="${out_file2}.bnn"
   fi
   echo "${COMP}: fort.${N}: (${#in_files[@]} files) -> ${out_file}"
@@ -62,13 +58,51 @@ for ((i=0; i<${#FORT_NUMS[@]}; i++)); do
       printf '%s\n' "${out_file2}"
       printf '\n'
   } | "${COMP}"
-  if [[ "$COMP" == "usbsuw" ]]; then
+  if [[ "$COMP" == "usbsuw" && "$USBREA" == 1 ]]; then
     echo "${COMP2}: ${out_file} -> ${out_file2}. ascii"
     {
       printf '%s\n' "${out_file2}.bnn"
       printf '%s\n' "${out_file2}.ascii"
     } | "${COMP2}"
   fi
+}
+
+for ((i=0; i<${#FORT_NUMS[@]}; i++)); do
+  N=${FORT_NUMS[i]}
+  if (( N >= 100 && N < 120 )); then COMP="usysuw" #USRYIELD
+  elif (( N >= 80 && N < 100 )); then COMP="ustsuw" #USRBDX
+  elif (( N >= 60 && N < 80 )); then COMP="usbsuw" #USRBIN
+  else                                COMP="usysuw"
+  fi
+
+  j=$(( i % ${#sp_naming_tags[@]} ))
+  sp_name_tag="${sp_naming_tags[j],,}"
+
+  # bounded pool: wait for a slot
+  while (( $(jobs -rp | wc -l) >= JOBS )); do wait -n || true; done
+
+  rm -f "compile_fort.${N}.rc"
+  (
+    set +e
+    ( set -e; compile_fort "$N" "$COMP" "$sp_name_tag" ) > "compile_fort.${N}.log" 2>&1
+    echo $? > "compile_fort.${N}.rc"
+  ) &
 done
+wait
+
+failed=()
+for N in "${FORT_NUMS[@]}"; do
+  rc=$(cat "compile_fort.${N}.rc" 2>/dev/null || echo 1)
+  if [[ "$rc" != 0 ]]; then failed+=( "$N" ); fi
+  rm -f "compile_fort.${N}.rc"
+done
+
+if ((${#failed[@]})); then
+  for N in "${failed[@]}"; do
+    echo "FAILED fort.${N} (log: compile_fort.${N}.log):"
+    tail -n 20 "compile_fort.${N}.log" || true
+  done
+  exit 1
+fi
 
 echo "Compilation done"
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# deck_cache.py
+"""
+Content-addressed cache of compiled FLUKA outputs, keyed by the rendered deck.
+
+The key is the SHA-256 of the normalized deck text (comment and blank lines
+dropped, trailing blanks stripped) plus the cycle count, the seed policy
+(``serial``: the deck's own RANDOMIZ seed, ``parallel``: a random base seed
+plus the cycle number per -M1 cycle) and the output mode, i.e. how the job
+turns the fort units into the cached files (FORT_MERGE, USBREA for the text
+merge, STAGE). PROJ_NAME never enters the deck, so identical physics set up
+under different projects shares one entry.
+
+Layout (on the same filesystem as output/, so files are hard-linked, not copied):
+    <cache>/<key>/compiled_*   <cache>/<key>/meta.json   <cache>/<key>/.last_used
+
+runner_script.py looks the deck up before running rfluka (DECK_CACHE /
+DECK_CACHE_DEST in the environment) and on a hit links the entry into the
+output directory and skips the run. The job template stores new results
+afterwards; every store evicts least-recently-used entries above the cap:
+    python3 deck_cache.py store <cache> <key> output/.../compiled_* [--cap-gb 50]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import time
+
+DEFAULT_CAP_GB = 50.0
+META_NAME = "meta.json"
+STAMP_NAME = ".last_used"
+HIT_MARKER = "deck_cache.hit"
+KEY_FILE = "deck_cache.key"
+
+
+def normalize_deck(deck_text):
+    """Deck text without comments, blank lines and trailing blanks."""
+    lines = []
+    for line in deck_text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith(("*", "!")):
+            continue
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def output_mode(env=None):
+    """Merge and staging settings of the job template that decide which files get cached."""
+    env = os.environ if env is None else env
+    merge = env.get("FORT_MERGE", "")
+    if merge != "numpy":
+        merge += f",usbrea={env.get('USBREA') or '1'}"  # compiler.sh default
+    return f"merge={merge};stage={env.get('STAGE', '')}"
+
+
+def deck_key(deck_text, cycles, seed_policy, outputs=""):
+    h = hashlib.sha256(normalize_deck(deck_text).encode())
+    h.update(f"\0cycles={int(cycles)}\0seeds={seed_policy}\0outputs={outputs}".encode())
+    return h.hexdigest()
+
+
+def _link(src, dst):
+    """Hard link src to dst (replacing dst); copy across filesystems."""
+    dst = pathlib.Path(dst)
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _touch(entry):
+    (entry / STAMP_NAME).touch()
+
+
+def lookup(cache_root, key):
+    """The entry directory for key (marked as used), or None."""
+    entry = pathlib.Path(cache_root) / key
+    if not (entry / META_NAME).is_file():
+        return None
+    _touch(entry)
+    return entry
+
+
+def link_into(entry, dest):
+    """Hard-link every cached output of entry into dest; returns the file names."""
+    dest = pathlib.Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    names = json.loads((entry / META_NAME).read_text())["files"]
+    for name in names:
+        _link(entry / name, dest / name)
+    return names
+
+
+def store(cache_root, key, files, meta=None, cap_bytes=None):
+    """
+    Add files under key (atomically: staged in a dot-dir, then renamed) and
+    evict down to cap_bytes. An existing entry is kept as is.
+    """
+    cache_root = pathlib.Path(cache_root)
+    cache_root.mkdir(parents=True, exist_ok=True)
+    entry = cache_root / key
+    if (entry / META_NAME).is_file():
+        _touch(entry)
+        return entry
+
+    tmp = cache_root / f".{key}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    names = []
+    for f in files:
+        f = pathlib.Path(f)
+        _link(f, tmp / f.name)
+        names.append(f.name)
+    doc = dict(meta or {}, key=key, files=sorted(names), stored=time.strftime("%Y-%m-%d %H:%M:%S"))
+    (tmp / META_NAME).write_text(json.dumps(doc, indent=1))
+    _touch(tmp)
+    try:
+        tmp.rename(entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # another job stored the same key first
+    if cap_bytes is not None:
+        evict(cache_root, cap_bytes)
+    return entry
+
+
+def entry_size(entry):
+    return sum(p.stat().st_size for p in entry.iterdir() if p.is_file())
+
+
+def evict(cache_root, cap_bytes):
+    """Remove least-recently-used entries until the cache is at most cap_bytes; returns removed keys."""
+    entries = []
+    for e in pathlib.Path(cache_root).iterdir():
+        if e.is_dir() and not e.name.startswith(".") and (e / META_NAME).is_file():
+            stamp = e / STAMP_NAME
+            used = stamp.stat().st_mtime if stamp.exists() else e.stat().st_mtime
+            entries.append((used, e, entry_size(e)))
+    entries.sort(key=lambda t: t[0])
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, e, size in entries:
+        if total <= cap_bytes:
+            break
+        shutil.rmtree(e, ignore_errors=True)
+        total -= size
+        removed.append(e.name)
+    return removed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Content-addressed cache of compiled FLUKA outputs.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("store", help="Store compiled outputs under a deck key")
+    s.add_argument("cache", help="Cache directory")
+    s.add_argument("key", help="Deck key (deck_cache.key written by runner_script.py)")
+    s.add_argument("files", nargs="+", help="compiled_* outputs of the run")
+    s.add_argument("--cap-gb", type=float, default=DEFAULT_CAP_GB, help="Cache size cap (LRU eviction)")
+    e = sub.add_parser("evict", help="Evict LRU entries down to the cap")
+    e.add_argument("cache")
+    e.add_argument("--cap-gb", type=float, default=DEFAULT_CAP_GB)
+    args = ap.parse_args()
+
+    cap = int(args.cap_gb * 1024 ** 3)
+    if args.cmd == "store":
+        entry = store(args.cache, args.key, args.files, cap_bytes=cap)
+        print(f"[OK] cached {len(args.files)} files under {entry}")
+    else:
+        removed = evict(args.cache, cap)
+        print(f"[OK] evicted {len(removed)} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,181 @@
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+#!/usr/bin/env python3
+# dose_avg_let.py
+"""
+Per-species LET and dose-averaged LET from usrbin (dose) and usrtrack (track
+length) scoring, for every primary energy of a campaign in one pass.
+
+Per (secondary, primary_energy):
+    E_dep = mean dose over the mesh bins * V      [MeV]
+    L     = sum of the track yld * V              [cm]
+    S     = E_dep / L                             [MeV/cm]
+    LET   = S / rho                               [MeV cm^2/g]
+(rho: --rho, by default 1.4 g/cm^3)
+and per primary energy the dose-weighted LET over species,
+    LET_d = sum_sp E_dep * LET / sum_sp E_dep,
+broadcast onto every species row next to its dose fraction.
+
+    python dose_avg_let.py --track apo16_usrtrk.parquet --bin apo16_usrbin.parquet --out apo16_let.parquet
+
+--spectrum uses the USRTRACK energy spectra instead (no usrbin needed):
+every E bin gets its fluence phi = yld * dE and the mean stopping power
+L over the bin from a cached table (stopping_power.py), and
+    LET_F = sum phi L / sum phi,      LET_D = sum phi L^2 / sum phi L
+per (secondary, primary_energy), and over all charged species per primary
+energy (LET_F_all, LET_D_all). Species without a table (neutrons, photons)
+are left out. The keV/um columns use --rho, by default the density of
+--material.
+
+    python dose_avg_let.py --spectrum --track apo16_usrtrk.parquet --material water --out apo16_let_spec.parquet
+"""
 import argparse
+import time
 
-ap = argparse.ArgumentParser(description="Calculate dose avg LET from usrbin and usrtrack scoring.")
-ap.add_argument("--track", required=True, help="Path to usrtrack parquet")
-ap.add_argument("--bin", required=True, help="Path to usrbin parquet")
-ap.add_argument("--V", type=float, default=(0.5E-3)**2*1E2, help="detector volume (cm^3) if you want to use it")
-ap.add_argument("--pe", type=float, required=True, help="Target primary_energy value (must match parquet units)")
-ap.add_argument("--pe-tol", type=float, default=0.0, help="Absolute tolerance for matching primary_energy (0 = exact)")
-args = ap.parse_args()
-
-track_path = args.track
-bin_path = args.bin
-PE_targ = args.pe
-PE_tol = args.pe_tol
-
-# Your current hardcoded detector setup (kept as-is)
-#det_vol = (0.5E-3)**2 * 1e2   # <- your existing value
-det_vol = args.V
-det_rho = 1.4
-
-track_pd = pd.read_parquet(track_path)
-bin_pd = pd.read_parquet(bin_path)
-
-def filter_primary_energy(df: pd.DataFrame, pe: float, tol: float) -> pd.DataFrame:
-    # If primary_energy is an index level (your case), use IndexSlice
-    if isinstance(df.index, pd.MultiIndex) and "primary_energy" in df.index.names:
-        pe_vals = df.index.get_level_values("primary_energy").astype(float)
-        if tol > 0:
-            mask = np.abs(pe_vals - pe) <= tol
-        else:
-            mask = pe_vals == pe
-        return df[mask]
-
-    # Else if it's a column
-    if "primary_energy" in df.columns:
-        pe_vals = pd.to_numeric(df["primary_energy"], errors="coerce").astype(float)
-        if tol > 0:
-            return df[np.abs(pe_vals - pe) <= tol]
-        return df[pe_vals == pe]
-
-    raise ValueError("primary_energy not found as index level or column")
-
-# Filter both inputs to the chosen primary energy
-track_pd = filter_primary_energy(track_pd, PE_targ, PE_tol)
-bin_pd   = filter_primary_energy(bin_pd,   PE_targ, PE_tol)
-
-if track_pd.empty or bin_pd.empty:
-    raise ValueError(f"No rows left after filtering to primary_energy={PE_targ} (tol={PE_tol}).")
-
-# Grouping (these are index levels in your parquet)
-g_bin   = dict(tuple(bin_pd.groupby(level=["secondary", "primary_energy"])))
-g_track = dict(tuple(track_pd.groupby(level=["secondary", "primary_energy"])))
-
-S_per_sec = {}
-
-# Single track average, but now only for the selected primary energy
-for k in (g_bin.keys() & g_track.keys()):
-    sp, pe = k
-
-    dose_val = float(g_bin[k]["dose"].iloc[0])  # dose is a column in bin_pd
-    E_dep = dose_val * det_vol                  # (MeV * cm^-3) * cm^3 -> MeV
-
-    track_sum = float(np.sum(g_track[k]["yld"]))  # yld is a column in track_pd
-    L_p = track_sum * det_vol                      # cm
-
-    if L_p != 0.0:
-        S_p = E_dep / L_p           # MeV/cm
-        LET_p = S_p / det_rho # MeV * cm^2/g
-    else:
-        S_p, S_LET, LET_p = 0.0, 0.0, 0.0
+import numpy as np
+import pandas as pd
 
-    print(f"{pe}MeV,{sp}: E_dep:{E_dep:<10g}MeV, L_p:{L_p:<10g}cm, LET_p:{LET_p:<10g}")
-    S_per_sec[sp] = S_p
+import stopping_power
+from yield_dataset import read_yields
+
+KEYS = ["secondary", "primary_energy"]
+DET_RHO = 1.4  # g/cm^3, usrbin-mode detector density unless --rho is given
+
+
+def species_let(track, bins, det_vol, det_rho):
+    """One row per (secondary, primary_energy) scored in both tables: E_dep, L, S, LET, dose_fraction, LET_d."""
+    # a 1x1x1 usrbin has one bin, so the mesh mean is its dose
+    dose = bins["dose"].groupby(level=KEYS, sort=False).mean()
+    track_sum = track["yld"].groupby(level=KEYS, sort=False).sum()
+    out = pd.concat({"E_dep": dose * det_vol, "L": track_sum * det_vol}, axis=1, join="inner").sort_index()
+
+    E_dep, L = out["E_dep"].to_numpy(), out["L"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        S = np.where(L != 0.0, E_dep / L, 0.0)
+    out["S"] = S
+    out["LET"] = S / det_rho
+
+    # dose weighting within each primary energy
+    pe_codes, _ = pd.factorize(out.index.get_level_values("primary_energy"))
+    e_tot = np.bincount(pe_codes, weights=E_dep)
+    let_sum = np.bincount(pe_codes, weights=E_dep * out["LET"].to_numpy())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["dose_fraction"] = E_dep / e_tot[pe_codes]
+        out["LET_d"] = (let_sum / e_tot)[pe_codes]
+    return out
+
+
+def spectrum_let(track, material, cache=stopping_power.DEFAULT_CACHE, rho=None):
+    """
+    Fluence- and dose-weighted LET [MeV cm^2/g] from the track spectra, one row
+    per (secondary, primary_energy) of species with a stopping-power table.
+    rho (g/cm^3) converts to keV/um; default: the density of material.
+    """
+    flat = track.reset_index()
+    species, codes = np.unique(flat["secondary"].astype(str).to_numpy(), return_inverse=True)
+    tables, known = [], np.full(len(species), -1)
+    for i, sp in enumerate(species):
+        try:
+            tables.append(stopping_power.table(sp, material, cache))
+        except KeyError:
+            continue
+        known[i] = len(tables) - 1
+    skipped = [sp for sp, k in zip(species, known) if k < 0]
+    if skipped:
+        print(f"[INFO] no stopping power, left out: {', '.join(skipped)}")
+    if not tables:
+        raise ValueError(f"no species with a stopping-power table in {material!r}")
+
+    E_low, E_high = flat["E_low"].to_numpy(np.float64), flat["E_high"].to_numpy(np.float64)
+    rows = known[codes.reshape(-1)] >= 0
+    L = stopping_power.bin_mean(tables, known[codes.reshape(-1)], E_low, E_high)
+    phi = np.where(rows, np.nan_to_num(flat["yld"].to_numpy(np.float64)) * (E_high - E_low), 0.0)
+    L = np.nan_to_num(L)
+
+    terms = pd.DataFrame({"secondary": flat["secondary"], "primary_energy": flat["primary_energy"],
+                          "phi": phi, "phiL": phi * L, "phiL2": phi * L * L})[rows]
+    out = terms.groupby(KEYS, sort=True).sum()
+    per_pe = out.groupby(level="primary_energy").sum()
+    if rho is None:
+        rho = stopping_power.MATERIALS.get(material, (None, None, np.nan))[2]
+    pe_idx = out.index.get_level_values("primary_energy")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["LET_F"] = out["phiL"] / out["phi"]
+        out["LET_D"] = out["phiL2"] / out["phiL"]
+        out["dose_fraction"] = out["phiL"] / per_pe["phiL"].reindex(pe_idx).to_numpy()
+        out["LET_F_all"] = (per_pe["phiL"] / per_pe["phi"]).reindex(pe_idx).to_numpy()
+        out["LET_D_all"] = (per_pe["phiL2"] / per_pe["phiL"]).reindex(pe_idx).to_numpy()
+    # MeV cm^2/g * g/cm^3 = MeV/cm = 0.1 keV/um
+    for c in ("LET_F", "LET_D", "LET_F_all", "LET_D_all"):
+        out[f"{c}_keV_um"] = out[c] * rho * 0.1
+    return out.rename(columns={"phi": "fluence"}).drop(columns=["phiL", "phiL2"])
+
+
+def write_table(df, path):
+    if path.endswith(".csv"):
+        df.to_csv(path)
+    else:
+        df.to_parquet(path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Calculate dose avg LET from usrbin and usrtrack scoring.")
+    ap.add_argument("--track", required=True, help="Path to usrtrack parquet")
+    ap.add_argument("--bin", default=None, help="Path to usrbin parquet (not needed with --spectrum)")
+    ap.add_argument("--V", type=float, default=(0.5E-3)**2*1E2, help="detector volume (cm^3) if you want to use it")
+    ap.add_argument("--rho", type=float, default=None,
+                    help=f"detector density (g/cm^3); default: {DET_RHO}, with --spectrum that of --material")
+    ap.add_argument("--pe", type=float, nargs="*", default=None,
+                    help="Only these primary energies (must match parquet units); default: all")
+    ap.add_argument("--pe-tol", type=float, default=0.0, help="Absolute tolerance for matching primary_energy (0 = exact)")
+    ap.add_argument("--out", default=None, help="Write the table here (.parquet or .csv)")
+    ap.add_argument("--spectrum", action="store_true",
+                    help="Fluence/dose-weighted LET from the usrtrack energy spectra and stopping-power tables")
+    ap.add_argument("--material", default="water",
+                    help=f"detector material, sets the default --rho and the --spectrum stopping medium "
+                         f"({', '.join(stopping_power.MATERIALS)})")
+    ap.add_argument("--sp-cache", default=stopping_power.DEFAULT_CACHE,
+                    help="--spectrum: stopping-power table cache (also picks up <species>_<material>.csv)")
+    args = ap.parse_args()
+    if not args.spectrum and args.bin is None:
+        ap.error("--bin is required unless --spectrum is given")
+    rho = args.rho
+    if rho is None and args.spectrum:
+        if args.material not in stopping_power.MATERIALS:
+            ap.error(f"no density known for --material {args.material!r}: give --rho")
+        rho = stopping_power.MATERIALS[args.material][2]
+
+    t0 = time.perf_counter()
+    if args.spectrum:
+        track = read_yields(args.track, primary_energy=args.pe, tol=args.pe_tol, columns=["yld"])
+        if track.empty:
+            raise ValueError(f"No rows left after filtering to primary_energy={args.pe} (tol={args.pe_tol}).")
+        out = spectrum_let(track, args.material, args.sp_cache, rho)
+        print(f"[INFO] {len(track)} spectrum bins -> {len(out)} (secondary, primary_energy) rows "
+              f"in {time.perf_counter() - t0:.2f} s")
+        with pd.option_context("display.max_rows", None, "display.width", 160):
+            print(out[["fluence", "LET_F", "LET_D", "dose_fraction"]].to_string(float_format="{:<10g}".format))
+            print(out.groupby(level="primary_energy")[["LET_F_all", "LET_D_all"]].first().to_string())
+        if args.out:
+            write_table(out, args.out)
+            print(f"[OK] wrote {args.out}")
+        return
+
+    # only the needed columns (and the selected primary energies) are read
+    track = read_yields(args.track, primary_energy=args.pe, tol=args.pe_tol, columns=["yld"])
+    bins = read_yields(args.bin, primary_energy=args.pe, tol=args.pe_tol, columns=["dose"])
+    if track.empty or bins.empty:
+        raise ValueError(f"No rows left after filtering to primary_energy={args.pe} (tol={args.pe_tol}).")
+
+    out = species_let(track, bins, args.V, DET_RHO if rho is None else rho)
+    print(f"[INFO] {len(out)} (secondary, primary_energy) rows in {time.perf_counter() - t0:.2f} s")
+
+    with pd.option_context("display.max_rows", None, "display.width", 160):
+        print(out[["E_dep", "L", "LET", "dose_fraction"]].to_string(float_format="{:<10g}".format))
+        print(out.groupby(level="primary_energy")["LET_d"].first().to_frame().to_string())
+
+    if args.out:
+        write_table(out, args.out)
+        print(f"[OK] wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
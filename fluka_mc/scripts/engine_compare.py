@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# engine_compare.py
+"""
+FLUKA vs SHIELD-HIT yield comparison on a common bin index.
+
+Both yield tables (``<dir>_usryld.parquet`` or any layout read_yields
+understands, and ``po16_shieldhit.parquet``) are mapped onto one
+(species, primary_energy, angle_bin, energy_bin) grid by conservative
+rebinning: every target bin gets the overlap-weighted mean of the source
+densities, with overlaps measured in solid angle (1 - cos theta) and in
+energy. Per (species, primary energy) this is three small matrix products
+(A^T D B with per-axis overlap matrices), so a whole campaign rebins in one
+pass without per-bin Python loops. Source bins need not tile the target:
+``coverage`` is the covered fraction of each target bin.
+
+Overlapping source bins (FLUKA angle detectors are +-5 deg at a finer
+spacing) share the part of a target bin they both cover: each piece of the
+target bin is split equally among the source bins covering it, so the
+weights of a target bin never add up to more than its size and coverage
+stays <= 1. Overlapping angle bins score the same particles, so their
+errors are taken as fully correlated in ``err`` (bins that do not overlap,
+and different E bins, as independent).
+
+Species names are unified (FLUKA's REMAP and make_parquet.py's differ), the
+relative errors are brought to one convention (FLUKA: percent, SHIELD-HIT:
+fraction) and the joined table gets the FLUKA/SHIELD-HIT ratio and the pull
+(difference in combined standard deviations):
+    python engine_compare.py --fluka apo16_usryld.parquet \\
+        --shieldhit ../parquets/po16_shieldhit.parquet --out apo16_vs_sh.parquet
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from yield_dataset import read_yields
+
+# canonical species names; anything else is kept (lower case)
+SPECIES_ALIASES = {
+    "4-helium": "alpha", "he4": "alpha",
+    "3-helium": "helium3", "he3": "helium3",
+    "pro": "proton", "neu": "neutron", "deu": "deuteron", "tri": "triton", "pho": "photon",
+}
+# rel_err -> fractional relative error
+REL_ERR_SCALE = {"fluka": 0.01, "shieldhit": 1.0}
+ENGINES = ("fluka", "shieldhit")
+KEY_COLS = ["species", "primary_energy", "angle_bin", "energy_bin"]
+
+
+def engine_table(df, engine):
+    """Flat columns of one engine's yield frame, canonical species, absolute errors."""
+    flat = df.reset_index()
+    species = flat["secondary"].astype(str).str.lower()
+    yld = flat["yld"].to_numpy(np.float64)
+    return pd.DataFrame({
+        "species": species.map(SPECIES_ALIASES).fillna(species).to_numpy(),
+        # keys of both engines in MeV; rounding absorbs float noise from the name parsing
+        "primary_energy": flat["primary_energy"].to_numpy(np.float64).round(6),
+        "a_lo": flat["angle_lower_deg"].to_numpy(np.float64),
+        "a_hi": flat["angle_upper_deg"].to_numpy(np.float64),
+        "e_lo": flat["E_low"].to_numpy(np.float64),
+        "e_hi": flat["E_high"].to_numpy(np.float64),
+        "yld": yld,
+        "err": np.abs(yld) * flat["rel_err"].to_numpy(np.float64) * REL_ERR_SCALE[engine],
+    })
+
+
+def solid(theta_deg):
+    """Cumulative solid-angle coordinate (per 2 pi) of a polar angle."""
+    return 1.0 - np.cos(np.radians(theta_deg))
+
+
+def overlap(lo, hi, edges):
+    """
+    (n_src, n_target) weights of intervals [lo, hi] in the bins of edges: the
+    overlap lengths, with a stretch covered by k intervals counted 1/k to each.
+    Equal to the plain overlap lengths when the intervals do not overlap.
+    """
+    cuts = np.unique(np.concatenate([lo, hi, edges]))
+    mid = 0.5 * (cuts[1:] + cuts[:-1])
+    cover = (lo[:, None] <= mid[None, :]) & (mid[None, :] < hi[:, None])  # (n_src, n_piece)
+    n = cover.sum(axis=0)
+    share = cover * (np.diff(cuts) / np.maximum(n, 1))[None, :]
+    target = np.searchsorted(edges, mid, side="right") - 1
+    inside = (target >= 0) & (target < len(edges) - 1)
+    P = np.zeros((len(mid), len(edges) - 1))
+    P[np.flatnonzero(inside), target[inside]] = 1.0
+    return share @ P
+
+
+def overlapping(lo, hi):
+    """(n, n) 1 where two intervals overlap (and on the diagonal), else 0."""
+    return ((lo[:, None] < hi[None, :]) & (lo[None, :] < hi[:, None])).astype(np.float64)
+
+
+def split_groups(t):
+    """{(species, primary_energy): {column: array}} from one sort, without a pandas groupby."""
+    t = t.sort_values(["species", "primary_energy"], kind="stable")
+    sp, pe = t["species"].to_numpy(), t["primary_energy"].to_numpy()
+    cut = np.flatnonzero((sp[1:] != sp[:-1]) | (pe[1:] != pe[:-1])) + 1
+    cols = {c: t[c].to_numpy() for c in ("a_lo", "a_hi", "e_lo", "e_hi", "yld", "err")}
+    return {(sp[i], pe[i]): {c: v[i:j] for c, v in cols.items()}
+            for i, j in zip(np.r_[0, cut], np.r_[cut, len(t)])}
+
+
+def _intervals(lo, hi):
+    """Unique [lo, hi] intervals (sorted) and the interval index of every row."""
+    u, inv = np.unique(lo + 1j * hi, return_inverse=True)  # complex: lexicographic (lo, hi)
+    return u.real, u.imag, inv.reshape(-1)
+
+
+def rebin(g, a_edges, e_edges):
+    """
+    Conservative rebin of one (species, primary energy) group onto the
+    a_edges x e_edges grid. Returns (value, err, coverage), each (n_angle, n_E).
+    """
+    a_lo, a_hi, ia = _intervals(g["a_lo"], g["a_hi"])
+    e_lo, e_hi, ie = _intervals(g["e_lo"], g["e_hi"])
+    yld, err = g["yld"], g["err"]
+    ok = np.isfinite(yld)
+
+    D = np.zeros((len(a_lo), len(e_lo)))
+    V = np.zeros_like(D)
+    M = np.zeros_like(D)
+    D[ia[ok], ie[ok]] = yld[ok]
+    V[ia[ok], ie[ok]] = np.nan_to_num(err[ok]) ** 2
+    M[ia[ok], ie[ok]] = 1.0
+
+    A = overlap(solid(a_lo), solid(a_hi), solid(a_edges))  # (n_a, n_A)
+    B = overlap(e_lo, e_hi, e_edges)                        # (n_e, n_E)
+    W = A.T @ M @ B
+    # per target angle bin, sum_ab w_a w_b rho_ab s_a s_b over source angles, rho = 1 if they overlap
+    X = A.T[:, :, None] * np.sqrt(V)[None, :, :]            # (n_A, n_a, n_e)
+    corr = np.einsum("Tae,ab,Tbe->Te", X, overlapping(a_lo, a_hi), X)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = (A.T @ D @ B) / W
+        sigma = np.sqrt(corr @ (B ** 2)) / W
+    coverage = W / np.outer(np.diff(solid(a_edges)), np.diff(e_edges))
+    return value, sigma, coverage
+
+
+def group_edges(g, axis):
+    """Bin edges of one engine's own grid (sorted union of its lower/upper edges)."""
+    lo, hi = ("a_lo", "a_hi") if axis == "angle" else ("e_lo", "e_hi")
+    return np.unique(np.concatenate([g[lo], g[hi]]))
+
+
+def common_grid(groups, grid, angle_step, e_bins):
+    """(angle edges, E edges) for one (species, primary energy) across both engines."""
+    if grid in ENGINES:
+        return group_edges(groups[grid], "angle"), group_edges(groups[grid], "E")
+    a_edges = np.arange(0.0, 180.0 + angle_step / 2, angle_step)
+    # E range both engines cover
+    e_max = min(g["e_hi"].max() for g in groups.values())
+    e_min = max(g["e_lo"].min() for g in groups.values())
+    return a_edges, np.linspace(e_min, e_max, e_bins + 1)
+
+
+def compare(fluka, shieldhit, grid="uniform", angle_step=10.0, e_bins=20, min_coverage=0.5):
+    """
+    Joined comparison table of two engine_table frames: one row per common
+    bin of every (species, primary energy) present in both.
+    """
+    by_engine = {"fluka": split_groups(fluka), "shieldhit": split_groups(shieldhit)}
+    keys = sorted(set(by_engine["fluka"]) & set(by_engine["shieldhit"]))
+
+    parts = []
+    for species, pe in keys:
+        groups = {e: by_engine[e][(species, pe)] for e in ENGINES}
+        a_edges, e_edges = common_grid(groups, grid, angle_step, e_bins)
+        if len(a_edges) < 2 or len(e_edges) < 2 or e_edges[-1] <= e_edges[0]:
+            continue
+        ai, ei = np.meshgrid(np.arange(len(a_edges) - 1), np.arange(len(e_edges) - 1), indexing="ij")
+        cols = {
+            "species": np.full(ai.size, species, dtype=object),
+            "primary_energy": np.full(ai.size, pe),
+            "angle_bin": ai.ravel().astype(np.int32),
+            "energy_bin": ei.ravel().astype(np.int32),
+            "angle_low": a_edges[:-1][ai.ravel()],
+            "angle_high": a_edges[1:][ai.ravel()],
+            "E_low": e_edges[:-1][ei.ravel()],
+            "E_high": e_edges[1:][ei.ravel()],
+        }
+        for e in ENGINES:
+            value, sigma, cov = rebin(groups[e], a_edges, e_edges)
+            cols[f"yld_{e}"], cols[f"err_{e}"], cols[f"coverage_{e}"] = value.ravel(), sigma.ravel(), cov.ravel()
+        parts.append(cols)
+
+    if not parts:
+        return pd.DataFrame(columns=KEY_COLS)
+    out = pd.DataFrame({c: np.concatenate([p[c] for p in parts]) for c in parts[0]})
+    keep = (out["coverage_fluka"] >= min_coverage) & (out["coverage_shieldhit"] >= min_coverage)
+    out = out[keep].reset_index(drop=True)
+
+    f, s = out["yld_fluka"].to_numpy(), out["yld_shieldhit"].to_numpy()
+    sf, ss = out["err_fluka"].to_numpy(), out["err_shieldhit"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = f / s
+        out["ratio"] = np.where((f > 0) & (s > 0), ratio, np.nan)
+        out["ratio_err"] = out["ratio"] * np.sqrt((sf / f) ** 2 + (ss / s) ** 2)
+        out["pull"] = (f - s) / np.sqrt(sf ** 2 + ss ** 2)
+    return out.set_index(KEY_COLS).sort_index()
+
+
+def summary(out):
+    """Per species: number of bins, median ratio and share of |pull| < 2."""
+    flat = out.reset_index()
+    ok = flat["ratio"].notna()
+    return flat[ok].groupby("species").agg(
+        bins=("ratio", "size"),
+        median_ratio=("ratio", "median"),
+        within_2sigma=("pull", lambda p: float((p.abs() < 2).mean())),
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare FLUKA and SHIELD-HIT yields on a common grid.")
+    ap.add_argument("--fluka", required=True, help="FLUKA yield parquet (<dir>_usryld.parquet, part dir, hive or compact)")
+    ap.add_argument("--shieldhit", required=True, help="SHIELD-HIT yield parquet (po16_shieldhit.parquet)")
+    ap.add_argument("--out", default=None, help="Write the joined table here (.parquet or .csv)")
+    ap.add_argument("--grid", default="uniform", choices=["uniform", *ENGINES],
+                    help="Common grid: uniform (--angle-step x --e-bins) or one engine's own bins")
+    ap.add_argument("--angle-step", default=10.0, type=float, help="Uniform grid: angle bin width [deg]")
+    ap.add_argument("--e-bins", default=20, type=int, help="Uniform grid: energy bins over the common E range")
+    ap.add_argument("--min-coverage", default=0.5, type=float,
+                    help="Drop target bins less covered by either engine's bins")
+    ap.add_argument("--pe", nargs="*", type=float, default=None, help="Only these primary energies [MeV]")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    fluka = engine_table(read_yields(args.fluka, primary_energy=args.pe, tol=1e-6), "fluka")
+    shieldhit = engine_table(read_yields(args.shieldhit, primary_energy=args.pe, tol=1e-6), "shieldhit")
+    t1 = time.perf_counter()
+    out = compare(fluka, shieldhit, args.grid, args.angle_step, args.e_bins, args.min_coverage)
+    t2 = time.perf_counter()
+    print(f"[INFO] read {len(fluka)} + {len(shieldhit)} rows in {t1 - t0:.2f} s, "
+          f"compared {len(out)} common bins in {t2 - t1:.2f} s")
+    if out.empty:
+        raise SystemExit("[FATAL] no (species, primary energy) in common")
+    print(summary(out).to_string())
+
+    if args.out:
+        if args.out.endswith(".csv"):
+            out.to_csv(args.out)
+        else:
+            out.to_parquet(args.out)
+        print(f"[OK] wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
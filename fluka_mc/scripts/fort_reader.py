@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# fort_reader.py
+"""
+Direct NumPy reader for FLUKA unformatted USRYIELD / USRTRACK / USRBIN units.
+
+Reads the per-cycle ``deck_*NNN_fort.XX`` files straight into arrays
+(detector metadata, bin edges, per-cycle values) and merges the cycles
+itself, so ``usysuw``/``ustsuw``/``usbsuw`` and the ``_tab.lis`` / usbrea
+``.ascii`` text are not needed. Merged USRBIN ``.bnn`` files from usbsuw
+(with their STATISTICS block) are read as well.
+
+Record layouts follow the Usrxxx / Usrbin readers in flair (Data.py):
+    file header  title(80s) time(32s) weight(f) [ncase(i) [nbatch(i) ...]]
+    USRxxx: per detector header record, [low-energy neutron groups,] data record
+    USRBIN: per detector header record (86 bytes), nx*ny*nz data record
+            (x fastest); merged files end with STATISTICS + one error record
+            per detector
+Merged values follow the FLUKA merge tools: weighted mean over cycles
+(weights = primaries weight of each cycle) and relative error of the mean
+in percent.
+
+Run in a job directory after rfluka to write ``compiled_<sp>_<Etag>_<N>_tab.npz``
+(USRYIELD/USRTRACK) and ``compiled_<sp>_<Etag>_<N>_bin.npz`` (USRBIN) files
+that tab_reader.py picks up like the ``_tab.lis`` / ``.bnn`` ones:
+    python3 fort_reader.py "<SPECIES_N>" <ENERGY_GeV>
+"""
+import argparse
+import pathlib
+import re
+import struct
+
+import numpy as np
+
+# (field, struct code) of one detector header record
+USRTRACK_HEADER = [
+    ("nb", "i"), ("name", "10s"), ("type", "i"), ("dist", "i"), ("reg", "i"),
+    ("volume", "f"), ("lowneu", "i"), ("elow", "f"), ("ehigh", "f"), ("ne", "i"), ("de", "f"),
+]
+USRYIELD_HEADER = [
+    ("nb", "i"), ("name", "10s"), ("type", "i"), ("dist", "i"), ("reg1", "i"), ("reg2", "i"),
+    ("norm", "f"), ("lowneu", "i"), ("elow", "f"), ("ehigh", "f"), ("ne", "i"), ("de", "f"),
+    ("alow", "f"), ("ahigh", "f"),
+]
+HEADERS = {"usrtrack": USRTRACK_HEADER, "usryield": USRYIELD_HEADER}
+USRBIN_HEADER = [
+    ("nb", "i"), ("name", "10s"), ("type", "i"), ("score", "i"),
+    ("xlow", "f"), ("xhigh", "f"), ("nx", "i"), ("dx", "f"),
+    ("ylow", "f"), ("yhigh", "f"), ("ny", "i"), ("dy", "f"),
+    ("zlow", "f"), ("zhigh", "f"), ("nz", "i"), ("dz", "f"),
+    ("lntzer", "i"), ("bk", "f"), ("b2", "f"), ("tc", "f"),
+]
+
+# file header variants keyed by record size
+FILE_HEADERS = {
+    116: ("=80s32sf", ("title", "time", "weight")),
+    120: ("=80s32sfi", ("title", "time", "weight", "ncase")),
+    124: ("=80s32sfii", ("title", "time", "weight", "ncase", "nbatch")),
+    128: ("=80s32sfiii", ("title", "time", "weight", "ncase", "over1b", "nbatch")),
+}
+
+FORT_RX = re.compile(r"_fort\.(?P<N>\d+)$")
+# fort units of generate_usr*_cards (runner_script.py), one per species from the
+# first unit on: (kind, first unit, range of units claimed by the kind)
+UNIT_RANGES = (
+    ("usrbin", 60, range(60, 80)),
+    ("usrtrack", 81, range(80, 100)),
+    ("usryield", 101, range(100, 120)),
+)
+
+
+def _fmt(fields):
+    return "=" + "".join(code for _, code in fields)
+
+
+def _f32(x):
+    """Shortest decimal of a REAL*4 (0.02, not 0.0199999996), as the text tools print it."""
+    return float(str(np.float32(x)))
+
+
+def read_records(path):
+    """Split a Fortran sequential unformatted file (path or binary file object) into its record payloads."""
+    buf = path.read() if hasattr(path, "read") else pathlib.Path(path).read_bytes()
+    records, pos = [], 0
+    while pos + 4 <= len(buf):
+        (n,) = struct.unpack_from("=i", buf, pos)
+        end = pos + 4 + n
+        if end + 4 > len(buf) or struct.unpack_from("=i", buf, end)[0] != n:
+            raise IOError(f"{path}: bad record marker at byte {pos}")
+        records.append(buf[pos + 4:end])
+        pos = end + 4
+    return records
+
+
+def read_file_header(records, path):
+    """Decode the run header record (title, time, weight, ncase, nbatch)."""
+    if not records or len(records[0]) not in FILE_HEADERS:
+        raise IOError(f"{path}: not a FLUKA estimator file")
+    ffmt, names = FILE_HEADERS[len(records[0])]
+    header = dict(zip(names, struct.unpack(ffmt, records[0])))
+    header["title"] = header["title"].decode(errors="replace").strip()
+    header["time"] = header["time"].decode(errors="replace").strip()
+    header["ncase"] = header.get("ncase", 1) + header.pop("over1b", 0) * 1_000_000_000
+    header.setdefault("nbatch", 1)
+    return header
+
+
+def read_det_header(rec, fields):
+    det = dict(zip((f for f, _ in fields), struct.unpack(_fmt(fields), rec)))
+    det["name"] = det["name"].decode(errors="replace").strip()
+    for f, code in fields:
+        if code == "f":
+            det[f] = _f32(det[f])
+    return det
+
+
+def energy_edges(det):
+    """Bin edges of the energy-like axis (linear, or logarithmic for type < 0)."""
+    i = np.arange(det["ne"] + 1)
+    if det["type"] < 0:
+        return det["elow"] * np.exp(i * det["de"])
+    return det["elow"] + i * det["de"]
+
+
+def read_usrxxx(path, kind):
+    """
+    Read one unformatted USRTRACK/USRYIELD cycle file.
+
+    Returns (header, detectors) where every detector is a dict of its header
+    fields plus ``edges`` (E bin edges, GeV, ascending) and ``values``.
+    """
+    fields = HEADERS[kind]
+    size = struct.calcsize(_fmt(fields))
+
+    records = read_records(path)
+    header = read_file_header(records, path)
+
+    detectors, k = [], 1
+    while k < len(records):
+        rec = records[k]
+        if rec[:10] == b"STATISTICS":
+            break  # merged-file trailer; raw cycle files end before it
+        if len(rec) != size:
+            raise IOError(f"{path}: detector header of {len(rec)} bytes, expected {size}")
+        det = read_det_header(rec, fields)
+        k += 1
+
+        egroup = np.empty(0)
+        if det["lowneu"]:
+            ng = struct.unpack_from("=i", records[k])[0]
+            egroup = np.frombuffer(records[k], dtype="<f4", count=ng + 1, offset=4).astype(np.float64)
+            k += 1
+        values = np.frombuffer(records[k], dtype="<f4").astype(np.float64)
+        k += 1
+        if len(values) != det["ne"] + max(len(egroup) - 1, 0):
+            raise IOError(f"{path}: detector {det['nb']} has {len(values)} values, expected "
+                          f"{det['ne']} + {max(len(egroup) - 1, 0)} groups")
+
+        edges = energy_edges(det)
+        lo, hi = edges[:-1], edges[1:]
+        if len(egroup):
+            # low-energy neutron groups, stored high -> low
+            lo = np.concatenate([egroup[1:][::-1], lo])
+            hi = np.concatenate([egroup[:-1][::-1], hi])
+            values = np.concatenate([values[det["ne"]:][::-1], values[:det["ne"]]])
+        det["E_low"], det["E_high"], det["values"] = lo, hi, values
+        detectors.append(det)
+    return header, detectors
+
+
+def usrbin_edges(det):
+    """(x, y, z) bin edges of a USRBIN detector (region binnings: region numbers)."""
+    return tuple(
+        np.linspace(det[f"{a}low"], det[f"{a}high"], det[f"n{a}"] + 1) for a in "xyz"
+    )
+
+
+def read_usrbin(path):
+    """
+    Read one unformatted USRBIN file: a raw cycle fort unit or a usbsuw ``.bnn``.
+
+    Returns (header, detectors); every detector is a dict of its header fields
+    plus ``shape`` (nx, ny, nz) and ``values`` flattened with x fastest (Fortran
+    order, ``values.reshape(shape, order="F")`` gives the mesh). A merged
+    ``.bnn`` also carries ``rel_err`` in percent from its STATISTICS block.
+    """
+    size = struct.calcsize(_fmt(USRBIN_HEADER))
+    records = read_records(path)
+    header = read_file_header(records, path)
+
+    detectors, k = [], 1
+    while k < len(records):
+        rec = records[k]
+        if rec[:10] == b"STATISTICS":
+            k += 1
+            break
+        if len(rec) != size:
+            raise IOError(f"{path}: USRBIN header of {len(rec)} bytes, expected {size}")
+        det = read_det_header(rec, USRBIN_HEADER)
+        det["shape"] = (det["nx"], det["ny"], det["nz"])
+        values = np.frombuffer(records[k + 1], dtype="<f4").astype(np.float64)
+        if len(values) != det["nx"] * det["ny"] * det["nz"]:
+            raise IOError(f"{path}: detector {det['nb']} has {len(values)} values, "
+                          f"expected {det['nx']}x{det['ny']}x{det['nz']}")
+        det["values"] = values
+        detectors.append(det)
+        k += 2
+
+    # usbsuw statistics: one relative-error record (fraction) per detector
+    for det in detectors:
+        if k >= len(records):
+            break
+        err = np.frombuffer(records[k], dtype="<f4").astype(np.float64)
+        if len(err) == len(det["values"]):
+            det["rel_err"] = err * 100.0
+        k += 1
+    return header, detectors
+
+
+def merge_cycles(paths, kind):
+    """
+    Merge per-cycle fort files of one unit.
+
+    Returns a list of detector dicts with ``cycle_values`` (ncycle x nbin),
+    ``mean`` (weighted by each cycle's primaries weight) and ``rel_err`` in
+    percent: 100 * sqrt((<x^2>_w - <x>_w^2) / (N - 1)) / <x>_w, or 100 where
+    the mean is zero or only one cycle exists.
+    """
+    cycles = [read_usrbin(p) if kind == "usrbin" else read_usrxxx(p, kind) for p in sorted(paths)]
+    w = np.array([h["weight"] for h, _ in cycles], dtype=np.float64)
+    n = len(cycles)
+
+    merged = []
+    for d, det in enumerate(cycles[0][1]):
+        vals = np.stack([dets[d]["values"] for _, dets in cycles])
+        mean = (w[:, None] * vals).sum(axis=0) / w.sum()
+        msq = (w[:, None] * vals ** 2).sum(axis=0) / w.sum()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            err = np.sqrt(np.maximum(msq - mean ** 2, 0.0) / max(n - 1, 1)) / np.abs(mean) * 100.0
+        err = np.where((mean == 0) | (n < 2), 100.0, err)
+        out = {k: v for k, v in det.items() if k not in ("values", "rel_err")}
+        out.update(cycle_values=vals, mean=mean, rel_err=err)
+        merged.append(out)
+    return merged
+
+
+def tab_arrays(merged):
+    """Merged detectors in the dict layout returned by tab_reader.read_tab_lis."""
+    data = np.concatenate([
+        np.stack([d["E_low"], d["E_high"], d["mean"], d["rel_err"]], axis=1) for d in merged
+    ]) if merged else np.empty((0, 4))
+    return {
+        "det_n": np.array([d["nb"] for d in merged], dtype=np.int64),
+        "det_name": [d["name"] for d in merged],
+        "block": np.repeat(np.arange(len(merged)), [len(d["mean"]) for d in merged]),
+        "data": data,
+    }
+
+
+def write_tab_npz(path, merged):
+    tab = tab_arrays(merged)
+    np.savez(path, det_n=tab["det_n"], det_name=np.array(tab["det_name"]),
+             block=tab["block"], data=tab["data"])
+
+
+def load_tab_npz(path):
+    with np.load(path) as z:
+        return {"det_n": z["det_n"], "det_name": [str(s) for s in z["det_name"]],
+                "block": z["block"], "data": z["data"]}
+
+
+def write_bin_npz(path, merged):
+    """Merged USRBIN detectors of one unit; values/rel_err concatenated per detector."""
+    np.savez(
+        path,
+        det_n=np.array([d["nb"] for d in merged], dtype=np.int64),
+        det_name=np.array([d["name"] for d in merged]),
+        det_type=np.array([d["type"] for d in merged], dtype=np.int64),
+        shape=np.array([d["shape"] for d in merged], dtype=np.int64).reshape(-1, 3),
+        limits=np.array([[d[f"{a}{s}"] for a in "xyz" for s in ("low", "high")] for d in merged],
+                        dtype=np.float64).reshape(-1, 6),
+        values=np.concatenate([d["mean"] for d in merged]) if merged else np.empty(0),
+        rel_err=np.concatenate([d["rel_err"] for d in merged]) if merged else np.empty(0),
+    )
+
+
+def load_bin_npz(path):
+    """Inverse of write_bin_npz, in the detector dict layout of read_usrbin."""
+    with np.load(path) as z:
+        detectors, pos = [], 0
+        for i, n in enumerate(z["det_n"]):
+            nx, ny, nz = (int(v) for v in z["shape"][i])
+            lim = z["limits"][i]
+            det = {"nb": int(n), "name": str(z["det_name"][i]), "type": int(z["det_type"][i]),
+                   "nx": nx, "ny": ny, "nz": nz, "shape": (nx, ny, nz),
+                   "xlow": lim[0], "xhigh": lim[1], "ylow": lim[2], "yhigh": lim[3],
+                   "zlow": lim[4], "zhigh": lim[5]}
+            end = pos + nx * ny * nz
+            det["values"], det["rel_err"] = z["values"][pos:end], z["rel_err"][pos:end]
+            detectors.append(det)
+            pos = end
+    return detectors
+
+
+def unit_species(N, species):
+    """
+    (kind, species) written to fort unit N, or None outside the estimator
+    ranges. A unit in a range without a species of its own (before the first
+    unit, or past the species list) is a ValueError: the deck and SPECIES_N
+    disagree.
+    """
+    for kind, first, units in UNIT_RANGES:
+        if N in units:
+            i = N - first
+            if not 0 <= i < len(species):
+                raise ValueError(f"fort.{N}: {kind} units start at {first}, "
+                                 f"one per species, but {len(species)} species given ({' '.join(species)})")
+            return kind, species[i]
+    return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge USRYIELD/USRTRACK/USRBIN fort units without the FLUKA merge tools.")
+    ap.add_argument("species", help="Space separated species list, as given to compiler.sh")
+    ap.add_argument("energy", type=float, help="Primary energy in GeV")
+    ap.add_argument("--dir", default=".", help="Directory holding deck_*_fort.NN")
+    args = ap.parse_args()
+
+    species = args.species.split()
+    E_tag = f"{int(round(abs(args.energy) * 1e9)):010d}"
+    root = pathlib.Path(args.dir)
+
+    units = {}
+    for p in root.glob("deck_*_fort.*"):
+        m = FORT_RX.search(p.name)
+        if m:
+            units.setdefault(int(m["N"]), []).append(p)
+
+    # every unit is checked before anything is merged
+    try:
+        plan = [(N, paths, unit_species(N, species)) for N, paths in sorted(units.items())]
+    except ValueError as e:
+        raise SystemExit(f"[FATAL] {e}")
+    for N, paths, unit in plan:
+        if unit is None:
+            continue
+        kind, sp = unit[0], unit[1].lower()
+        merged = merge_cycles(paths, kind)
+        if kind == "usrbin":
+            out = root / f"compiled_{sp}_{E_tag}_{N}_bin.npz"
+            write_bin_npz(out, merged)
+        else:
+            out = root / f"compiled_{sp}_{E_tag}_{N}_tab.npz"
+            write_tab_npz(out, merged)
+        print(f"{kind}: fort.{N}: ({len(paths)} files) -> {out.name}")
+
+
+if __name__ == "__main__":
+    main()
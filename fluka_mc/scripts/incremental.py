@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# incremental.py
+"""
+Manifest-based incremental parquet rebuilds for the parquet_creater_* scripts.
+
+Instead of one monolithic parquet, the collectors can maintain a dataset
+directory with one part file per energy-point directory
+(``output/<PROJ>/<PROJ>_<E>/``) plus a ``_manifest.json`` recording path,
+size, mtime and content hash of every ingested file. On refresh only the
+directories holding new, changed or deleted files are re-parsed and their
+part rewritten, so the cost follows the new data, not the whole campaign.
+
+With ``partitioned=True`` each energy point's rows go into the hive layout of
+yield_dataset.py instead (``secondary=/primary_energy=/part-<dir>-*.parquet``).
+Either layout reads back with ``yield_dataset.read_yields(<dir>)``.
+
+Members of staged ``results_<jobid>.zip`` archives count as files of the
+energy-point directory holding the archive.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+
+from tab_reader import concat_columns, map_files, open_source, source_stat, split_member
+from yield_dataset import remove_partitioned, write_partitioned
+
+MANIFEST_NAME = "_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_hash(path, chunk=1 << 20) -> str:
+    h = hashlib.sha1()
+    with open_source(path) as fh:
+        while True:
+            buf = fh.read(chunk)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+def clear_dataset(dataset_dir) -> None:
+    """Drop all parts (either layout) and the manifest."""
+    dataset_dir = pathlib.Path(dataset_dir)
+    for p in dataset_dir.glob("part-*.parquet"):
+        p.unlink()
+    for p in dataset_dir.glob("secondary=*"):
+        shutil.rmtree(p)
+    (dataset_dir / MANIFEST_NAME).unlink(missing_ok=True)
+
+
+def load_manifest(dataset_dir, layout="flat", columns=None) -> dict:
+    p = pathlib.Path(dataset_dir) / MANIFEST_NAME
+    if not p.exists():
+        return {}
+    doc = json.loads(p.read_text())
+    if doc.get("version") != MANIFEST_VERSION or doc.get("layout", "flat") != layout:
+        print(f"[WARN] manifest ({doc.get('version')}, {doc.get('layout', 'flat')}) "
+              f"!= ({MANIFEST_VERSION}, {layout}), rebuilding")
+        clear_dataset(dataset_dir)
+        return {}
+    if columns is not None and doc.get("columns") != list(columns):
+        # parts written with another column set cannot share one dataset
+        print(f"[WARN] manifest columns {doc.get('columns')} != {list(columns)}, rebuilding")
+        clear_dataset(dataset_dir)
+        return {}
+    return doc["files"]
+
+
+def save_manifest(dataset_dir, files: dict, layout="flat", columns=None) -> None:
+    p = pathlib.Path(dataset_dir) / MANIFEST_NAME
+    tmp = p.with_suffix(".tmp")
+    doc = {"version": MANIFEST_VERSION, "layout": layout, "files": files}
+    if columns is not None:
+        doc["columns"] = list(columns)
+    tmp.write_text(json.dumps(doc, indent=1, sort_keys=True))
+    os.replace(tmp, p)
+
+
+def part_basename(group: str) -> str:
+    """Part file stem for one energy-point directory (relative to the search root)."""
+    slug = "".join(c if (c.isalnum() or c in ("-", "_", ".")) else "_" for c in group)
+    return f"part-{slug or 'root'}"
+
+
+def file_group(path, search_root) -> str:
+    """Energy-point directory of a file (or of the archive holding it), relative to search_root."""
+    archive, _ = split_member(path)
+    return os.path.dirname(os.path.relpath(archive or path, search_root))
+
+
+def plan_update(files, search_root, manifest: dict):
+    """
+    Compare the globbed files to the manifest.
+
+    Returns (dirty_groups, new_manifest). A group is the file's directory
+    relative to search_root; it is dirty if any of its files is new, changed
+    (size/mtime differ *and* the content hash differs) or gone.
+    """
+    new_manifest, dirty = {}, set()
+    for f in files:
+        rel = os.path.relpath(f, search_root)
+        size, mtime_ns = source_stat(f)
+        entry = {"size": size, "mtime_ns": mtime_ns, "group": file_group(f, search_root)}
+        old = manifest.get(rel)
+        if old and old["size"] == entry["size"] and old["mtime_ns"] == entry["mtime_ns"]:
+            entry["sha1"] = old["sha1"]
+        else:
+            entry["sha1"] = file_hash(f)
+            if not old or old["sha1"] != entry["sha1"]:
+                dirty.add(entry["group"])
+        new_manifest[rel] = entry
+
+    for rel, old in manifest.items():
+        if rel not in new_manifest:
+            dirty.add(old["group"])
+    return dirty, new_manifest
+
+
+def update_dataset(files, search_root, dataset_dir, per_file, columns, index_cols,
+                   workers=1, partitioned=False):
+    """
+    Bring dataset_dir up to date with files; only dirty groups are re-parsed.
+    Returns (n_rows_written, bad).
+    """
+    dataset_dir = pathlib.Path(dataset_dir)
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+
+    layout = "hive" if partitioned else "flat"
+    manifest = load_manifest(dataset_dir, layout, columns)
+    dirty, new_manifest = plan_update(files, search_root, manifest)
+    print(f"[INFO] incremental: {len(dirty)} of "
+          f"{len({e['group'] for e in new_manifest.values()})} energy-point dirs need (re)parsing")
+
+    by_group = {}
+    for f in files:
+        by_group.setdefault(file_group(f, search_root), []).append(f)
+
+    todo = [f for g in sorted(dirty) for f in by_group.get(g, [])]
+    chunks, bad = map_files(todo, per_file, workers=workers)
+    chunks_by_group = {}
+    for f, cols in zip(todo, chunks):
+        chunks_by_group.setdefault(file_group(f, search_root), []).append(cols)
+
+    n_rows = 0
+    for g in sorted(dirty):
+        basename = part_basename(g)
+        out = dataset_dir / f"{basename}.parquet"
+        part = concat_columns(chunks_by_group.get(g, []), columns)
+        if part.empty:
+            out.unlink(missing_ok=True)
+            remove_partitioned(dataset_dir, basename)
+            continue
+        part = part.set_index(index_cols).sort_index()
+        n_rows += len(part)
+        if partitioned:
+            write_partitioned(part, dataset_dir, basename=basename)
+            continue
+        tmp = out.with_name(f".{out.name}.tmp")  # dot-prefixed: ignored by dataset readers
+        part.to_parquet(tmp)
+        os.replace(tmp, out)
+
+    # files with parse problems (e.g. still being written) stay out of the
+    # manifest, so the next run sees them as new and re-parses their group
+    failed = {name for name, _ in bad}
+    for f in todo:
+        if pathlib.Path(f).name in failed:
+            new_manifest.pop(os.path.relpath(f, search_root), None)
+    save_manifest(dataset_dir, new_manifest, layout, columns)
+    return n_rows, bad
@@ -1,8 +1,21 @@
 #!/usr/bin/env python3
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import random as rand
+import re
+import shutil
 import sys
 import subprocess
 import math
+
+import numpy as np
+
+from deck_cache import HIT_MARKER, KEY_FILE, deck_key, link_into, lookup, output_mode
+from fort_reader import merge_cycles
+
+USRYIELD_OUT_START = 101.0  # first USRYIELD output unit, one per species
+MAX_SEED = 10_000_000  # RANDOMIZ seeds below this fit the 10-char field with a separating blank
 # ---------------- helpers ---------------- #
 
 def fluka_field(value, width=10, left=False, numeric=False, float_mode=False, decimals=3):
@@ -259,7 +272,7 @@ def generate_usrbin_cards(
         out_id += 1
     return "\n".join(lines) + "\n"
 
-def run_fluka(cycles, inp_file, es_tag,cern=True):
+def run_fluka(cycles, inp_file, es_tag,cern=True, first=0):
     log_path = Path(f"run_{es_tag}.log")
 
     # command equivalent to:
@@ -269,20 +282,21 @@ def run_fluka(cycles, inp_file, es_tag,cern=True):
             "rfluka",
             "-e", "./flukadpm",
             "-d",
-            "-N0",
+            f"-N{first}",
             f"-M{cycles}",
             inp_file,
         ]
     else:
         cmd = [
             "rfluka",
-            "-N0",
+            f"-N{first}",
             f"-M{cycles}",
             inp_file,
         ]
     #with log_path.open("w") as log:
     subprocess.run(
             cmd,
+            check=True,
             #stdout=log,
             #stderr=subprocess.STDOUT,
         )
@@ -290,6 +304,125 @@ def run_fluka(cycles, inp_file, es_tag,cern=True):
     # proc is the background process, if you need the PID:
     #return proc
 
+def set_randomiz_seed(deck_text: str, seed) -> str:
+    """Set WHAT(2) (the seed) of the RANDOMIZ card, keeping the fixed-width layout."""
+    def repl(m):
+        return m.group(1) + fluka_field(seed, 10, numeric=True, float_mode=True, decimals=1)
+    new_text, n = re.subn(r"^(RANDOMIZ  .{10}).{10}", repl, deck_text, count=1, flags=re.MULTILINE)
+    if n != 1:
+        raise ValueError("no RANDOMIZ card in deck")
+    return new_text
+
+
+def run_fluka_cycle(cycle, seed, inp_file, es_tag, cern=True):
+    """
+    Run a single rfluka cycle (-M1) in cycle_<n>/ with its own RANDOMIZ seed,
+    then move the outputs back renamed to the usual <deck>NNN_fort.XX layout.
+    """
+    cwd = Path(".").resolve()
+    inp_file = Path(inp_file)
+    stem = inp_file.stem                  # deck_E..._
+    workdir = cwd / f"cycle_{cycle}"
+    workdir.mkdir(exist_ok=True)
+    (workdir / inp_file.name).write_text(set_randomiz_seed(inp_file.read_text(), seed))
+
+    if cern:
+        cmd = ["rfluka", "-e", str(cwd / "flukadpm"), "-d", "-N0", "-M1", inp_file.name]
+    else:
+        cmd = ["rfluka", "-N0", "-M1", inp_file.name]
+    env = dict(os.environ, OMP_NUM_THREADS="1")
+    with (workdir / f"run_{es_tag}_{cycle:03d}.log").open("w") as log:
+        subprocess.run(cmd, cwd=workdir, check=True, stdout=log, stderr=subprocess.STDOUT, env=env)
+
+    # rfluka -N0 -M1 always writes cycle 001; renumber to this cycle
+    moved = 0
+    for out in workdir.iterdir():
+        if out.name.startswith(f"{stem}001"):
+            target = f"{stem}{cycle:03d}" + out.name[len(stem) + 3:]
+        elif out.suffix == ".log":
+            target = out.name
+        else:
+            continue
+        shutil.move(str(out), str(cwd / target))
+        moved += 1
+    shutil.rmtree(workdir)
+    return cycle, moved
+
+
+def draw_base_seed(last_cycle):
+    """Random base seed such that base_seed + cycle stays below MAX_SEED up to last_cycle."""
+    return rand.randrange(1, MAX_SEED - int(last_cycle))
+
+
+def run_fluka_parallel(cycles, inp_file, es_tag, workers, cern=True, first=1, base_seed=None):
+    """
+    Split the cycles first..first+cycles-1 into independent -M1 runs, at most
+    `workers` at a time. Cycle c runs with seed base_seed + c, so batches
+    sharing one base seed never repeat a seed.
+    """
+    cycles = int(cycles)
+    if base_seed is None:
+        base_seed = draw_base_seed(first + cycles - 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_fluka_cycle, c, base_seed + c, inp_file, es_tag, cern)
+            for c in range(first, first + cycles)
+        ]
+        for fut in as_completed(futures):
+            c, moved = fut.result()
+            print(f"Cycle {c} done, {moved} files gathered")
+
+
+def max_rel_err(units, floor=0.0):
+    """
+    Largest merged rel_err (percent) over the populated bins of the given
+    USRYIELD units, from the deck_*NNN_fort.<unit> cycle files written so far.
+    Bins below floor * (detector maximum) are ignored.
+    """
+    worst = 0.0
+    for unit in units:
+        paths = sorted(Path(".").glob(f"deck_*_fort.{unit}"))
+        if not paths:
+            return 100.0
+        for det in merge_cycles(paths, "usryield"):
+            mean = det["mean"]
+            populated = mean > floor * mean.max() if mean.max() > 0 else np.zeros(len(mean), bool)
+            if populated.any():
+                worst = max(worst, float(det["rel_err"][populated].max()))
+    return worst
+
+
+def run_fluka_adaptive(budget, batch, target, units, inp_file, es_tag, workers, floor=0.0, cern=True):
+    """
+    Run cycles in batches of `batch` until the max rel_err of the selected
+    units is at most `target` percent or `budget` cycles are done. Every
+    batch is logged to adaptive.tsv (cycles done, max rel_err).
+    With workers > 1 every batch (also one of a single cycle) runs as -M1
+    cycles: a -N restart would need the random-number file those leave behind.
+    All batches share one base seed, so no seed repeats across batches.
+    Returns (cycles done, converged).
+    """
+    done, worst = 0, 100.0
+    base_seed = draw_base_seed(budget)
+    with open("adaptive.tsv", "w") as log:
+        while done < budget:
+            n = min(batch, budget - done)
+            if workers > 1:
+                run_fluka_parallel(n, inp_file, es_tag, workers, cern, first=done + 1, base_seed=base_seed)
+            else:
+                run_fluka(done + n, inp_file, es_tag, cern, first=done)
+            done += n
+            if done < 2:
+                continue  # no error estimate from a single cycle
+            worst = max_rel_err(units, floor)
+            log.write(f"{done}\t{worst:.4g}\n")
+            log.flush()
+            print(f"Adaptive: {done}/{budget} cycles, max rel_err {worst:.3g} % (target {target:g} %)")
+            if worst <= target:
+                return done, True
+    return done, False
+
+
 def right_replace(text: str, placeholder: str, value) -> str:
     """Replace placeholder with value right-justified to placeholder width."""
     s = str(value)
@@ -297,7 +430,7 @@ def right_replace(text: str, placeholder: str, value) -> str:
     return text.replace(placeholder, s.rjust(width))
 
 def main():
-    if len(sys.argv) != 13:
+    if len(sys.argv) not in (13, 14):
         raise SystemExit(f"Wrong number of args")
     ENERGY = float(sys.argv[1])  # GeV
     N_PRIMARIES = str(sys.argv[2]) # number of primaries
@@ -311,6 +444,7 @@ def main():
     E_BIN_MIN = int(sys.argv[10])
     TARG_WIDTH = str(sys.argv[11])
     max_E_score = float(sys.argv[12])
+    workers = int(sys.argv[13]) if len(sys.argv) == 14 else 1  # concurrent cycles
     print("In runner script!")
     sp_ids = sp_id_str.split()
 
@@ -338,7 +472,7 @@ def main():
         n_angle_bins=ANG_BINS,
         sp_ids=sp_ids,
         det_id_start=2401.0, 
-        out_id_start=101.0,      
+        out_id_start=USRYIELD_OUT_START,      
         abmin_global=ABMIN_GLOBAL,
         abmax_global=ABMAX_GLOBAL,
     )
@@ -384,8 +518,39 @@ def main():
 
     output_path.write_text(deck_text)
 
+    # adaptive mode: CYCLES is the budget, batches stop once the USRYIELD
+    # rel_err of the selected species (default: all) is at the target
+    target = float(os.environ.get("ADAPTIVE_TARGET") or 0)
+    batch = int(os.environ.get("ADAPTIVE_BATCH") or 0) or int(cycles)
+    floor = float(os.environ.get("ADAPTIVE_FLOOR") or 0)
+    watched = os.environ.get("ADAPTIVE_DETECTORS", "").split() or sp_ids
+    units = [int(USRYIELD_OUT_START) + sp_ids.index(sp) for sp in watched]
+
+    # identical deck + cycles + seed policy + output mode already simulated? link its outputs instead
+    seed_policy = "parallel" if workers > 1 and (int(cycles) > 1 or target > 0) else "serial"
+    if target > 0:
+        seed_policy += f";adaptive={target:g}/{batch}/{floor:g}/{','.join(watched)}"
+    key = deck_key(deck_text, cycles, seed_policy, output_mode())
+    Path(KEY_FILE).write_text(key + "\n")
+    cache_dir, cache_dest = os.environ.get("DECK_CACHE"), os.environ.get("DECK_CACHE_DEST")
+    if cache_dir and cache_dest:
+        entry = lookup(cache_dir, key)
+        if entry is not None:
+            names = link_into(entry, cache_dest)
+            Path(HIT_MARKER).write_text(key + "\n")
+            print(f"Deck cache hit {key[:12]}: linked {len(names)} outputs into {cache_dest}, skipping rfluka")
+            return
+
     #print("#=== Running rFluka ===#")
-    run_fluka(cycles, output_path, ENERGY)
+    if target > 0:
+        done, converged = run_fluka_adaptive(int(cycles), batch, target, units, output_path, ENERGY,
+                                             workers, floor)
+        print(f"Adaptive: stopped after {done} of {cycles} cycles "
+              f"({'target reached' if converged else 'budget exhausted'})")
+    elif workers > 1 and int(cycles) > 1:
+        run_fluka_parallel(cycles, output_path, ENERGY, workers)
+    else:
+        run_fluka(cycles, output_path, ENERGY)
 
 if __name__ == "__main__":
     main()
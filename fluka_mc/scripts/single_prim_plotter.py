@@ -7,6 +7,8 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from yield_dataset import read_yields
+
 try:
     from matplotlib.colors import LogNorm
     _HAS_LOGNORM = True
@@ -146,22 +148,15 @@ def main():
     outdir = Path(f"{os.path.expanduser("~/repos/outputs_grendel")}/{args.out_title}")
     ensure_dir(outdir)
 
-    df = pd.read_parquet(parquet_path)
-    if df.index.names and any(n is not None for n in df.index.names):
-        df = df.reset_index()
+    # Only the selected primary energy is read (partition / row-group pushdown)
+    pe = args.primary_energy
+    df_sel = read_yields(parquet_path, primary_energy=pe, tol=args.energy_tol).reset_index()
 
     required = ["secondary", "primary_energy", "angle_lower_deg", "angle_upper_deg", "E_low", "E_high", "yld"]
-    missing = [c for c in required if c not in df.columns]
+    missing = [c for c in required if c not in df_sel.columns]
     if missing:
         raise ValueError(f"Missing columns in parquet: {missing}")
 
-    # Filter primary energy
-    pe = args.primary_energy
-    if args.energy_tol > 0:
-        df_sel = df[np.abs(df["primary_energy"].astype(float) - pe) <= args.energy_tol].copy()
-    else:
-        df_sel = df[df["primary_energy"].astype(float) == pe].copy()
-
     if df_sel.empty:
         raise ValueError(
             f"No rows after filtering primary_energy={pe}"
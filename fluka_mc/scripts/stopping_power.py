@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# stopping_power.py
+"""
+Electronic mass stopping power tables per (species, material), cached on disk.
+
+A table is S/rho [MeV cm^2/g] on a log kinetic-energy grid [MeV, total
+kinetic energy as USRTRACK scores it] together with its running integral,
+so the mean stopping power over an energy bin is two np.interp calls:
+    S_bin = (C(E_high) - C(E_low)) / (E_high - E_low)
+
+Sources, in order:
+  * ``<cache>/<species>_<material>.csv`` (columns E [MeV], S [MeV cm^2/g]),
+    e.g. exported from PSTAR/ASTAR. Use this where low energies matter.
+  * Bethe formula (no shell or density corrections) above 0.5 MeV/u,
+    continued below as S ~ sqrt(E) (velocity-proportional). Low-energy
+    stopping, and so the Bragg peak, is only approximate.
+
+Tables are written to ``<cache>/<species>_<material>.npz`` and reused while
+the source is unchanged:
+    python stopping_power.py proton water --E 1 10 100
+"""
+import argparse
+import hashlib
+import json
+import pathlib
+
+import numpy as np
+
+DEFAULT_CACHE = "cache/stopping_power"
+VERSION = 1
+
+K_BETHE = 0.307075    # MeV cm^2 / mol
+ME = 0.51099895       # MeV
+AMU = 931.49410242    # MeV
+LOW_E_PER_U = 0.5     # MeV/u, Bethe below this is not trusted
+GRID = np.geomspace(1e-4, 1e5, 1801)  # MeV
+
+# name -> (mass [MeV], charge, nucleons); names as the collectors write them
+SPECIES = {
+    "proton": (938.272088, 1, 1),
+    "aproton": (938.272088, -1, 1),
+    "deuteron": (1875.612943, 1, 2),
+    "triton": (2808.921132, 1, 3),
+    "3-helium": (2808.391607, 2, 3),
+    "alpha": (3727.379378, 2, 4),
+    "muon+": (105.6583755, 1, 0),
+    "muon-": (105.6583755, -1, 0),
+    "pion+": (139.57039, 1, 0),
+    "pion-": (139.57039, -1, 0),
+    "kaon+": (493.677, 1, 0),
+    "kaon-": (493.677, -1, 0),
+}
+# name -> (Z/A, mean excitation energy I [eV], density [g/cm^3])
+MATERIALS = {
+    "water": (0.55509, 75.0, 1.0),
+    "pmma": (0.53937, 74.0, 1.19),
+    "mylar": (0.52037, 78.7, 1.40),
+    "kapton": (0.51264, 79.6, 1.42),
+    "polyethylene": (0.57034, 57.4, 0.94),
+    "silicon": (0.49848, 173.0, 2.33),
+    "air": (0.49919, 85.7, 0.00120479),
+}
+
+
+def bethe(E, species, material):
+    """Mass stopping power [MeV cm^2/g] of a species with kinetic energy E [MeV]."""
+    M, z, A = SPECIES[species]
+    ZA, I, _ = MATERIALS[material]
+    E = np.asarray(E, dtype=np.float64)
+
+    def raw(T):
+        gamma = 1.0 + T / M
+        bg2 = gamma ** 2 - 1.0
+        b2 = bg2 / gamma ** 2
+        r = ME / M
+        t_max = 2 * ME * bg2 / (1 + 2 * gamma * r + r ** 2)
+        arg = 2 * ME * bg2 * t_max / (I * 1e-6) ** 2
+        return K_BETHE * z ** 2 * ZA / b2 * (0.5 * np.log(arg) - b2)
+
+    E_low = LOW_E_PER_U * (A if A else M / AMU)
+    S_low = raw(E_low)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(E >= E_low, raw(np.maximum(E, E_low)), S_low * np.sqrt(np.clip(E, 0.0, None) / E_low))
+
+
+def _source(species, material, cache):
+    """(E, S, description) of the table source and its cache key."""
+    csv = pathlib.Path(cache) / f"{species}_{material}.csv"
+    if csv.is_file():
+        data = np.loadtxt(csv, delimiter=",", comments="#", ndmin=2, usecols=(0, 1))
+        order = np.argsort(data[:, 0])
+        key = hashlib.sha256(csv.read_bytes()).hexdigest()
+        return data[order, 0], data[order, 1], f"csv:{csv.name}", key
+    if species not in SPECIES:
+        raise KeyError(f"no stopping power for {species!r} (known: {', '.join(SPECIES)}; or provide {csv})")
+    if material not in MATERIALS:
+        raise KeyError(f"unknown material {material!r} (known: {', '.join(MATERIALS)})")
+    desc = json.dumps({"bethe": VERSION, "species": SPECIES[species], "material": MATERIALS[material],
+                       "grid": [GRID[0], GRID[-1], len(GRID)], "low": LOW_E_PER_U})
+    return GRID, bethe(GRID, species, material), "bethe", hashlib.sha256(desc.encode()).hexdigest()
+
+
+def table(species, material, cache=DEFAULT_CACHE):
+    """
+    {"E", "S", "C"} for (species, material): E starts at 0 (S = 0 there) and C is
+    the running trapezoid integral of S over E. Built once and cached as .npz.
+    """
+    cache = pathlib.Path(cache)
+    path = cache / f"{species}_{material}.npz"
+    E, S, desc, key = _source(species, material, cache)
+    if path.is_file():
+        with np.load(path) as z:
+            if str(z["key"]) == key:
+                return {"E": z["E"], "S": z["S"], "C": z["C"]}
+
+    if E[0] > 0:
+        E, S = np.r_[0.0, E], np.r_[0.0, S]
+    C = np.r_[0.0, np.cumsum(0.5 * (S[1:] + S[:-1]) * np.diff(E))]
+    cache.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp.npz")
+    np.savez(tmp, E=E, S=S, C=C, key=np.array(key), source=np.array(desc))
+    tmp.replace(path)
+    return {"E": E, "S": S, "C": C}
+
+
+def bin_mean(tables, codes, E_low, E_high):
+    """
+    Mean stopping power over [E_low, E_high] for rows of different species in
+    one np.interp: the tables are laid end to end on an offset energy axis.
+    tables: list of table() dicts; codes: index into tables per row (-1: none -> NaN).
+    """
+    span = max(t["E"][-1] for t in tables) * 2.0 + 1.0
+    x = np.concatenate([t["E"] + i * span for i, t in enumerate(tables)])
+    c = np.concatenate([t["C"] for t in tables])
+    off = np.maximum(codes, 0) * span
+    # clamp into each table's range so np.interp never crosses into a neighbour
+    top = np.array([t["E"][-1] for t in tables])[np.maximum(codes, 0)]
+    lo = np.minimum(E_low, top)
+    hi = np.minimum(E_high, top)
+    c_lo = np.interp(lo + off, x, c)
+    c_hi = np.interp(hi + off, x, c)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        S = (c_hi - c_lo) / (hi - lo)
+    return np.where(codes >= 0, S, np.nan)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tabulate / look up cached stopping powers.")
+    ap.add_argument("species", help=f"One of {', '.join(SPECIES)} (or a <species>_<material>.csv in the cache)")
+    ap.add_argument("material", help=f"One of {', '.join(MATERIALS)}")
+    ap.add_argument("--E", type=float, nargs="*", default=[1.0, 10.0, 100.0], help="Kinetic energies [MeV]")
+    ap.add_argument("--cache", default=DEFAULT_CACHE, help="Table cache directory")
+    args = ap.parse_args()
+
+    t = table(args.species, args.material, args.cache)
+    for E, S in zip(args.E, np.interp(args.E, t["E"], t["S"])):
+        print(f"{args.species:10s} {args.material:8s} E={E:<10g}MeV  S/rho={S:<10.5g}MeV cm^2/g")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+# tab_reader.py
+"""
+Shared reader for compiled FLUKA ``compiled_*_tab.lis`` files.
+
+Each file is split into detector blocks at the ``# Detector n:`` headers and
+the numeric rows of all blocks are parsed with one ``np.loadtxt`` call (a file
+with a malformed row falls back to the old line-by-line parse, which skips
+that row and reports it). Results
+are returned as column arrays (never per-row dicts) so the parquet collectors
+can concatenate them straight into a DataFrame. ``collect`` can spread the
+files over a process pool (``--workers`` in the parquet_creater_* scripts).
+
+USRBIN units are read from the binary usbsuw ``.bnn`` (or fort_reader.py's
+``_bin.npz``) with ``usrbin_columns``, one row per mesh bin; the usbrea
+``.ascii`` scrape (``usrbin_ascii_columns``) only handles 1x1x1 bins.
+
+Outputs staged into ``results_<jobid>.zip`` archives (campaign/stage.py) are
+found as ``<archive>/<member>`` paths and read straight from the archive, with
+the path helpers of stage.py.
+
+Run as a script to benchmark against the old line-by-line parser:
+    python tab_reader.py --bench 10000
+"""
+import fnmatch
+import glob
+import gzip
+import io
+import os
+import pathlib
+import re
+import struct
+import sys
+import zipfile
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from fort_reader import load_bin_npz, load_tab_npz, read_usrbin, usrbin_edges
+
+# the staged-archive helpers live in campaign/stage.py (a copy next to this file wins)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "campaign"))
+from stage import ARCHIVE_GLOB, open_source, source_stat, split_member
+
+# compiled_<secondary>_<EEEEEEEEEE>_<N>_tab.lis (or .npz from fort_reader.py)
+# secondary may contain hyphens (e.g., 4-helium)
+FNAME_RX = re.compile(
+    r"^compiled_(?P<secondary>.+?)_(?P<E>\d{10})_(?P<N>\d+)_tab\.(?:lis|npz)$"
+)
+# compiled_<secondary>_<EEEEEEEEEE>_<N>.ascii (usbrea output)
+ASCII_FNAME_RX = re.compile(
+    r"^compiled_(?P<secondary>.+?)_(?P<E>\d{10})_(?P<N>\d+)\.ascii$"
+)
+# compiled_<secondary>_<EEEEEEEEEE>_<N>.bnn (usbsuw) or _<N>_bin.npz (fort_reader.py)
+BIN_FNAME_RX = re.compile(
+    r"^compiled_(?P<secondary>.+?)_(?P<E>\d{10})_(?P<N>\d+)(?:\.bnn|_bin\.npz)$"
+)
+
+# --- parse angle center from detector name like "4-H5Yld", "4-H50Yld", "4-H150Yld"
+ANGLE_RX = re.compile(
+    r"^(?P<species>.{3})(?P<center>\d+(?:\.\d+)?)(?P<score>[A-Za-z]{3})$"
+)
+# literal "#" first so the scan is cheap on large files
+DET_HEADER_RX = re.compile(r"#[ \t]*Detector\s+n:\s*(\d+)\s+(\S+)[^\n]*")
+
+# optional: remap secondary names
+REMAP = {
+    "4-helium": "alpha",
+    # "d": "deuteron",
+    # "t": "triton",
+    # add others if needed
+}
+
+USRYIELD_FORTS = (100, 120)  # inclusive
+USRTRACK_FORTS = (80, 99)    # inclusive
+USRBIN_FORTS = (60, 79)      # inclusive
+
+YIELD_COLUMNS = ["secondary", "primary_energy", "angle_lower_deg", "angle_upper_deg",
+                 "E_low", "E_high", "yld", "rel_err"]
+TRACK_COLUMNS = ["secondary", "primary_energy", "E_low", "E_high", "yld", "rel_err"]
+# ix/iy/iz: mesh bin indices, x/y/z: bin centers (R/phi/z for cylindrical meshes)
+BIN_COLUMNS = ["secondary", "primary_energy", "ix", "iy", "iz", "x", "y", "z", "dose", "rel_error"]
+
+
+def find_sources(search_root, pattern):
+    """
+    Files matching pattern under search_root, plus matching members of staged
+    archives as <archive>/<member>. A name already found in the same directory
+    (as a plain file or in a newer archive) is not listed again.
+    """
+    files = glob.glob(os.path.join(search_root, "**", pattern), recursive=True)
+    seen = {(os.path.dirname(f), os.path.basename(f)) for f in files}
+    staged = glob.glob(os.path.join(search_root, "**", ARCHIVE_GLOB), recursive=True)
+    for a in sorted(staged, key=os.path.getmtime, reverse=True):
+        with zipfile.ZipFile(a) as zf:
+            for n in sorted(zf.namelist()):
+                key = (os.path.dirname(a), n)
+                if fnmatch.fnmatch(n, pattern) and key not in seen:
+                    seen.add(key)
+                    files.append(f"{a}/{n}")
+    return files
+
+
+def find_compiled(search_root):
+    """
+    All compiled_*_tab.lis under search_root, plus fort_reader.py's
+    compiled_*_tab.npz where no .lis of the same unit exists.
+    """
+    lis = find_sources(search_root, "compiled_*_tab.lis")
+    have = {f[:-len(".lis")] for f in lis}
+    npz = find_sources(search_root, "compiled_*_tab.npz")
+    return lis + [f for f in npz if f[:-len(".npz")] not in have]
+
+
+def find_compiled_bins(search_root):
+    """
+    USRBIN outputs under search_root, one file per unit: the binary .bnn or
+    _bin.npz when present, the usbrea .ascii otherwise.
+    """
+    found = {}
+    for pattern, rank in (("compiled_*.ascii", 0), ("compiled_*.bnn", 1), ("compiled_*_bin.npz", 2)):
+        for f in find_sources(search_root, pattern):
+            stem = re.sub(r"(?:\.ascii|\.bnn|_bin\.npz)$", "", f)
+            if rank >= found.get(stem, (None, -1))[1]:
+                found[stem] = (f, rank)
+    return sorted(f for f, _ in found.values())
+
+
+def open_text_any(path: pathlib.Path):
+    if split_member(path)[0] is not None:
+        raw = open_source(path)
+        if raw.getvalue()[:2] == b"\x1f\x8b":
+            raw = gzip.GzipFile(fileobj=raw)
+        return io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+    with open(path, "rb") as probe:
+        if probe.read(2) == b"\x1f\x8b":
+            return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    for enc in ("utf-8", "utf-8-sig", "cp1252", "latin-1"):
+        try:
+            return open(path, "r", encoding=enc)
+        except UnicodeDecodeError:
+            continue
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def angle_center_from_det_name(det_name: str) -> float | None:
+    s = det_name.strip()
+
+    # 1) Old style: exactly 3 chars + number + 3 letter score, e.g. "4-H50Yld"
+    m = ANGLE_RX.match(s)
+    if m:
+        return float(m.group("center"))
+
+    # 2) New style: letters followed by a number, e.g. "NEUTR60", "PROT172"
+    m = re.match(r"^[A-Za-z]+(?P<center>\d+(?:\.\d+)?)$", s)
+    if m:
+        return float(m.group("center"))
+
+    # 3) Generic fallback: take the LAST number appearing anywhere in the name
+    nums = re.findall(r"\d+(?:\.\d+)?", s)
+    if nums:
+        return float(nums[-1])
+
+    return None
+
+
+def parse_compiled_name(name: str, rx=FNAME_RX):
+    """
+    Split a compiled file name into (secondary, primary_energy [MeV], fort).
+    Returns None if the name does not follow the compiler.sh pattern.
+    """
+    m = rx.match(name)
+    if not m:
+        return None
+    secondary_raw = m["secondary"].lower()
+    secondary = REMAP.get(secondary_raw, secondary_raw)
+    primary_energy = float(Decimal(int(m["E"])) / Decimal("1e6"))
+    return secondary, primary_energy, int(m["N"])
+
+
+def _read_tab_lines(text):
+    """
+    Line-by-line parse of a ``_tab.lis`` text, as the collectors did before
+    read_tab_lis: rows with fewer than 4 columns are skipped, rows that do not
+    parse are skipped and reported in ``bad``.
+    """
+    det_n, det_name, block, rows, bad = [], [], [], [], []
+    for line in text.splitlines():
+        m = DET_HEADER_RX.match(line.lstrip())
+        if m:
+            det_n.append(int(m[1]))
+            det_name.append(m[2])
+            continue
+        if not det_n or not line.strip() or line.lstrip().startswith("#"):
+            continue
+        parts = line.split()
+        if len(parts) < 4:
+            continue
+        try:
+            rows.append([float(p) for p in parts[:4]])
+        except ValueError:
+            bad.append(f"malformed numeric row under det_n={det_n[-1]}")
+            continue
+        block.append(len(det_n) - 1)
+    return {
+        "det_n": np.asarray(det_n, dtype=np.int64),
+        "det_name": det_name,
+        "block": np.asarray(block, dtype=np.int64),
+        "data": np.asarray(rows, dtype=np.float64).reshape(-1, 4),
+        "bad": bad,
+    }
+
+
+def read_tab_lis(path):
+    """
+    Parse one ``_tab.lis`` file in a single loadtxt call.
+
+    Every ``# Detector n:`` header is swapped for a NaN marker row, so block
+    boundaries fall out of the parsed array without a Python loop over lines.
+    Returns a dict with per-detector ``det_n``/``det_name``, per-row
+    ``block`` (index into those) and ``data`` (E_low, E_high, value, rel_err),
+    and ``bad``, messages for skipped malformed rows. If loadtxt rejects the
+    file, it is parsed again line by line (_read_tab_lines).
+    ``_tab.npz`` files from fort_reader.py are loaded directly.
+    """
+    if str(path).endswith(".npz"):
+        with open_source(path) as fh:
+            return dict(load_tab_npz(fh), bad=[])
+
+    with open_text_any(pathlib.Path(path)) as fh:
+        text = fh.read()
+
+    det_n, det_name = [], []
+
+    def _mark(m):
+        det_n.append(int(m[1]))
+        det_name.append(m[2])
+        return "nan nan nan nan"
+
+    first = DET_HEADER_RX.search(text)
+    marked = DET_HEADER_RX.sub(_mark, text[first.start():]) if first else ""
+    try:
+        data = np.loadtxt(io.StringIO(marked), comments="#", usecols=(0, 1, 2, 3), ndmin=2)
+    except ValueError:
+        return _read_tab_lines(text)
+
+    marker = np.isnan(data[:, 0])
+    block = np.cumsum(marker) - 1
+    return {
+        "det_n": np.asarray(det_n, dtype=np.int64),
+        "det_name": det_name,
+        "block": block[~marker],
+        "data": data[~marker],
+        "bad": [],
+    }
+
+
+def usryield_columns(path):
+    """
+    USRYIELD collector transform for one file.
+    Returns (columns, bad) where columns is a dict of arrays (or None).
+    """
+    name = pathlib.Path(path).name
+    meta = parse_compiled_name(name)
+    if meta is None:
+        return None, [(name, "filename pattern mismatch")]
+    secondary, primary_energy, fort = meta
+
+    # keep only forts 100..120 , USRYIELD forts
+    if not (USRYIELD_FORTS[0] <= fort <= USRYIELD_FORTS[1]):
+        return None, []
+
+    try:
+        tab = read_tab_lis(path)
+    except Exception as e:
+        return None, [(name, repr(e))]
+
+    bad = [(name, msg) for msg in tab["bad"]]
+    centers = np.empty(len(tab["det_name"]))
+    for i, det_name in enumerate(tab["det_name"]):
+        center = angle_center_from_det_name(det_name)
+        if center is None:
+            bad.append((name, f"could not parse angle center from '{det_name}'"))
+            center = np.nan
+        centers[i] = center
+
+    center = centers[tab["block"]]
+    keep = ~np.isnan(center)
+    center = center[keep]
+    data = tab["data"][keep]
+    if not len(data):
+        return None, bad
+
+    E_low = data[:, 0] * 1000
+    E_high = data[:, 1] * 1000
+    rel_err = data[:, 3]
+
+    zero = np.rint(rel_err) == 99
+    if secondary.lower() in ("aproton", "aprotons"):
+        zero |= E_high >= primary_energy * 0.95
+    yld = np.where(zero, 0.0, data[:, 2] * 1e-3)
+
+    n = len(data)
+    cols = {
+        "secondary": np.full(n, secondary, dtype=object),
+        "primary_energy": np.full(n, primary_energy),
+        # center ±5° edges (change if your bin half-width ≠ 5°)
+        "angle_lower_deg": np.maximum(0.0, center - 5.0),
+        "angle_upper_deg": np.minimum(180.0, center + 5.0),
+        "E_low": E_low,
+        "E_high": E_high,
+        "yld": yld,
+        "rel_err": rel_err,
+    }
+    return cols, bad
+
+
+def usrtrack_columns(path):
+    """
+    USRTRACK collector transform for one file.
+    Returns (columns, bad) where columns is a dict of arrays (or None).
+    """
+    name = pathlib.Path(path).name
+    meta = parse_compiled_name(name)
+    if meta is None:
+        return None, [(name, "filename pattern mismatch")]
+    secondary, primary_energy, fort = meta
+
+    # keep only forts 80..99 , USRTRACK forts
+    if not (USRTRACK_FORTS[0] <= fort <= USRTRACK_FORTS[1]):
+        return None, []
+
+    try:
+        tab = read_tab_lis(path)
+    except Exception as e:
+        return None, [(name, repr(e))]
+    data = tab["data"]
+    bad = [(name, msg) for msg in tab["bad"]]
+    if not len(data):
+        return None, bad
+
+    E_low = data[:, 0] * 1000
+    E_high = data[:, 1] * 1000
+    rel_err = data[:, 3]
+
+    zero = np.rint(rel_err) == 99
+    # NB: substring test kept from the original collector
+    if secondary.lower() in ("aproton"):
+        zero |= E_high >= primary_energy * 0.95
+    yld = np.where(zero, 0.0, data[:, 2] * 1e-3)
+
+    n = len(data)
+    cols = {
+        "secondary": np.full(n, secondary, dtype=object),
+        "primary_energy": np.full(n, primary_energy),
+        "E_low": E_low,
+        "E_high": E_high,
+        "yld": yld,
+        "rel_err": rel_err,
+    }
+    return cols, bad
+
+
+def usrbin_ascii_columns(path):
+    """
+    USRBIN collector transform for one usbrea ``.ascii`` file (1x1x1 region bin:
+    dose on line index 10, relative error on line index 14).
+    """
+    name = pathlib.Path(path).name
+    meta = parse_compiled_name(name, ASCII_FNAME_RX)
+    if meta is None:
+        return None, [(name, "filename pattern mismatch")]
+    secondary, primary_energy, fort = meta
+
+    if not (USRBIN_FORTS[0] <= fort <= USRBIN_FORTS[1]):
+        return None, []
+
+    try:
+        with open_text_any(pathlib.Path(path)) as fh:
+            lines = fh.readlines()
+        dose, rel_err = float(lines[10]), float(lines[14])
+    except (IndexError, ValueError) as e:
+        return None, [(name, f"malformed usbrea ascii: {e!r}")]
+
+    cols = {
+        "secondary": np.array([secondary], dtype=object),
+        "primary_energy": np.array([primary_energy]),
+        "ix": np.zeros(1, dtype=np.int32),
+        "iy": np.zeros(1, dtype=np.int32),
+        "iz": np.zeros(1, dtype=np.int32),
+        "x": np.full(1, np.nan),
+        "y": np.full(1, np.nan),
+        "z": np.full(1, np.nan),
+        "dose": np.array([dose]),
+        "rel_error": np.array([rel_err]),
+    }
+    return cols, []
+
+
+def usrbin_columns(path):
+    """
+    USRBIN collector transform for one binary ``.bnn`` / ``_bin.npz`` file:
+    every bin of every mesh in the unit, rel_error in percent.
+    Files with other extensions go to usrbin_ascii_columns.
+    """
+    name = pathlib.Path(path).name
+    if name.endswith(".ascii"):
+        return usrbin_ascii_columns(path)
+    meta = parse_compiled_name(name, BIN_FNAME_RX)
+    if meta is None:
+        return None, [(name, "filename pattern mismatch")]
+    secondary, primary_energy, fort = meta
+
+    if not (USRBIN_FORTS[0] <= fort <= USRBIN_FORTS[1]):
+        return None, []
+
+    try:
+        with open_source(path) as fh:
+            if name.endswith(".npz"):
+                detectors = load_bin_npz(fh)
+            else:
+                _, detectors = read_usrbin(fh)
+    except (IOError, ValueError, struct.error) as e:
+        return None, [(name, f"malformed USRBIN file: {e!r}")]
+
+    chunks = []
+    for det in detectors:
+        if "rel_err" not in det:
+            return None, [(name, "no STATISTICS block (raw cycle file?)")]
+        nx, ny, nz = det["shape"]
+        # values are x fastest: flat index = ix + nx * (iy + ny * iz)
+        iz, iy, ix = (a.ravel() for a in np.meshgrid(np.arange(nz), np.arange(ny), np.arange(nx), indexing="ij"))
+        centers = [0.5 * (e[:-1] + e[1:]) for e in usrbin_edges(det)]
+        n = nx * ny * nz
+        chunks.append({
+            "secondary": np.full(n, secondary, dtype=object),
+            "primary_energy": np.full(n, primary_energy),
+            "ix": ix.astype(np.int32),
+            "iy": iy.astype(np.int32),
+            "iz": iz.astype(np.int32),
+            "x": centers[0][ix],
+            "y": centers[1][iy],
+            "z": centers[2][iz],
+            "dose": np.asarray(det["values"], dtype=np.float64),
+            "rel_error": np.asarray(det["rel_err"], dtype=np.float64),
+        })
+    if not chunks:
+        return None, [(name, "no USRBIN detectors")]
+    return {c: np.concatenate([ch[c] for ch in chunks]) for c in BIN_COLUMNS}, []
+
+
+def concat_columns(chunks, columns):
+    """Concatenate per-file column dicts into one DataFrame (column order kept)."""
+    chunks = [c for c in chunks if c is not None]
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame({c: np.concatenate([ch[c] for ch in chunks]) for c in columns})
+
+
+def map_files(files, per_file, workers=1):
+    """
+    Run per_file over all files; returns (chunks, bad) with one column chunk
+    (or None) per file, in file order.
+
+    With workers > 1 the files are spread over a process pool. Each worker
+    sends back NumPy column chunks, never per-row records.
+    """
+    chunks, bad = [], []
+    if workers > 1 and len(files) > 1:
+        import multiprocessing as mp
+
+        # fork: the collector scripts have no __main__ guard to re-import under spawn
+        chunksize = max(1, len(files) // (workers * 8))
+        with mp.get_context("fork").Pool(workers) as pool:
+            for cols, b in pool.imap(per_file, files, chunksize=chunksize):
+                bad += b
+                chunks.append(cols)
+    else:
+        for f in files:
+            cols, b = per_file(f)
+            bad += b
+            chunks.append(cols)
+    return chunks, bad
+
+
+def collect(files, per_file, columns, workers=1):
+    """
+    Run per_file over all files; returns (DataFrame, bad).
+    Chunks are concatenated in file order, so the parallel result is
+    identical to the serial one.
+    """
+    chunks, bad = map_files(files, per_file, workers=workers)
+    return concat_columns(chunks, columns), bad
+
+
+def print_bad(bad, limit=15):
+    if not bad:
+        return
+    limit = len(bad) if limit is None else limit
+    print("[WARN] Issues encountered:")
+    for nm, msg in bad[:limit]:
+        print("   ", nm, "->", msg)
+    if len(bad) > limit:
+        print(f"   ... and {len(bad)-limit} more")
+
+
+# ---------------- benchmark ---------------- #
+
+def _write_synthetic_tree(root: pathlib.Path, n_files: int, n_det=45, n_e=40):
+    rng = np.random.default_rng(1)
+    species = ["proton", "neutron", "deuteron", "photon", "4-helium", "triton",
+               "pizero", "pion+", "pion-", "aproton", "muon+", "muon-"]
+    edges = np.linspace(0.0, 0.1, n_e + 1)
+    for k in range(n_files):
+        sp = species[k % len(species)]
+        E_tag = f"{(k // len(species) + 1) * 1000000:010d}"
+        d = root / f"E_{E_tag}"
+        d.mkdir(exist_ok=True)
+        out = []
+        for det in range(n_det):
+            out.append(f" # Detector n:  {det + 1:3d}  {sp[:5]}{4 * (det + 1)}   (bin/)\n")
+            out.append(f" # N. of x1 intervals {n_e:4d}\n")
+            vals = rng.random((n_e, 2))
+            for j in range(n_e):
+                out.append(f"  {edges[j]:.6E}  {edges[j + 1]:.6E}  {vals[j, 0]:.6E}  {vals[j, 1] * 100:.6E}\n")
+            out.append("\n")
+        (d / f"compiled_{sp}_{E_tag}_{101 + k % len(species)}_tab.lis").write_text("".join(out))
+
+
+def _legacy_usryield(files):
+    det_header_rx = re.compile(r"^\s*#\s*Detector\s+n:\s*(?P<n>\d+)\s+(?P<name>\S+)")
+    rows = []
+    for f in files:
+        secondary, primary_energy, fort = parse_compiled_name(pathlib.Path(f).name)
+        with open_text_any(pathlib.Path(f)) as fh:
+            hdr = None
+            for line in fh:
+                md = det_header_rx.match(line)
+                if md:
+                    c = angle_center_from_det_name(md["name"])
+                    hdr = (max(0.0, c - 5.0), min(180.0, c + 5.0))
+                    continue
+                if hdr and line.strip() and not line.lstrip().startswith("#"):
+                    parts = line.split()
+                    rows.append({
+                        "secondary": secondary,
+                        "primary_energy": primary_energy,
+                        "angle_lower_deg": hdr[0],
+                        "angle_upper_deg": hdr[1],
+                        "E_low": float(parts[0])*1000,
+                        "E_high": float(parts[1])*1000,
+                        "yld": 0.0 if (int(round(float(parts[3]))) == 99 or (secondary.lower() in ("aproton","aprotons") and float(parts[1])*1000 >= primary_energy*0.95)) else float(parts[2]) * 1e-3,
+                        "rel_err": float(parts[3]),
+                    })
+    return pd.DataFrame.from_records(rows)
+
+
+def _bench(n_files: int, workers: int = 1):
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = pathlib.Path(tmp)
+        print(f"[BENCH] writing {n_files} synthetic files under {root}")
+        _write_synthetic_tree(root, n_files)
+        files = sorted(str(p) for p in root.rglob("compiled_*_tab.lis"))
+
+        t0 = time.perf_counter()
+        df_new, _ = collect(files, usryield_columns, YIELD_COLUMNS)
+        t_new = time.perf_counter() - t0
+
+        if workers > 1:
+            t0 = time.perf_counter()
+            df_par, _ = collect(files, usryield_columns, YIELD_COLUMNS, workers=workers)
+            t_par = time.perf_counter() - t0
+            pd.testing.assert_frame_equal(df_new, df_par)
+
+        t0 = time.perf_counter()
+        df_old = _legacy_usryield(files)
+        t_old = time.perf_counter() - t0
+
+    pd.testing.assert_frame_equal(df_old, df_new, check_dtype=False)
+    print(f"[BENCH] rows: {len(df_new)}")
+    print(f"[BENCH] line-by-line: {t_old:8.2f} s")
+    print(f"[BENCH] block loadtxt: {t_new:8.2f} s  ({t_old / t_new:.1f}x)")
+    if workers > 1:
+        print(f"[BENCH] {workers} workers:   {t_par:8.2f} s  ({t_old / t_par:.1f}x)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Benchmark the block _tab.lis reader on a synthetic tree.")
+    ap.add_argument("--bench", type=int, default=10000, help="Number of synthetic files")
+    ap.add_argument("--workers", type=int, default=1, help="Also time the process pool with N workers")
+    a = ap.parse_args()
+    _bench(a.bench, a.workers)
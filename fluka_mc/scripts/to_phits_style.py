@@ -1,4 +1,75 @@
+#!/usr/bin/env python3
+# to_phits_style.py
+"""
+Convert a FLUKA yield parquet (from parquet_creater_usryield.py) to PHITS-like
+.fgy files: one file per primary energy, one /EmissionSpectrum block per
+secondary (rows: E_low, then the yields of every angle bin in angle order).
+
+The whole table is densified once (yield_cube.cube_arrays), so every
+/ProductionCrossSection comes out of a single sum of yld * dE * dOmega over
+(species, primary energy), and each block is written with one np.savetxt.
+    python to_phits_style.py --parquet apo16_usryld.parquet                 # every primary energy
+    python to_phits_style.py --parquet apo16_usryld.parquet --E 100 150 -o "fgy/apo16_{E}MeV.fgy"
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from yield_cube import cube_arrays
+from yield_dataset import read_yields
+
 # E_specs are 14 chars wide per column
+ROW_FMT = ("%12.7f", "% .7E")
+
+
+def production_xs(arrays):
+    """(species, primary_energy) sum of yld * dE * dOmega over all angle and E bins."""
+    theta_lo = np.deg2rad(arrays["angle_low"])
+    theta_up = np.deg2rad(arrays["angle_high"])
+    d_omega = 2.0 * np.pi * (np.cos(theta_lo) - np.cos(theta_up))                 # (A,)
+    with np.errstate(invalid="ignore"):
+        dE = np.nan_to_num(arrays["E_high"] - arrays["E_low"], nan=0.0, posinf=0.0)  # (S, P, E)
+    return np.einsum("spae,a,spe->sp", np.nan_to_num(arrays["yld"]), d_omega, dE)
+
+
+def write_fgy(path, header, blocks):
+    """Header lines, then per block (secondary, E_low, yields (E, angle), sigma) one savetxt."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w") as fh:
+        fh.write("".join(f"/{k} {v}\n" for k, v in header))
+        for secondary, E_low, yields, sigma in blocks:
+            fh.write(f"/EmissionSpectrum {secondary}\n")
+            fmt = [ROW_FMT[0]] + [ROW_FMT[1]] * yields.shape[1]
+            np.savetxt(fh, np.column_stack([E_low, yields]), fmt=fmt, delimiter=" ")
+            fh.write(f"/ProductionCrossSection {sigma}    {secondary} mb\n")
+
+
+def export(df, out_pattern, stem, beam_type, targ_type, thickness, n_prim, source="Fluka cern 4-5.0"):
+    """Write one .fgy per primary energy of df; returns the written paths."""
+    species, arrays = cube_arrays(df)
+    sigma = production_xs(arrays)
+    yld = np.nan_to_num(arrays["yld"])
+    n_E = arrays["n_E"]
+
+    paths = []
+    for p, primary_energy in enumerate(arrays["primary_energy"]):
+        header = [
+            ("DataSource", source),
+            ("IncidentParticle", beam_type),
+            ("TargetMedium", targ_type),
+            ("TargetThickness", thickness),
+            ("BeamEnergy", f"{primary_energy:g}"),
+            ("NumberOfPrimaries", n_prim),
+        ]
+        # species scored at this energy, rows E ascending, columns angle ascending
+        blocks = ((sp, arrays["E_low"][s, p, :n_E[s, p]], yld[s, p, :, :n_E[s, p]].T, sigma[s, p])
+                  for s, sp in enumerate(species) if n_E[s, p] > 0)
+        path = Path(out_pattern.format(stem=stem, E=int(round(primary_energy))))
+        write_fgy(path, header, blocks)
+        paths.append(path)
+    return paths
 
 
 def main():
@@ -9,53 +80,30 @@ def main():
     p.add_argument(
         "-o",
         "--out",
-        default=None,
-        help="Output .fgy file (default: basename_<E>MeV.fgy)",
+        default="{stem}_{E}MeV.fgy",
+        help="Output .fgy name; {E} (primary energy, MeV) and {stem} (parquet name) are filled in "
+             "(default: {stem}_{E}MeV.fgy)",
     )
-    p.add_argument("--E", help="Primary energy",type=float,required=True)
+    p.add_argument("--E", help="Primary energies (default: all in the parquet)", type=float, nargs="*", default=None)
+    p.add_argument("--beam", default="proton", help="/IncidentParticle")
+    p.add_argument("--target", default="O-16", help="/TargetMedium")
+    p.add_argument("--thickness", default="1.0", help="/TargetThickness")
+    p.add_argument("--n-prim", default="1", help="/NumberOfPrimaries (yields are per primary)")
     args = p.parse_args()
 
     parquet_path = Path(args.parquet)
-    if args.out is None:
-        base = parquet_path.stem
-        args.out = f"{base}_{int(round(args.primary_energy))}MeV.fgy"
-    out_path = Path(args.out)
-
-    # --- Load parquet ---
-    df = pd.read_parquet(parquet_path)
-    primary_energy = args.E
-
-    # select rows for that primary energy
-    df_sel = df[df["primary_energy"] == primary_energy]
-
-    with out_path.open("w") as fh:
-
-        fh.write(f"/DataSource Fluka cern 4-5.0")
-        fh.write(f"/IncidentParticle {beam_type}")
-        fh.write(f"/TargetMedium {targ_type}")
-        fh.write(f"/TargetThickness {thickness}")
-        fh.write(f"/BeamEnergy {primary_energy}")
-        fh.write(f"/NumberOfPrimaries {n_prim}")
-
-        for secondary, sub in df_sel.groupby("secondary"):
-            fh.write(f"/EmissionSpectrum {secondary}")
-            sigmas_prod = 0
-            # group by E_low so we collect all angles at that energy
-            for E_low, block in sub.groupby("E_low"):
-                # sort by angle, if needed
-                block = block.sort_values("angle_lower_deg")
-                # collect the yields
-                yields = block["yld"].tolist()
-                fh.write(f"{E_low:12.7f} " + " ".join(f"{y: .7E}" for y in yields) + "\n")
-                
-                dE = E_high - E_low  # MeV (or whatever units your energies are in)
-
-                theta_low = np.deg2rad(block["angle_lower_deg"].to_numpy())
-                theta_up  = np.deg2rad(block["angle_upper_deg"].to_numpy())
-
-                dOmega = 2.0 * np.pi * (np.cos(theta_low) - np.cos(theta_up))
-
-                # add contribution from all angle bins at this energy
-                sigma_prod += np.sum(yields * dE * dOmega)
-            
-            fh.write(f"/ProductionCrossSection {sigmas_prod}    {secondary} mb")
\ No newline at end of file
+    t0 = time.perf_counter()
+    # --- Load parquet (only the rows for the selected primary energies) ---
+    df = read_yields(parquet_path, primary_energy=args.E, columns=["yld", "rel_err"])
+    if df.empty:
+        raise SystemExit(f"[FATAL] no rows for primary energy {args.E} in {parquet_path}")
+    if "{E}" not in args.out and df.index.get_level_values("primary_energy").nunique() > 1:
+        raise SystemExit("[FATAL] several primary energies: --out needs an {E} placeholder")
+
+    paths = export(df, args.out, parquet_path.name.split(".")[0], args.beam, args.target,
+                   args.thickness, args.n_prim)
+    print(f"[OK] wrote {len(paths)} .fgy files ({len(df)} rows) in {time.perf_counter() - t0:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# yield_cube.py
+"""
+Dense, memory-mapped yield cube with batch interpolation in primary energy.
+
+``build`` turns a yield table (``<dir>_usryld.parquet``, ``po16_shieldhit.parquet``
+or any layout read_yields understands) into one ``.ycube`` file:
+
+    magic (8 bytes) | header length (uint64) | JSON header | arrays
+    yld, rel_err          (species, primary_energy, angle_bin, E_bin)
+    primary_energy        (primary_energy,)
+    angle_low/high        (angle_bin,)
+    E_low/high, n_E       (species, primary_energy, E_bin) / (species, primary_energy)
+
+The header only names the species and the dtype/shape/offset of each array
+(64-byte aligned); opening maps the arrays with np.memmap and parses nothing
+else. E bins differ between primary energies, so every (species, primary
+energy) keeps its own E edges and the cube is NaN-padded to the largest E_bin
+count.
+
+``YieldCube.lookup`` answers whole batches of (species, primary energy,
+angle, E_sec) queries: the yield at (angle, E_sec) is taken from the two
+simulated primary energies around the query and interpolated linearly or
+log-log (falling back to linear where a yield is zero). Outside the
+simulated primary energy range the result is NaN. Bin lookups are bucketed
+searches (O(1) per query), so a batch costs a few dozen array passes:
+    cube = YieldCube("apo16.ycube")
+    yld, rel_err = cube.lookup("proton", pe, theta_deg, E_sec, method="loglog")
+    python yield_cube.py build apo16_usryld.parquet apo16.ycube
+    python yield_cube.py bench apo16.ycube --n 1000000
+"""
+import argparse
+import json
+import pathlib
+import time
+
+import numpy as np
+import pandas as pd
+
+from yield_dataset import read_yields
+
+MAGIC = b"YCUBE1\0\0"
+ALIGN = 64
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def cube_arrays(df, float32=False):
+    """(species, {name: array}) of a yield frame in the cube layout."""
+    flat = df.reset_index()
+    species, s = np.unique(flat["secondary"].astype(str).to_numpy(), return_inverse=True)
+    pe, p = np.unique(flat["primary_energy"].to_numpy(np.float64), return_inverse=True)
+    a_key = flat["angle_lower_deg"].to_numpy(np.float64) + 1j * flat["angle_upper_deg"].to_numpy(np.float64)
+    angles, a = np.unique(a_key, return_inverse=True)
+
+    # E bins are ranked within each (species, primary energy) by their lower edge
+    e_low = flat["E_low"].to_numpy(np.float64)
+    group = s.reshape(-1) * len(pe) + p.reshape(-1)
+    e_rank = pd.DataFrame({"g": group, "e": e_low}).groupby("g")["e"].rank(method="dense").to_numpy(np.int64) - 1
+    n_e = np.zeros(len(species) * len(pe), dtype=np.int64)
+    np.maximum.at(n_e, group, e_rank + 1)
+    shape = (len(species), len(pe), len(angles), int(n_e.max()))
+
+    dtype = np.float32 if float32 else np.float64
+    yld = np.full(shape, np.nan, dtype=dtype)
+    rel = np.full(shape, np.nan, dtype=dtype)
+    idx = (s.reshape(-1), p.reshape(-1), a.reshape(-1), e_rank)
+    yld[idx] = flat["yld"].to_numpy()
+    rel[idx] = flat["rel_err"].to_numpy()
+
+    E_low = np.full(shape[:2] + shape[3:], np.inf)
+    E_high = np.full_like(E_low, np.inf)
+    E_low[idx[0], idx[1], e_rank] = e_low
+    E_high[idx[0], idx[1], e_rank] = flat["E_high"].to_numpy(np.float64)
+    return list(species), {
+        "yld": yld,
+        "rel_err": rel,
+        "primary_energy": pe,
+        "angle_low": angles.real.copy(),
+        "angle_high": angles.imag.copy(),
+        "E_low": E_low,
+        "E_high": E_high,
+        "n_E": n_e.reshape(shape[:2]),
+    }
+
+
+def write_cube(path, species, arrays):
+    entries, offset = {}, 0
+    for name, arr in arrays.items():
+        entries[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset = _align(offset + arr.nbytes)
+    header = json.dumps({"version": 1, "species": species, "arrays": entries}).encode()
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    path = pathlib.Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(MAGIC + np.uint64(len(header)).tobytes() + header)
+        for name, arr in arrays.items():
+            fh.seek(data_start + entries[name]["offset"])
+            fh.write(np.ascontiguousarray(arr).tobytes())
+        fh.truncate(data_start + offset)
+    tmp.replace(path)
+
+
+def build(src, dst, float32=False):
+    species, arrays = cube_arrays(read_yields(src), float32=float32)
+    write_cube(dst, species, arrays)
+    return species, arrays
+
+
+class BucketSearch:
+    """
+    searchsorted(keys, x, side="right") - 1 in O(1) per query: a uniform
+    bucket grid over the key range gives the last key below each bucket start,
+    and a few vectorized steps forward finish the search.
+    """
+
+    def __init__(self, keys, max_buckets=1 << 22):
+        keys = np.asarray(keys, dtype=np.float64)
+        self.keys = np.append(keys, np.inf)
+        self.x0 = keys[0]
+        width = keys[-1] - self.x0
+        n = 4 * len(keys)
+        while True:
+            self.h = width / n if width > 0 else 1.0
+            self.start = np.searchsorted(keys, self.x0 + np.arange(n + 1) * self.h, side="right") - 1
+            self.steps = int(np.diff(self.start).max()) if n else 0
+            if self.steps <= 2 or n >= max_buckets:
+                break
+            n *= 4
+        self.n = n
+
+    def __call__(self, x):
+        with np.errstate(invalid="ignore"):
+            b = ((x - self.x0) * (1.0 / self.h)).astype(np.int64)  # NaN and x < x0 -> bucket 0
+        np.clip(b, 0, self.n, out=b)
+        j = self.start[b]
+        for _ in range(self.steps):
+            j += self.keys[j + 1] <= x  # keys end with +inf, so j + 1 is always valid
+        # truncation can land one bucket late, and x < x0 ends at -1
+        j -= self.keys[j] > x
+        return j
+
+
+class YieldCube:
+    """Read-only view of a .ycube file; arrays are np.memmap."""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        with open(self.path, "rb") as fh:
+            if fh.read(len(MAGIC)) != MAGIC:
+                raise IOError(f"{path}: not a yield cube")
+            n = int(np.frombuffer(fh.read(8), dtype=np.uint64)[0])
+            header = json.loads(fh.read(n))
+        data_start = _align(len(MAGIC) + 8 + n)
+        self.species = header["species"]
+        self.species_index = {sp: i for i, sp in enumerate(self.species)}
+        for name, e in header["arrays"].items():
+            arr = np.memmap(self.path, dtype=np.dtype(e["dtype"]), mode="r",
+                            offset=data_start + e["offset"], shape=tuple(e["shape"]))
+            setattr(self, name, arr)
+        self._ready = False
+
+    def _species_codes(self, species):
+        species = np.asarray(species)
+        if species.dtype.kind in "iu":
+            return species.astype(np.int64)
+        uniq, inv = np.unique(species.astype(str), return_inverse=True)
+        try:
+            codes = np.array([self.species_index[u] for u in uniq], dtype=np.int64)
+        except KeyError as e:
+            raise KeyError(f"species {e} not in cube ({', '.join(self.species)})") from None
+        return codes[inv.reshape(-1)].reshape(species.shape)
+
+    def _tables(self):
+        S, P, A, NE = self.yld.shape
+        self._p_search = BucketSearch(np.asarray(self.primary_energy))
+        self._a_search = BucketSearch(np.asarray(self.angle_low))
+        self._a_high = np.asarray(self.angle_high, dtype=np.float64)
+        # one sorted key array for all rows: row * span + E_low; the padding of short rows
+        # is spread over the free second half of the row span
+        lo = np.asarray(self.E_low).reshape(S * P, NE)
+        finite = np.isfinite(lo)
+        hi = np.asarray(self.E_high)[np.isfinite(self.E_high)]
+        self._e_min = lo[finite].min() if finite.any() else 0.0
+        self._e_span = (max(hi.max(), lo[finite].max()) - self._e_min + 1.0) * 2.0 if finite.any() else 1.0
+        rows = np.arange(S * P)[:, None] * self._e_span
+        pad = rows + self._e_span * (0.5 + np.arange(NE) / (2 * NE))
+        self._e_search = BucketSearch(np.where(finite, rows + (lo - self._e_min), pad).ravel())
+        self._e_high = np.asarray(self.E_high, dtype=np.float64).ravel()
+        self._ready = True
+
+    def _e_index(self, row, E):
+        """Flat (row, E bin) index of E in each (species, primary energy) row and whether it is inside a bin."""
+        j = self._e_search(row * self._e_span + (E - self._e_min))
+        NE = self.yld.shape[3]
+        ok = (j >= row * NE) & (E < self._e_high[np.maximum(j, 0)])
+        return j, ok
+
+    def lookup(self, species, primary_energy, angle, E, method="linear"):
+        """
+        Yield and rel_err at (angle [deg], E_sec) for every query, interpolated
+        in primary energy between the simulated points ("linear" or "loglog").
+        All arguments broadcast; species may be names or cube indices. Queries
+        outside the simulated primary energies, angles or E bins give NaN.
+        """
+        if method not in ("linear", "loglog"):
+            raise ValueError(f"unknown method {method!r}")
+        if not self._ready:
+            self._tables()
+        s, pe, ang, E = np.broadcast_arrays(self._species_codes(species),
+                                            np.asarray(primary_energy, dtype=np.float64),
+                                            np.asarray(angle, dtype=np.float64),
+                                            np.asarray(E, dtype=np.float64))
+        shape = s.shape
+        s, pe, ang, E = (x.ravel() for x in (s, pe, ang, E))
+        S, P, A, NE = self.yld.shape
+        grid = np.asarray(self.primary_energy, dtype=np.float64)
+
+        # bracketing primary energies i0, i0 + 1 and the weight of i0 + 1
+        i0 = self._p_search(pe)
+        np.clip(i0, 0, max(P - 2, 0), out=i0)
+        row0 = s * P + i0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if P == 1:
+                t = np.zeros_like(pe)
+            elif method == "loglog":
+                t = np.log(pe / grid[i0]) / np.log(grid[i0 + 1] / grid[i0])
+            else:
+                t = (pe - grid[i0]) / (grid[i0 + 1] - grid[i0])
+        good = (pe >= grid[0]) & (pe <= grid[-1])
+
+        # angle bin: the last one starting below ang (bins may overlap)
+        a = self._a_search(ang)
+        good &= (a >= 0) & (ang <= self._a_high[np.maximum(a, 0)])
+        a = np.maximum(a, 0)
+
+        flat_y, flat_r = self.yld.reshape(-1), self.rel_err.reshape(-1)
+        vals, errs = [], []
+        for row in (row0, row0 + min(P - 1, 1)):
+            j, ok = self._e_index(row, E)
+            ok &= good
+            k = np.where(ok, (row * A + a) * NE + (j - row * NE), 0)
+            y = np.where(ok, flat_y[k], np.nan)
+            vals.append(y)
+            errs.append(np.abs(y) * flat_r[k])
+        y0, y1 = vals
+        with np.errstate(divide="ignore", invalid="ignore"):
+            y = y0 + t * (y1 - y0)
+            if method == "loglog":
+                # log-log where both yields are positive, linear (e.g. through zero) elsewhere
+                pos = (y0 > 0) & (y1 > 0)
+                ylog = np.exp(np.log(y0) + t * (np.log(y1) - np.log(y0)))
+                y = np.where(pos, ylog, y)
+            rel = np.hypot((1 - t) * errs[0], t * errs[1]) / np.abs(y)
+        return y.reshape(shape), rel.reshape(shape)
+
+
+def _bench(path, n):
+    t0 = time.perf_counter()
+    cube = YieldCube(path)
+    t_open = time.perf_counter() - t0
+    rng = np.random.default_rng(0)
+    grid = np.asarray(cube.primary_energy)
+    sp = rng.integers(0, len(cube.species), n)
+    pe = rng.uniform(grid[0], grid[-1], n)
+    ang = rng.uniform(cube.angle_low[0], cube.angle_high[-1], n)
+    E = rng.uniform(0, pe)
+    cube.lookup(sp[:10], pe[:10], ang[:10], E[:10])  # builds the E-bin search keys once
+    for method in ("linear", "loglog"):
+        t0 = time.perf_counter()
+        y, _ = cube.lookup(sp, pe, ang, E, method=method)
+        dt = time.perf_counter() - t0
+        print(f"[BENCH] {method:6s}: {n} queries in {dt * 1e3:.1f} ms ({np.isfinite(y).mean():.0%} inside the table)")
+    print(f"[BENCH] open: {t_open * 1e3:.2f} ms, cube {cube.yld.shape}, {cube.path.stat().st_size / 1e6:.1f} MB")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build / query memory-mapped yield cubes.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Convert a yield parquet into a .ycube file")
+    b.add_argument("src", help="Yield parquet (file, part dir, hive dataset or compact dir)")
+    b.add_argument("dst", help="Output .ycube file")
+    b.add_argument("--float32", action="store_true", help="Store yld/rel_err as float32")
+    q = sub.add_parser("bench", help="Time batch lookups at random points")
+    q.add_argument("cube")
+    q.add_argument("--n", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        species, arrays = build(args.src, args.dst, float32=args.float32)
+        print(f"[OK] wrote {args.dst}: {arrays['yld'].shape} (species x E_primary x angle x E), "
+              f"species {species}")
+    else:
+        _bench(args.cube, args.n)
+
+
+if __name__ == "__main__":
+    main()
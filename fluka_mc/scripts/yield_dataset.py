@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# yield_dataset.py
+"""
+Hive-partitioned parquet layout and filtered reader for the collector outputs.
+
+Layout written by ``--partitioned``:
+    <out>_usryld/secondary=<sp>/primary_energy=<E>/part-*.parquet
+
+Rows are sorted by the full bin index before writing, so row-group
+statistics are tight. ``read_yields`` works on the monolithic parquet, the
+incremental part directory and the partitioned layout alike; a
+``primary_energy``/``secondary`` selection is pushed down to pyarrow so only
+the matching partitions (or row groups) are read.
+
+Compact layout written by ``--compact`` (or ``python yield_dataset.py compact``):
+    <out>_usryld.compact/bins.parquet   secondary (dictionary), primary_energy,
+                                        angle_bin, e_bin (int16), yld, rel_err
+    <out>_usryld.compact/edges.parquet  secondary, primary_energy, axis, bin, low, high
+Bin edges are stored once per (primary_energy, secondary) instead of on every
+row; ``yld``/``rel_err`` can be stored as float32. ``read_yields`` rebuilds the
+usual wide MultiIndex view from it.
+"""
+import argparse
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+PARTITION_COLS = ["secondary", "primary_energy"]
+PARTITIONING = ds.partitioning(
+    pa.schema([("secondary", pa.string()), ("primary_energy", pa.float64())]),
+    flavor="hive",
+)
+# index order used by all collectors; each table has a prefix-compatible subset
+INDEX_COLS = ["secondary", "primary_energy", "angle_lower_deg", "angle_upper_deg", "E_low", "E_high"]
+ROWS_PER_GROUP = 64 * 1024
+
+# (axis name, lower edge column, upper edge column, bin index column)
+COMPACT_AXES = [
+    ("angle", "angle_lower_deg", "angle_upper_deg", "angle_bin"),
+    ("E", "E_low", "E_high", "e_bin"),
+]
+GROUP_COLS = ["secondary", "primary_energy"]
+
+
+def is_partitioned(path) -> bool:
+    p = pathlib.Path(path)
+    return p.is_dir() and any(c.is_dir() and c.name.startswith("secondary=") for c in p.iterdir())
+
+
+def write_partitioned(df, root, basename="part"):
+    """
+    Write an indexed collector frame into the hive layout under root.
+    Existing files with the same basename in the touched partitions are replaced.
+    """
+    remove_partitioned(root, basename)
+    table = pa.Table.from_pandas(df.sort_index().reset_index(), preserve_index=False)
+    ds.write_dataset(
+        table.replace_schema_metadata(None),
+        root,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        max_rows_per_group=ROWS_PER_GROUP,
+        min_rows_per_group=min(ROWS_PER_GROUP, len(table)),
+    )
+
+
+def remove_partitioned(root, basename):
+    """Delete ``<basename>-<i>.parquet`` files from every partition under root."""
+    for old in pathlib.Path(root).glob(f"secondary=*/primary_energy=*/{basename}-*.parquet"):
+        if old.name[len(basename) + 1:-len(".parquet")].isdigit():
+            old.unlink()
+
+
+def _match(field, value, tol):
+    if value is None:
+        return None
+    f = pc.field(field)
+    vals = value if isinstance(value, (list, tuple, set)) else [value]
+    expr = None
+    for v in vals:
+        if field == "primary_energy" and tol > 0:
+            e = (f >= v - tol) & (f <= v + tol)
+        else:
+            e = f == v
+        expr = e if expr is None else (expr | e)
+    return expr
+
+
+def is_compact(path) -> bool:
+    return (pathlib.Path(path) / "bins.parquet").is_file()
+
+
+def to_compact(df, float32=False):
+    """
+    Split an indexed collector frame into (bins, edges) compact tables.
+    Bin indices count up from 0 in edge order within each (secondary, primary_energy).
+    """
+    flat = df.reset_index()
+    bins = flat[GROUP_COLS].copy()
+    edge_tables = []
+    for axis, lo, hi, idx in COMPACT_AXES:
+        if lo not in flat.columns:
+            continue
+        u = flat[GROUP_COLS + [lo, hi]].drop_duplicates().sort_values(GROUP_COLS + [lo, hi])
+        u[idx] = u.groupby(GROUP_COLS, sort=False).cumcount()
+        bins[idx] = flat[GROUP_COLS + [lo, hi]].merge(u, on=GROUP_COLS + [lo, hi], how="left")[idx].to_numpy()
+        edge_tables.append(pd.DataFrame({
+            "secondary": u["secondary"].to_numpy(),
+            "primary_energy": u["primary_energy"].to_numpy(),
+            "axis": axis,
+            "bin": u[idx].to_numpy(),
+            "low": u[lo].to_numpy(),
+            "high": u[hi].to_numpy(),
+        }))
+    idx_cols = [c for c in bins.columns if c not in GROUP_COLS]
+    for c in idx_cols:
+        bins[c] = bins[c].astype(np.int16 if bins[c].max() < np.iinfo(np.int16).max else np.int32)
+
+    value_cols = [c for c in flat.columns if c not in bins.columns and c not in INDEX_COLS]
+    for c in value_cols:
+        bins[c] = flat[c].astype(np.float32) if float32 and flat[c].dtype == np.float64 else flat[c]
+    bins["secondary"] = bins["secondary"].astype("category")
+
+    edges = pd.concat(edge_tables, ignore_index=True)
+    edges["secondary"] = edges["secondary"].astype("category")
+    edges["axis"] = edges["axis"].astype("category")
+    edges["bin"] = edges["bin"].astype(np.int32)
+    return bins, edges
+
+
+def from_compact(bins, edges):
+    """Inverse of to_compact: rebuild the wide MultiIndex frame."""
+    out = bins.copy()
+    out["secondary"] = out["secondary"].astype(str)
+    edges = edges.assign(secondary=edges["secondary"].astype(str), axis=edges["axis"].astype(str))
+    for axis, lo, hi, idx in COMPACT_AXES:
+        if idx not in out.columns:
+            continue
+        e = edges[edges["axis"] == axis].rename(columns={"bin": idx, "low": lo, "high": hi})
+        e = e.drop(columns="axis").astype({idx: out[idx].dtype})
+        out = out.merge(e, on=GROUP_COLS + [idx], how="left").drop(columns=idx)
+    index_cols = [c for c in INDEX_COLS if c in out.columns]
+    return out.set_index(index_cols).sort_index()
+
+
+def write_compact(df, root, float32=False):
+    root = pathlib.Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    bins, edges = to_compact(df, float32=float32)
+    bins.to_parquet(root / "bins.parquet", index=False, row_group_size=ROWS_PER_GROUP)
+    edges.to_parquet(root / "edges.parquet", index=False)
+    return bins, edges
+
+
+def read_compact(path, expr=None, wide=True):
+    """Compact tables (filtered by a pyarrow expression); wide=True rebuilds the usual view."""
+    path = pathlib.Path(path)
+    bins = ds.dataset(path / "bins.parquet").to_table(filter=expr).to_pandas()
+    edges = ds.dataset(path / "edges.parquet").to_table(filter=expr).to_pandas()
+    if not wide:
+        return bins, edges
+    return from_compact(bins, edges)
+
+
+def read_yields(path, primary_energy=None, secondary=None, tol=0.0, columns=None):
+    """
+    Read a collector parquet (file, part directory, hive dataset or compact
+    directory) into the usual MultiIndex frame, keeping only the selected
+    primary energies / secondaries. Both selections accept a scalar or a list.
+    """
+    path = pathlib.Path(path)
+    expr = None
+    for e in (_match("primary_energy", primary_energy, tol), _match("secondary", secondary, 0.0)):
+        if e is not None:
+            expr = e if expr is None else (expr & e)
+
+    if is_compact(path):
+        df = read_compact(path, expr)
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+    partitioning = PARTITIONING if is_partitioned(path) else None
+    dataset = ds.dataset(path, format="parquet", partitioning=partitioning)
+
+    names = dataset.schema.names
+    index_cols = [c for c in INDEX_COLS if c in names]
+    if columns is not None:
+        columns = index_cols + [c for c in columns if c not in index_cols]
+    table = dataset.to_table(columns=columns, filter=expr)
+    df = table.replace_schema_metadata(None).to_pandas()
+    return df.set_index(index_cols).sort_index()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert a collector parquet to the compact layout.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("compact", help="Write <src> as a compact bins/edges directory")
+    c.add_argument("src", help="Collector parquet (file, part dir or hive dataset)")
+    c.add_argument("dst", help="Output directory, e.g. <out>_usryld.compact")
+    c.add_argument("--float32", action="store_true", help="Store yld/rel_err as float32")
+    args = ap.parse_args()
+
+    df = read_yields(args.src)
+    bins, edges = write_compact(df, args.dst, float32=args.float32)
+    mem_wide = df.memory_usage(deep=True).sum() + df.index.memory_usage(deep=True)
+    mem_compact = bins.memory_usage(deep=True).sum() + edges.memory_usage(deep=True).sum()
+    print(f"[OK] wrote {args.dst}: {len(bins)} bins, {len(edges)} edges")
+    print(f"[INFO] in-memory: wide {mem_wide / 1e6:.1f} MB -> compact {mem_compact / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
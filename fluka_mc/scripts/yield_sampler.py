@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# yield_sampler.py
+"""
+Secondary-particle source sampled from double-differential yield tables.
+
+Walker alias tables are built once per (species, primary_energy) over the
+(angle_bin, E_bin) cells of a yield table, weighted by yld * dE * dOmega,
+plus one table per primary energy choosing the species by its total yield.
+A batch then costs a handful of float32 array passes: one uniform picks
+a cell (integer part) and decides between the cell and its alias
+(fractional part), theta is smeared uniformly in solid angle (cos theta)
+inside the angle bin and E uniformly inside the E bin.
+
+The input is a yield parquet (any layout read_yields understands) or a
+.ycube from yield_cube.py; the tables are saved as .npz and reloaded:
+    python yield_sampler.py build apo16_usryld.parquet apo16_sampler.npz
+    python yield_sampler.py sample apo16_sampler.npz --pe 150 --n 1000000 --out src.parquet
+    python yield_sampler.py bench apo16_sampler.npz
+
+Overlapping angle bins (FLUKA detectors wider than their spacing) are
+sampled as they are scored, i.e. their overlap counts twice.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from yield_cube import YieldCube, cube_arrays
+from yield_dataset import read_yields
+
+
+def alias_tables(w):
+    """
+    Walker/Vose alias tables for every row of w (..., K) at once.
+    Returns (prob, alias): cell k is kept with probability prob[k], otherwise alias[k].
+    Rows without weight get prob 1 everywhere (callers mask them out).
+    """
+    w = np.nan_to_num(np.asarray(w, dtype=np.float64), nan=0.0).clip(min=0.0)
+    shape = w.shape
+    w = w.reshape(-1, shape[-1])
+    R, K = w.shape
+    total = w.sum(axis=1, keepdims=True)
+    scaled = np.where(total > 0, w * K / np.where(total > 0, total, 1.0), 1.0)
+
+    prob = np.ones_like(scaled)
+    alias = np.tile(np.arange(K, dtype=np.int32), (R, 1))
+    # Vose's pairing runs per row; rows are independent and K is small (angle x E bins)
+    for r in range(R):
+        q = scaled[r].copy()
+        small = list(np.flatnonzero(q < 1.0))
+        large = list(np.flatnonzero(q >= 1.0))
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[r, s] = q[s]
+            alias[r, s] = l
+            q[l] -= 1.0 - q[s]
+            (small if q[l] < 1.0 else large).append(l)
+        # leftovers are 1 up to rounding
+        prob[r, small + large] = 1.0
+    return prob.reshape(shape), alias.reshape(shape)
+
+
+def build_tables(arrays, species):
+    """Sampler tables from cube_arrays()/YieldCube arrays."""
+    yld = np.asarray(arrays["yld"], dtype=np.float64)
+    S, P, A, NE = yld.shape
+    a_lo = np.asarray(arrays["angle_low"], dtype=np.float64)
+    a_hi = np.asarray(arrays["angle_high"], dtype=np.float64)
+    E_lo = np.asarray(arrays["E_low"], dtype=np.float64)
+    E_hi = np.asarray(arrays["E_high"], dtype=np.float64)
+
+    cos_lo, cos_hi = np.cos(np.radians(a_lo)), np.cos(np.radians(a_hi))
+    d_omega = 2 * np.pi * (cos_lo - cos_hi)                                  # (A,)
+    dE = np.where(np.isfinite(E_lo) & np.isfinite(E_hi), E_hi - np.nan_to_num(E_lo), 0.0)  # (S, P, NE)
+    w = np.nan_to_num(yld, nan=0.0).clip(min=0.0) * d_omega[None, None, :, None] * dE[:, :, None, :]
+
+    cell_w = w.reshape(S, P, A * NE)
+    totals = cell_w.sum(axis=2)                                             # (S, P) per primary
+    prob, alias = alias_tables(cell_w)
+    sp_prob, sp_alias = alias_tables(totals.T)                              # (P, S)
+    return {
+        "species": np.array(species),
+        "primary_energy": np.asarray(arrays["primary_energy"], dtype=np.float64),
+        "prob": prob.astype(np.float32),
+        "alias": alias,
+        "species_prob": sp_prob.astype(np.float32),
+        "species_alias": sp_alias,
+        "totals": totals,
+        "cos_lo": cos_lo,
+        "cos_hi": cos_hi,
+        "E_low": np.where(np.isfinite(E_lo), E_lo, 0.0),
+        "E_width": dE,
+    }
+
+
+class YieldSampler:
+    """Vectorized (species, theta, E) sampler over alias tables."""
+
+    def __init__(self, tables):
+        self.t = {k: np.asarray(v) for k, v in tables.items()}
+        self.species = [str(s) for s in self.t["species"]]
+        self.primary_energy = self.t["primary_energy"]
+        S, P, K = self.t["prob"].shape
+        self.n_E = self.t["E_low"].shape[2]
+        self.K = K
+        # uniform in solid angle inside an angle bin = uniform in cos theta
+        self._cos_lo = self.t["cos_lo"].astype(np.float32)
+        self._dcos = (self.t["cos_hi"] - self.t["cos_lo"]).astype(np.float32)
+        self._cache = {}
+
+    @classmethod
+    def from_yields(cls, src):
+        """Tables from a .ycube file or a yield parquet."""
+        if str(src).endswith(".ycube"):
+            cube = YieldCube(src)
+            names = ("yld", "primary_energy", "angle_low", "angle_high", "E_low", "E_high")
+            return cls(build_tables({n: getattr(cube, n) for n in names}, cube.species))
+        species, arrays = cube_arrays(read_yields(src))
+        return cls(build_tables(arrays, species))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            return cls({k: z[k] for k in z.files})
+
+    def save(self, path):
+        np.savez(path, **self.t)
+
+    def pe_index(self, primary_energy, tol=1e-6):
+        i = int(np.argmin(np.abs(self.primary_energy - primary_energy)))
+        if abs(self.primary_energy[i] - primary_energy) > tol * max(1.0, abs(primary_energy)):
+            raise KeyError(f"primary energy {primary_energy} MeV not simulated "
+                           f"({self.primary_energy.min():g}..{self.primary_energy.max():g} MeV)")
+        return i
+
+    def yield_per_primary(self, primary_energy, species=None):
+        """Secondaries per primary (sum of yld * dE * dOmega) at a simulated primary energy."""
+        p = self.pe_index(primary_energy)
+        tot = self.t["totals"][:, p]
+        return float(tot.sum() if species is None else tot[self.species.index(species)])
+
+    def _at(self, p):
+        """Contiguous float32 slices of the tables at primary energy index p (cached)."""
+        if p not in self._cache:
+            t = self.t
+            self._cache[p] = {
+                "prob": np.ascontiguousarray(t["prob"][:, p]).ravel(),
+                "alias": np.ascontiguousarray(t["alias"][:, p]).ravel(),
+                "species_prob": t["species_prob"][p],
+                "species_alias": t["species_alias"][p],
+                "E_low": np.ascontiguousarray(t["E_low"][:, p], dtype=np.float32).ravel(),
+                "E_width": np.ascontiguousarray(t["E_width"][:, p], dtype=np.float32).ravel(),
+            }
+        return self._cache[p]
+
+    @staticmethod
+    def _draw(prob, alias, K, u, base=None):
+        """
+        Alias draw of a cell in 0..K-1 per uniform u (overwritten): the integer part
+        of u * K picks the cell, the fractional part accepts it or takes its alias.
+        base offsets each draw into its row of the flat prob/alias tables.
+        """
+        u *= K
+        frac, whole = np.modf(u)
+        k = whole.astype(np.int32)
+        np.minimum(k, K - 1, out=k)  # float32 rounding can reach K
+        flat = k if base is None else k + base
+        return np.where(frac < prob[flat], k, alias[flat])
+
+    def sample(self, primary_energy, n, species=None, rng=None):
+        """
+        n secondaries at a simulated primary energy: (species code, theta [deg], E [MeV]),
+        theta and E as float32. species=None draws the species by its yield; codes
+        index self.species.
+        """
+        rng = np.random.default_rng(rng)
+        p = self.pe_index(primary_energy)
+        t = self._at(p)
+        # float64 for the cell draw: its fractional part is the acceptance test and
+        # float32 would quantize it in steps of K * 2**-24
+        u_cell = rng.random(n)
+        u = rng.random((3, n), dtype=np.float32)
+        if species is None:
+            if self.t["totals"][:, p].sum() <= 0:
+                raise ValueError(f"no yield at {primary_energy} MeV")
+            s = self._draw(t["species_prob"], t["species_alias"], len(self.species), u[0])
+            cell = self._draw(t["prob"], t["alias"], self.K, u_cell, s * np.int32(self.K))
+        else:
+            code = self.species.index(species)
+            if self.t["totals"][code, p] <= 0:
+                raise ValueError(f"no {species} yield at {primary_energy} MeV")
+            s = np.full(n, code, dtype=np.int32)
+            K = self.K
+            cell = self._draw(t["prob"][code * K:(code + 1) * K], t["alias"][code * K:(code + 1) * K], K, u_cell)
+
+        a, e = np.divmod(cell, np.int32(self.n_E))
+        theta = self._cos_lo[a]
+        theta += u[1] * self._dcos[a]
+        np.arccos(theta, out=theta)
+        theta *= np.float32(180 / np.pi)
+        e += s * np.int32(self.n_E)
+        E = t["E_low"][e]
+        E += u[2] * t["E_width"][e]
+        return s, theta, E
+
+
+def _bench(sampler, n):
+    pe = float(sampler.primary_energy[len(sampler.primary_energy) // 2])
+    rng = np.random.default_rng(0)
+    sampler.sample(pe, 1000, rng=rng)
+    t0 = time.perf_counter()
+    s, theta, E = sampler.sample(pe, n, rng=rng)
+    dt = time.perf_counter() - t0
+    print(f"[BENCH] {n} samples at {pe:g} MeV in {dt * 1e3:.1f} ms ({n / dt / 1e6:.1f} M/s)")
+    counts = np.bincount(s, minlength=len(sampler.species)) / n
+    for code, sp in enumerate(sampler.species):
+        expect = sampler.yield_per_primary(pe, sp) / max(sampler.yield_per_primary(pe), 1e-300)
+        print(f"  {sp:12s} drawn {counts[code]:.4f}  expected {expect:.4f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Alias-table sampler over yield tables.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Build alias tables from a yield parquet or .ycube")
+    b.add_argument("src")
+    b.add_argument("dst", help="Output tables (.npz)")
+    s = sub.add_parser("sample", help="Draw secondaries at one simulated primary energy")
+    s.add_argument("tables")
+    s.add_argument("--pe", type=float, required=True, help="Primary energy [MeV]")
+    s.add_argument("--n", type=int, default=1_000_000)
+    s.add_argument("--species", default=None, help="Only this species (default: all, by yield)")
+    s.add_argument("--seed", type=int, default=None)
+    s.add_argument("--out", default=None, help="Write the samples here (.parquet or .csv)")
+    q = sub.add_parser("bench", help="Time a batch and compare species fractions with the tables")
+    q.add_argument("tables")
+    q.add_argument("--n", type=int, default=10_000_000)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        t0 = time.perf_counter()
+        sampler = YieldSampler.from_yields(args.src)
+        sampler.save(args.dst)
+        print(f"[OK] wrote {args.dst}: {len(sampler.species)} species x {len(sampler.primary_energy)} "
+              f"primary energies x {sampler.K} cells in {time.perf_counter() - t0:.2f} s")
+        return
+
+    sampler = YieldSampler.load(args.tables)
+    if args.cmd == "bench":
+        _bench(sampler, args.n)
+        return
+    s, theta, E = sampler.sample(args.pe, args.n, species=args.species, rng=args.seed)
+    out = pd.DataFrame({
+        "species": pd.Categorical.from_codes(s, categories=sampler.species),
+        "theta_deg": theta,
+        "E": E,
+    })
+    print(f"[INFO] {sampler.yield_per_primary(args.pe, args.species):.6g} secondaries per primary "
+          f"at {args.pe:g} MeV")
+    if args.out:
+        if args.out.endswith(".csv"):
+            out.to_csv(args.out, index=False)
+        else:
+            out.to_parquet(args.out, index=False)
+        print(f"[OK] wrote {len(out)} samples to {args.out}")
+    else:
+        print(out.describe(include="all").to_string())
+
+
+if __name__ == "__main__":
+    main()
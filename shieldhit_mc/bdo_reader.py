@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# bdo_reader.py
+"""
+In-process decoding of SHIELD-HIT12A ``.bdo`` detector files.
+
+The old ingest ran ``convertmc plotdata`` once per ``.bdo`` (run_convertmc.sh)
+and make_parquet.py re-parsed the resulting ``.dat`` text. Here the payload is
+decoded with pymchelper (the library behind convertmc) straight into NumPy
+(E_sec, angle, yld) columns, optionally over a pool of worker processes, and
+make_parquet.py folds them into its per-bin statistics without any
+intermediate files:
+    python make_parquet.py output --bdo --workers 8
+
+Outputs staged into ``results_<jobid>.zip`` archives by campaign/stage.py
+are found by ``find_bdo`` as ``<archive>/<member>`` paths and decoded from
+the archive (pymchelper opens files by name, so each member goes through a
+temporary file; nothing is unpacked into the output tree).
+
+Run as a script to benchmark against convertmc + .dat parsing:
+    python bdo_reader.py --bench output/E_100 --workers 8
+"""
+import argparse
+import os
+import pathlib
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# the staged-archive helpers live in campaign/stage.py (job scratch dirs get a copy next to this file)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "campaign"))
+from stage import ARCHIVE_GLOB, open_source, split_member
+
+# output/E_<E>/dd_<SP>_<cycle>.bdo (detect.dat.template), dd_ prefix and cycle optional
+BDO_RX = re.compile(r"^(?:dd_)?(?P<secondary>.+?)(?:_(?P<cycle>\d+))?\.bdo$")
+EDIR_RX = re.compile(r"^E_(?P<E>.+)$")
+
+# pymchelper page axes: 0-2 scoring mesh x/y/z, 3-4 Diff1/Diff2 (E, ANGLE in detect.dat)
+E_AXIS, ANGLE_AXIS = 3, 4
+
+
+def find_bdo(root):
+    """
+    All .bdo under root: plain files, plus members of staged results_*.zip
+    archives that have no plain copy next to the archive.
+    """
+    root = pathlib.Path(root)
+    found = sorted(root.rglob("*.bdo"))
+    plain = set(found)
+    for a in sorted(root.rglob(ARCHIVE_GLOB)):
+        with zipfile.ZipFile(a) as zf:
+            found += [a / n for n in sorted(zf.namelist())
+                      if n.endswith(".bdo") and a.parent / n not in plain]
+    return found
+
+
+def parse_bdo_name(path):
+    """(secondary tag, primary energy [MeV], cycle) from output/E_<E>/[results_<id>.zip/]dd_<SP>_<c>.bdo, or None."""
+    path = pathlib.Path(path)
+    edir = pathlib.Path(split_member(path)[0] or path).parent
+    m, d = BDO_RX.match(path.name), EDIR_RX.match(edir.name)
+    if not m or not d:
+        return None
+    try:
+        energy = float(d["E"])
+    except ValueError:
+        return None
+    return m["secondary"], energy, int(m["cycle"] or 0)
+
+
+def read_bdo(path):
+    """
+    Decode one .bdo into (E_sec, angle, yld) float64 columns, one row per
+    (mesh cell, E bin, angle bin) of its first page, as convertmc plotdata
+    would list them. Archive members are decoded via a temporary file.
+    """
+    from pymchelper.input_output import fromfile
+
+    if split_member(path)[0] is not None:
+        with open_source(path) as src, tempfile.NamedTemporaryFile(suffix=".bdo") as tmp:
+            shutil.copyfileobj(src, tmp)
+            tmp.flush()
+            return read_bdo(tmp.name)
+
+    estimator = fromfile(str(path))
+    if estimator is None or not estimator.pages:
+        raise IOError(f"{path}: no detector pages")
+    page = estimator.pages[0]
+    data = np.asarray(page.data, dtype=np.float64)
+    centers = [np.asarray(page.axis(i).data, dtype=np.float64) for i in range(data.ndim)]
+    grids = np.meshgrid(*centers, indexing="ij")
+    return grids[E_AXIS].ravel(), grids[ANGLE_AXIS].ravel(), data.ravel()
+
+
+def _decode(path):
+    """Pool task: (path, columns or None, error message or None)."""
+    try:
+        return path, read_bdo(path), None
+    except Exception as e:
+        return path, None, f"bdo decode failed: {e!r}"
+
+
+def decode_files(paths, workers=1):
+    """
+    Yield (path, (E_sec, angle, yld) or None, error or None) for every path,
+    in input order. With workers > 1 the decoding runs in a process pool.
+    """
+    if workers > 1 and len(paths) > 1:
+        import multiprocessing as mp
+
+        # fork: make_parquet.py has no __main__ guard to re-import under spawn
+        chunksize = max(1, len(paths) // (workers * 8))
+        with mp.get_context("fork").Pool(workers) as pool:
+            yield from pool.imap(_decode, paths, chunksize=chunksize)
+    else:
+        for p in paths:
+            yield _decode(p)
+
+
+def _read_dat_text(path):
+    return pd.read_csv(path, sep=r"\s+", header=None, names=["E_sec", "angle_deg", "yld"],
+                       dtype=np.float64, engine="c")
+
+
+def _bench(root, workers):
+    paths = sorted(pathlib.Path(root).rglob("*.bdo"))
+    if not paths:
+        raise SystemExit(f"[FATAL] no .bdo files under {root}")
+    print(f"[BENCH] {len(paths)} .bdo files under {root}")
+
+    if shutil.which("convertmc"):
+        with tempfile.TemporaryDirectory() as tmp:
+            t0 = time.perf_counter()
+            for i, p in enumerate(paths):
+                subprocess.run(["convertmc", "plotdata", str(p), f"{tmp}/{i}"], check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            t1 = time.perf_counter()
+            rows = sum(len(_read_dat_text(f)) for f in pathlib.Path(tmp).glob("*.dat"))
+            t2 = time.perf_counter()
+        print(f"  convertmc + .dat parse : {t2 - t0:7.2f} s  "
+              f"(convertmc {t1 - t0:.2f} s, parse {t2 - t1:.2f} s, {rows} rows)")
+    else:
+        print("  convertmc not on PATH, skipping the two-stage flow")
+
+    for w in sorted({1, workers}):
+        t0 = time.perf_counter()
+        rows = sum(len(cols[0]) for _, cols, err in decode_files(paths, w) if cols is not None)
+        print(f"  in-process, {w:2d} worker(s): {time.perf_counter() - t0:7.2f} s  ({rows} rows)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Decode SHIELD-HIT .bdo files in-process.")
+    ap.add_argument("--bench", metavar="DIR", required=True,
+                    help="Benchmark decoding all .bdo under DIR against convertmc plotdata")
+    ap.add_argument("--workers", type=int, default=1, help="Number of decoder processes")
+    args = ap.parse_args()
+    _bench(args.bench, args.workers)
+
+
+if __name__ == "__main__":
+    main()
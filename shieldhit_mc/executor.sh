@@ -5,24 +5,43 @@ ANG_BINS=45
 NPRIM=1000000
 #NPRIM=5000
 CYCLES=100
+CPUS=1 # cycles run concurrently inside one job (one core each)
+MEM=4G # per energy
+TIME=60:00:00
+PER_TASK=1 # energies packed into one array task
+MAX_PARALLEL= # optional cap on concurrently running array tasks
+FRESH=0 # 1 = wipe output/ and rerun every energy; 0 = resume, submit only missing work
+RUNTIME_MODEL= # --model: walltime + packing from recorded timings (TIME is then the cap)
+ADAPTIVE_TARGET= # max rel_err in %: CYCLES becomes the budget, run in batches (empty: off, needs FILE_TYPE=bdo)
+ADAPTIVE_BATCH=10 # cycles per batch
+ADAPTIVE_DETECTORS= # Output tags that must converge, e.g. "PRO NEU" (empty: all)
+STAGE=archive # archive: one checksummed results_<jobid>.zip per energy; files: copy dd_* back one by one
 FILE_TYPE=bdo
 #FILE_TYPE=ascii
-rm -rf output
+if [[ "$FRESH" == 1 ]]; then rm -rf output jobs/sh_po16/ledger.json; fi
 mkdir -p output
 E_LIST=(5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20 23 27 30 35 40 50 60 70 80 90 100 110 120 130 140 150 160 170 180 190 200 210 220 230 240 250)
 #E_LIST=(100)
 
-for E in "${E_LIST[@]}"; do
-    echo "Submitting E = ${E} MeV"
-
-    # generate PBS file with substitutions
-    sed -e "s/__ENERGY__/${E}/g" \
-        -e "s/__N_PRIMARIES__/${NPRIM}/g" \
-        -e "s/__ANG_BINS__/${ANG_BINS}/g" \
-        -e "s/__FILE_TYPE__/${FILE_TYPE}/g" \
-        -e "s/__CYCLES__/${CYCLES}/g" \
-        run_scripts/shieldhit_template.pbs > shieldhit_E${E}.pbs
-
-    sbatch -p "$PARTITION" shieldhit_E${E}.pbs
-done
-rm shieldhit_*
\ No newline at end of file
+# one job array for the whole sweep: PER_TASK energies share one task, CPUS cores each
+python3 ../campaign/slurm_array.py \
+    --template run_scripts/shieldhit_template.pbs \
+    --name sh_po16 \
+    --energies "${E_LIST[@]}" \
+    --per-task "${PER_TASK}" \
+    --cpus-per-energy "${CPUS}" \
+    --mem-per-energy "${MEM}" \
+    --time "${TIME}" \
+    --partition "${PARTITION}" \
+    ${MAX_PARALLEL:+--max-parallel "${MAX_PARALLEL}"} \
+    ${RUNTIME_MODEL} \
+    --resume shieldhit \
+    --set "N_PRIMARIES=${NPRIM}" \
+    --set "ANG_BINS=${ANG_BINS}" \
+    --set "FILE_TYPE=${FILE_TYPE}" \
+    --set "CYCLES=${CYCLES}" \
+    --set "CYCLE_LIST=all" \
+    --set "STAGE=${STAGE}" \
+    --set "ADAPTIVE_TARGET=${ADAPTIVE_TARGET}" \
+    --set "ADAPTIVE_BATCH=${ADAPTIVE_BATCH}" \
+    --set "ADAPTIVE_DETECTORS=${ADAPTIVE_DETECTORS}"
@@ -2,25 +2,32 @@
 import pandas as pd, pathlib, os, argparse
 import numpy as np
 import re
-import sys
 from pathlib import Path
 
-ap = argparse.ArgumentParser(description="Write Pandas parquet from convertmc .dat output.")
+from bdo_reader import decode_files, find_bdo, parse_bdo_name
+
+ap = argparse.ArgumentParser(description="Write Pandas parquet from convertmc .dat output (or .bdo directly).")
+ap.add_argument("root", nargs="?", default=None, help="Directory with .dat files (overrides --dir)")
 ap.add_argument("--dir", default="output", help="Path to directory with .dat files")
+ap.add_argument("--bdo", action="store_true",
+                help="Decode output/E_<E>/*.bdo in-process instead of reading convertmc .dat files")
+ap.add_argument("--workers", default=1, type=int, help="Number of .bdo decoder processes (with --bdo)")
 ap.add_argument("--eb", default=3.5, help="Energy bin width", type=float)
 ap.add_argument("--ab", default=45, help="Number of angular bins", type=int)
 ap.add_argument("--out", default="~/repos/grendel/projects/parquets/po16_shieldhit.parquet",
                 help="Output parquet path")
 args = ap.parse_args()
 
-root = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(args.dir)
+root = Path(args.root) if args.root is not None else Path(args.dir)
 eb = float(args.eb) / 2.0
 ab = int(180 / int(args.ab))
 
-files = list(root.rglob("*.dat"))
-print(f"[INFO] matched {len(files)} .dat files under {root}")
+ext = "bdo" if args.bdo else "dat"
+# with --bdo, also the members of staged results_*.zip archives (campaign/stage.py)
+files = find_bdo(root) if args.bdo else list(root.rglob("*.dat"))
+print(f"[INFO] matched {len(files)} .{ext} files under {root}")
 if not files:
-    raise SystemExit("[FATAL] No .dat files matched – check paths & patterns.")
+    raise SystemExit(f"[FATAL] No .{ext} files matched – check paths & patterns.")
 
 # filename patterns:
 #   <E>_<secondary>.dat
@@ -36,7 +43,134 @@ REMAP = {
     "pho": "photon",
 }
 
-rows, bad = [], []
+def read_dat(path, secondary, primary_energy):
+    """
+    Read one convertmc .dat (E_sec, angle_deg, yld) with the C parser and apply
+    the per-cycle transforms as column operations. Returns (E_sec, angle, yld).
+    """
+    raw = pd.read_csv(
+        path,
+        sep=r"\s+",
+        header=None,
+        names=["E_sec", "angle_deg", "yld"],
+        dtype=np.float64,
+        engine="c",
+    )
+    E_sec = raw["E_sec"].to_numpy()
+    angle = raw["angle_deg"].to_numpy()
+    yld = raw["yld"].to_numpy()
+    return E_sec, angle, adjust_yields(E_sec, angle, yld, secondary, primary_energy)
+
+
+def adjust_yields(E_sec, angle, yld, secondary, primary_energy):
+    """Per-cycle transform: zero the primary proton peak, scale the rest."""
+    yld_adj = yld * 10.0
+    if secondary.lower() in ("proton",):
+        yld_adj[(E_sec >= primary_energy * 0.90) & (angle <= 4)] = 0.0
+    return yld_adj
+
+
+class CycleStats:
+    """
+    Running per-bin statistics over cycles for one (secondary, primary_energy).
+
+    Keeps count, Kahan-compensated sum (for the mean) and Welford mean/M2 (for
+    the variance) keyed by bin, folding in one cycle file at a time. This is
+    the same arithmetic, in the same order, as pandas' groupby mean/std, so
+    the results match the old collect-everything-then-groupby path while the
+    memory no longer grows with the number of cycles.
+    """
+
+    def __init__(self):
+        self.E_sec = np.empty(0)
+        self.angle = np.empty(0)
+        self.n = np.zeros(0, dtype=np.int64)
+        self.sum = np.zeros(0)
+        self.comp = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+    def _index(self, E_sec, angle):
+        """
+        Bin slots for the rows of one file, growing the state for new bins.
+        A bin is assumed to appear at most once per cycle file.
+        """
+        if len(E_sec) == len(self.E_sec) and np.array_equal(E_sec, self.E_sec) \
+                and np.array_equal(angle, self.angle):
+            return np.arange(len(E_sec))  # same grid as before: the usual case
+
+        known = len(self.E_sec)
+        keys = np.concatenate([
+            np.stack([self.E_sec, self.angle], axis=1),
+            np.stack([E_sec, angle], axis=1),
+        ])
+        uniq, first, inv = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        fresh = first >= known
+
+        # existing bins keep their slot, unseen bins are appended
+        slot = np.empty(len(uniq), dtype=np.int64)
+        slot[~fresh] = first[~fresh]
+        slot[fresh] = known + np.arange(fresh.sum())
+        self.E_sec = np.concatenate([self.E_sec, uniq[fresh, 0]])
+        self.angle = np.concatenate([self.angle, uniq[fresh, 1]])
+        for attr in ("n", "sum", "comp", "mean", "m2"):
+            cur = getattr(self, attr)
+            setattr(self, attr, np.concatenate([cur, np.zeros(fresh.sum(), dtype=cur.dtype)]))
+        return slot[inv.reshape(-1)[known:]]
+
+    def add(self, E_sec, angle, yld):
+        idx = self._index(E_sec, angle)
+        valid = ~np.isnan(yld)
+        idx, yld = idx[valid], yld[valid]
+
+        self.n[idx] += 1
+        # Kahan sum (pandas group_mean)
+        y = yld - self.comp[idx]
+        t = self.sum[idx] + y
+        self.comp[idx] = t - self.sum[idx] - y
+        self.sum[idx] = t
+        # Welford (pandas group_var)
+        oldmean = self.mean[idx]
+        self.mean[idx] += (yld - oldmean) / self.n[idx]
+        self.m2[idx] += (yld - self.mean[idx]) * (yld - oldmean)
+
+    def result(self):
+        """(E_sec, angle, mean, rel_err) with rel_err = SEM / |mean|, NaN for n == 1."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = self.sum / self.n
+            std = np.sqrt(self.m2 / (self.n - 1))
+            sem = std / np.sqrt(self.n)
+            rel_err = sem / np.abs(mean)
+        rel_err = np.where(self.n > 1, rel_err, np.nan)  # match FLUKA-style: undefined for single cycle
+        return self.E_sec, self.angle, mean, rel_err
+
+
+stats, bad = {}, []
+
+
+def fold_bdo(files):
+    """Decode .bdo files (in a pool with --workers) and fold them in, in file order."""
+    todo = {}
+    for f in files:
+        meta = parse_bdo_name(f)
+        if meta is None:
+            bad.append((f.name, "expected E_<E>/dd_<SP>_<cycle>.bdo"))
+            continue
+        todo[f] = meta
+    for path, cols, err in decode_files(list(todo), workers=args.workers):
+        if cols is None:
+            bad.append((path.name, err))
+            continue
+        secondary_raw, primary_energy, _cycle = todo[path]
+        secondary = REMAP.get(secondary_raw.lower(), secondary_raw.lower())
+        E_sec, angle, yld = cols
+        yld = adjust_yields(E_sec, angle, yld, secondary, primary_energy)
+        stats.setdefault((secondary, primary_energy), CycleStats()).add(E_sec, angle, yld)
+
+
+if args.bdo:
+    fold_bdo(files)
+    files = []
 
 for f in files:
     path = pathlib.Path(f)
@@ -57,44 +191,16 @@ for f in files:
         bad.append((name, f"could not parse primary energy from '{primary_energy_str}'"))
         continue
 
-    cycle = int(m["cycle"]) if m["cycle"] is not None else 0  # 0 means "single/unknown cycle"
+    # cycle number (0 = "single/unknown cycle") only matters as another sample of each bin
 
     try:
-        df_local = pd.read_csv(
-            path,
-            sep=r"\s+",
-            header=None,
-            names=["E_sec", "angle_deg", "yld"],
-            engine="python",
-        )
+        E_sec, angle, yld = read_dat(path, secondary, primary_energy)
     except Exception as e:
         bad.append((name, f"read_csv failed: {e!r}"))
         continue
 
-    # Apply your per-row transforms per *cycle* before aggregation
-    for _, r in df_local.iterrows():
-        try:
-            E_sec = float(r["E_sec"])
-            angle = float(r["angle_deg"])
-            yld = float(r["yld"])
-
-            yld_adj = 0.0 if (secondary.lower() in ("proton",) and E_sec >= primary_energy * 0.90 and angle <= 4) else yld * 10.0
-
-            rows.append(
-                {
-                    "cycle": cycle,
-                    "secondary": secondary,
-                    "primary_energy": primary_energy,
-                    "angle_lower_deg": angle - ab / 2,
-                    "angle_upper_deg": angle + ab / 2,
-                    "E_low": E_sec - eb,
-                    "E_high": E_sec + eb,
-                    "yld": yld_adj,
-                }
-            )
-        except ValueError:
-            bad.append((name, "malformed numeric row"))
-            continue
+    # Fold this cycle into the running per-bin statistics
+    stats.setdefault((secondary, primary_energy), CycleStats()).add(E_sec, angle, yld)
 
 if bad:
     print("[WARN] Issues encountered:")
@@ -103,33 +209,28 @@ if bad:
     if len(bad) > 15:
         print(f"   ... and {len(bad)-15} more")
 
-if not rows:
+if not stats:
     raise SystemExit("[FATAL] No rows parsed — check paths & patterns.")
 
-df = pd.DataFrame.from_records(rows)
-
 index_cols = ["secondary", "primary_energy",
               "angle_lower_deg", "angle_upper_deg",
               "E_low", "E_high"]
 
-# Aggregate over cycles per bin
-g = df.groupby(index_cols, sort=True)
-
-mean_yld = g["yld"].mean()
-n = g["yld"].count()
-
-# sample std over cycles (ddof=1). For n==1 -> NaN
-std = g["yld"].std(ddof=1)
-
-# standard error of the mean
-sem = std / np.sqrt(n)
-
-rel_err = sem / mean_yld.abs()
-rel_err = rel_err.where(n > 1, np.nan)  # match FLUKA-style: undefined for single cycle
-
-out = pd.DataFrame({"yld": mean_yld, "rel_err": rel_err})
-out.index = out.index.set_names(index_cols)
-out = out.sort_index()
+parts = []
+for (secondary, primary_energy), st in stats.items():
+    E_sec, angle, mean_yld, rel_err = st.result()
+    parts.append(pd.DataFrame({
+        "secondary": np.full(len(E_sec), secondary, dtype=object),
+        "primary_energy": np.full(len(E_sec), primary_energy),
+        "angle_lower_deg": angle - ab / 2,
+        "angle_upper_deg": angle + ab / 2,
+        "E_low": E_sec - eb,
+        "E_high": E_sec + eb,
+        "yld": mean_yld,
+        "rel_err": rel_err,
+    }))
+
+out = pd.concat(parts, ignore_index=True).set_index(index_cols).sort_index()
 
 out_path = os.path.expanduser(args.out)
 os.makedirs(os.path.dirname(out_path), exist_ok=True)
@@ -137,6 +238,6 @@ out.to_parquet(out_path)
 
 # small info printout
 num_bins = len(out)
-num_groups = g.ngroups
+num_groups = len(stats)
 print(f"[OK] wrote {out_path}")
-print(f"[INFO] bins: {num_bins}, grouped bins: {num_groups}, cycle-averaged: yes")
+print(f"[INFO] bins: {num_bins}, (secondary, energy) groups: {num_groups}, cycle-averaged: yes")
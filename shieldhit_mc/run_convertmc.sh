@@ -1,19 +1,17 @@
 #!/usr/bin/env bash
 set -u
 
-mkdir -p output/converts
+# Not needed with `python make_parquet.py output --bdo --workers N`, which decodes
+# the .bdo files in-process (bdo_reader.py); kept for the .dat text route.
 
-# Debug: print all matched files (optional)
-# echo output/E_*/*.bdo
+mkdir -p output/converts
 
-# Loop over all .bdo files in directories named E_*
-for bdo in output/E_*/*.bdo; do
-    # Skip if glob didn't match anything
-    [ -e "$bdo" ] || continue
+# jobs run with STAGE=archive leave their outputs in output/E_*/results_<jobid>.zip
+STAGE_PY="$(dirname "$0")/../campaign/stage.py"
 
-    dir="$(dirname "$bdo")"
-    folder="$(basename "$dir")"     # e.g. E_100
-    energy="${folder#E_}"           # strip leading "E_"
+# convertmc one .bdo of energy point $2
+convert() {
+    local bdo="$1" energy="$2"
 
     file="$(basename "$bdo")"       # e.g. dd_proton.bdo or proton.bdo
     name="${file%.bdo}"             # strip .bdo -> dd_proton or proton
@@ -30,4 +28,37 @@ for bdo in output/E_*/*.bdo; do
     #    echo "WARNING: convertmc failed for $bdo, continuing..." >&2
     #    continue
     #fi
+}
+
+# Debug: print all matched files (optional)
+# echo output/E_*/*.bdo
+
+# Loop over all .bdo files in directories named E_*
+for bdo in output/E_*/*.bdo; do
+    # Skip if glob didn't match anything
+    [ -e "$bdo" ] || continue
+
+    dir="$(dirname "$bdo")"
+    folder="$(basename "$dir")"     # e.g. E_100
+    convert "$bdo" "${folder#E_}"   # strip leading "E_"
+done
+
+# .bdo members of staged archives, unpacked one archive at a time (a loose copy wins)
+for archive in output/E_*/results_*.zip; do
+    [ -e "$archive" ] || continue
+
+    dir="$(dirname "$archive")"
+    folder="$(basename "$dir")"
+    tmp="$(mktemp -d)"
+    if ! python3 "$STAGE_PY" extract "$archive" "$tmp" "*.bdo"; then
+        echo "ERROR: cannot unpack $archive" >&2
+        rm -rf "$tmp"
+        exit 1
+    fi
+    for bdo in "$tmp"/*.bdo; do
+        [ -e "$bdo" ] || continue
+        [ -e "$dir/$(basename "$bdo")" ] && continue
+        convert "$bdo" "${folder#E_}"
+    done
+    rm -rf "$tmp"
 done
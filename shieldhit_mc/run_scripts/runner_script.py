@@ -1,20 +1,159 @@
 #!/usr/bin/env python3
 import sys
+import os
+import shutil
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import random as rand
 import subprocess
 import math
+import json
+import re
+
+# files shieldhit needs next to beam.dat/detect.dat in every cycle directory
+STATIC_DATS = ("geo.dat", "mat.dat")
+# Output tags of detect.dat.template, as in campaign/ledger.py
+DETECT_OUTPUT_RX = re.compile(r"^Filename\s+dd_(?P<tag>[^_\s]+)_\{CYCLES\}", re.MULTILINE)
+ADAPTIVE_MARKER = "adaptive.json"
+
+
+def render_cycle(workdir, beam_tpl, detect_tpl, c, seed, ENERGY, E_BINS, N_PRIMARIES, ANG_BINS, FILE_TYPE):
+    # --- write beam.dat ---
+    beam_text = beam_tpl.format(
+        N_PRIMARIES=N_PRIMARIES,
+        SEED=seed,
+        BEAM_MEV=ENERGY,
+    )
+    (workdir / "beam.dat").write_text(beam_text)
+
+    # --- write detect.dat ---
+    detect_text = detect_tpl.format(
+        out_type=FILE_TYPE,
+        BEAM_MEV=ENERGY,
+        E_BINS=E_BINS,
+        ANG_BINS=ANG_BINS,
+        CYCLES=c,
+    )
+    (workdir / "detect.dat").write_text(detect_text)
+
+
+def run_cycle_isolated(cwd, c, render):
+    """
+    Run one cycle in its own cycle_<c>/ directory and move its dd_* outputs
+    back into cwd. Raises CalledProcessError if shieldhit fails.
+    """
+    workdir = cwd / f"cycle_{c}"
+    workdir.mkdir(exist_ok=True)
+    for name in STATIC_DATS:
+        shutil.copy(cwd / name, workdir / name)
+    render(workdir)
+
+    env = dict(os.environ, OMP_NUM_THREADS="1")  # one core per concurrent cycle
+    with (workdir / "shieldhit.log").open("w") as log:
+        subprocess.run(["shieldhit", "."], cwd=workdir, check=True,
+                       stdout=log, stderr=subprocess.STDOUT, env=env)
+
+    outputs = sorted(workdir.glob("dd_*"))
+    for out in outputs:
+        shutil.move(str(out), str(cwd / out.name))
+    shutil.rmtree(workdir)
+    return c, len(outputs)
+
+
+class RelErrTracker:
+    """
+    Running per-bin sum / sum of squares over cycles for the watched dd_<TAG>
+    outputs; rel_err of the cycle mean in percent, as make_parquet.py reports it.
+    """
+
+    def __init__(self, tags, floor=0.0):
+        self.tags, self.floor = tags, floor
+        self.n, self.sum, self.sumsq = {}, {}, {}
+
+    def add_cycle(self, paths):
+        """Fold in one cycle: {tag: output path (file or staged archive member)}."""
+        from bdo_reader import read_bdo
+
+        for tag in self.tags:
+            _, _, yld = read_bdo(paths[tag])
+            yld = np.nan_to_num(yld)
+            if tag not in self.sum:
+                self.n[tag], self.sum[tag], self.sumsq[tag] = 0, np.zeros_like(yld), np.zeros_like(yld)
+            self.n[tag] += 1
+            self.sum[tag] += yld
+            self.sumsq[tag] += yld ** 2
+
+    def max_rel_err(self):
+        worst = 0.0
+        for tag in self.tags:
+            n = self.n.get(tag, 0)
+            if n < 2:
+                return 100.0
+            mean = self.sum[tag] / n
+            var = np.maximum(self.sumsq[tag] / n - mean ** 2, 0.0) * n / (n - 1)
+            populated = mean > self.floor * mean.max() if mean.max() > 0 else np.zeros(len(mean), bool)
+            if populated.any():
+                err = np.sqrt(var[populated] / n) / mean[populated] * 100.0
+                worst = max(worst, float(err.max()))
+        return worst
+
+
+def available_outputs(where):
+    """{file name: path} of the dd_* outputs in where, plain or staged in results_*.zip archives."""
+    from stage import archives, members
+
+    found = {}
+    for a in archives(where):
+        found.update({m.rsplit("/", 1)[1]: m for m in members(a, "dd_*")})
+    found.update({p.name: str(p) for p in Path(where).glob("dd_*")})
+    return found
+
+
+def run_batch(cwd, batch, seeds, WORKERS, beam_tpl, detect_tpl, ENERGY, E_BINS, N_PRIMARIES, ANG_BINS, FILE_TYPE):
+    if WORKERS > 1:
+        print(f"ENERGY = {ENERGY} MeV, E_BINS = {E_BINS}, {len(batch)} cycles on {WORKERS} workers")
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            futures = []
+            for c, SEED in zip(batch, seeds):
+                print(f"Cycle = {c}, SEED = {SEED}")
+
+                def render(workdir, c=c, SEED=SEED):
+                    render_cycle(workdir, beam_tpl, detect_tpl, c, SEED,
+                                 ENERGY, E_BINS, N_PRIMARIES, ANG_BINS, FILE_TYPE)
+
+                futures.append(pool.submit(run_cycle_isolated, cwd, c, render))
+            for fut in as_completed(futures):
+                c, n_out = fut.result()
+                print(f"Cycle {c} done, {n_out} outputs gathered")
+        return
+
+    for c, SEED in zip(batch, seeds):
+        print(f"ENERGY = {ENERGY} MeV, E_BINS = {E_BINS}, Cycle = {c}, SEED = {SEED}")
+        render_cycle(cwd, beam_tpl, detect_tpl, c, SEED,
+                     ENERGY, E_BINS, N_PRIMARIES, ANG_BINS, FILE_TYPE)
+
+        # geo.dat and mat.dat are already present in the directory
+
+        # --- run shieldhit ---
+        subprocess.run(["shieldhit", "."], check=True)
+
 
 def main():
-    if len(sys.argv) != 6:
-        raise SystemExit("Usage: runner_script.py <ENERGY_MEV> <N_PRIMARIES>")
+    if len(sys.argv) not in (6, 7, 8):
+        raise SystemExit("Usage: runner_script.py <ENERGY_MEV> <N_PRIMARIES> <ANG_BINS> <FILE_TYPE> <CYCLES> "
+                         "[WORKERS] [CYCLE_LIST]")
 
     ENERGY = float(sys.argv[1])  # MeV
     N_PRIMARIES = int(sys.argv[2]) # number of primaries
     ANG_BINS = sys.argv[3]
     FILE_TYPE = sys.argv[4]
     CYCLES = int(sys.argv[5])
+    WORKERS = int(sys.argv[6]) if len(sys.argv) >= 7 else 1  # concurrent cycles
+    # "all", or the cycle numbers still missing when a campaign is resumed
+    CYCLE_LIST = sys.argv[7] if len(sys.argv) == 8 else "all"
+    cycle_ids = list(range(1, CYCLES + 1)) if CYCLE_LIST.strip() in ("", "all") \
+        else [int(c) for c in CYCLE_LIST.split()]
 
     # --- binning: width ~ 3.5 MeV ---
     # example: 7 MeV -> 2 bins
@@ -26,31 +165,63 @@ def main():
     beam_tpl   = (cwd / "beam.dat.template").read_text()
     detect_tpl = (cwd / "detect.dat.template").read_text()
 
-    for c in np.arange(1,CYCLES+1):
-        SEED = rand.randint(1,100000) + int(round(ENERGY * 10.0))
-        print(f"ENERGY = {ENERGY} MeV, E_BINS = {E_BINS}, Cycle = {c}, SEED = {SEED}")
-        # --- write beam.dat ---
-        beam_text = beam_tpl.format(
-            N_PRIMARIES=N_PRIMARIES,
-            SEED=SEED,
-            BEAM_MEV=ENERGY,
-        )
-        (cwd / "beam.dat").write_text(beam_text)
-
-        # --- write detect.dat ---
-        detect_text = detect_tpl.format(
-            out_type=FILE_TYPE,
-            BEAM_MEV=ENERGY,
-            E_BINS=E_BINS,
-            ANG_BINS=ANG_BINS,
-            CYCLES=c,
-        )
-        (cwd / "detect.dat").write_text(detect_text)
+    # distinct seeds per cycle
+    seeds = [s + int(round(ENERGY * 10.0)) for s in rand.sample(range(1, 100001), len(cycle_ids))]
 
-        # geo.dat and mat.dat are already present in the directory
+    args = (WORKERS, beam_tpl, detect_tpl, ENERGY, E_BINS, N_PRIMARIES, ANG_BINS, FILE_TYPE)
 
-        # --- run shieldhit ---
-        subprocess.run(["shieldhit", "."], check=True)
+    # adaptive mode: the cycles are the budget, batches stop once the max
+    # rel_err of the watched outputs (default: all Output tags) is at the target
+    target = float(os.environ.get("ADAPTIVE_TARGET") or 0)
+    if target <= 0:
+        run_batch(cwd, cycle_ids, seeds, *args)
+        return
+
+    if FILE_TYPE != "bdo":
+        raise SystemExit("adaptive mode reads the cycle outputs with bdo_reader.py: FILE_TYPE must be bdo")
+    batch_size = max(1, int(os.environ.get("ADAPTIVE_BATCH") or WORKERS))
+    tags = os.environ.get("ADAPTIVE_DETECTORS", "").split() or \
+        DETECT_OUTPUT_RX.findall(detect_tpl)
+    tracker = RelErrTracker(tags, float(os.environ.get("ADAPTIVE_FLOOR") or 0))
+    # output dir of earlier jobs: cycles finished there count towards the estimate on resume
+    prior = available_outputs(os.environ.get("ADAPTIVE_PRIOR") or cwd)
+
+    def outputs(c):
+        """{tag: path} of a finished cycle (this job first, then earlier ones), or None."""
+        paths = {}
+        for t in tags:
+            name = f"dd_{t}_{c}.{FILE_TYPE}"
+            paths[t] = str(cwd / name) if (cwd / name).is_file() else prior.get(name)
+        return paths if all(paths.values()) else None
+
+    for c in range(1, CYCLES + 1):
+        if c not in cycle_ids and outputs(c):
+            tracker.add_cycle(outputs(c))
+
+    done, worst, converged = [], tracker.max_rel_err(), False
+    with open("adaptive.tsv", "w") as log:
+        for i in range(0, len(cycle_ids), batch_size):
+            if worst <= target:
+                converged = True
+                break
+            batch = cycle_ids[i:i + batch_size]
+            run_batch(cwd, batch, seeds[i:i + batch_size], *args)
+            for c in batch:
+                tracker.add_cycle(outputs(c))
+            done += batch
+            worst = tracker.max_rel_err()
+            log.write(f"{tracker.n[tags[0]]}\t{worst:.4g}\n")
+            log.flush()
+            print(f"Adaptive: {len(done)}/{len(cycle_ids)} cycles, max rel_err {worst:.3g} % (target {target:g} %)")
+        converged = converged or worst <= target
+
+    # the ledger treats a converged energy as complete with the cycles run so far
+    with open(ADAPTIVE_MARKER, "w") as fh:
+        json.dump({"converged": converged, "target": target, "max_rel_err": worst,
+                   "cycles": [c for c in range(1, CYCLES + 1) if outputs(c)]},
+                  fh)
+    print(f"Adaptive: stopped after {len(done)} of {len(cycle_ids)} cycles "
+          f"({'target reached' if converged else 'budget exhausted'})")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,42 @@
+"""
+Shared setup: the script directories are flat (modules import each other by
+plain name), so they go on sys.path here the way the executors run them.
+fluka_mc/scripts and shieldhit_mc/run_scripts both have a runner_script.py;
+load those with load_script().
+"""
+import importlib.util
+import os
+import pathlib
+import stat
+import sys
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+for d in ("campaign", "fluka_mc/scripts", "shieldhit_mc"):
+    sys.path.insert(0, str(ROOT / d))
+
+
+def load_script(relpath, name):
+    """Import ROOT/relpath as module name (for scripts whose file names clash)."""
+    spec = importlib.util.spec_from_file_location(name, ROOT / relpath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_exe(path, text):
+    """Write an executable script (stub programs put on PATH or into a job tree)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+@pytest.fixture
+def bin_dir(tmp_path, monkeypatch):
+    """A directory prepended to PATH for stub executables."""
+    d = tmp_path / "bin"
+    d.mkdir()
+    monkeypatch.setenv("PATH", f"{d}{os.pathsep}{os.environ['PATH']}")
+    return d
@@ -0,0 +1,32 @@
+"""Writes dd_PRO_1.bdo: a SHIELD-HIT12A bdo2019 token stream (the layout pymchelper reads), 3 E x 2 angle bins."""
+import pathlib
+
+import numpy as np
+
+TAGS = dict(format=0x05, rt_nstat=0xAA00, detector_type=0xDD30, page_normalized=0xDD32,
+            data_block=0xDDBB, detector_unit=0xDDBC, page_diff_flag=0xDDD0, page_diff_start=0xDDD2,
+            page_diff_stop=0xDDD3, page_diff_size=0xDDD4, page_diff_units=0xDDD5,
+            geometry_type=0xE000, geo_p_start=0xE002, geo_q_stop=0xE003, geo_n_bins=0xE004)
+
+
+def token(name, value, dtype):
+    arr = np.atleast_1d(np.asarray(value, dtype=dtype))
+    head = np.array([(TAGS[name], np.dtype(dtype).str.encode(), arr.size)],
+                    dtype=[("id", "<u8"), ("type", "S8"), ("len", "<u8")])
+    return head.tobytes() + arr.tobytes()
+
+
+NE, NA = 3, 2
+data = np.arange(1, NE * NA + 1, dtype="<f8")  # Fortran order: E fastest
+out = np.array([(b"xSH12A", b"<>", b"0.9.2")], dtype=[("m", "S6"), ("e", "S2"), ("v", "S16")]).tobytes()
+out += token("format", 2, "<i4") + token("geometry_type", "MSH", "S3")
+out += token("geo_n_bins", [1, 1, 1], "<i4")
+out += token("geo_p_start", [-1.0, -1.0, -1.0], "<f8") + token("geo_q_stop", [1.0, 1.0, 1.0], "<f8")
+out += token("rt_nstat", 1000, "<i8")
+out += token("detector_type", 2, "<i4") + token("page_normalized", 0, "<i4")
+out += token("page_diff_flag", [1, 1], "<i4")
+out += token("page_diff_start", [0.0, 0.0], "<f8") + token("page_diff_stop", [30.0, 180.0], "<f8")
+out += token("page_diff_size", [NE, NA], "<i4")
+out += token("detector_unit", "/cm^2", "S5") + token("page_diff_units", "/cm^2;MeV;deg", "S13")
+out += token("data_block", data, "<f8")
+open(pathlib.Path(__file__).with_name("dd_PRO_1.bdo"), "wb").write(out)
@@ -0,0 +1,86 @@
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROOT, load_script
+
+pytest.importorskip("pymchelper")
+
+import bdo_reader
+from stage import pack
+
+BDO = ROOT / "tests" / "data" / "dd_PRO_1.bdo"  # written by tests/data/make_bdo.py
+MAKE_PARQUET = ROOT / "shieldhit_mc" / "make_parquet.py"
+# Diff1 E (0-30 MeV, 3 bins) x Diff2 angle (0-180 deg, 2 bins), data 1..6 with E running fastest
+E_SEC = np.array([5.0, 5.0, 15.0, 15.0, 25.0, 25.0])
+ANGLE = np.array([45.0, 135.0, 45.0, 135.0, 45.0, 135.0])
+YLD = np.array([1.0, 4.0, 2.0, 5.0, 3.0, 6.0])
+
+
+def with_data(dest, yld):
+    """Copy of the stored file with other yields (in read_bdo row order) in its data block, the last token."""
+    data = np.asarray(yld, "<f8").reshape(3, 2).ravel(order="F")
+    raw = BDO.read_bytes()
+    dest.write_bytes(raw[:-data.nbytes] + data.tobytes())
+    return dest
+
+
+def test_read_bdo():
+    E_sec, angle, yld = bdo_reader.read_bdo(BDO)
+    np.testing.assert_array_equal(E_sec, E_SEC)
+    np.testing.assert_array_equal(angle, ANGLE)
+    np.testing.assert_array_equal(yld, YLD)
+
+
+def test_read_bdo_from_archive(tmp_path):
+    e_dir = tmp_path / "output" / "E_100"
+    e_dir.mkdir(parents=True)
+    shutil.copy(BDO, tmp_path / BDO.name)
+    pack(e_dir / "results_7.zip", [tmp_path / BDO.name])
+
+    (member,) = bdo_reader.find_bdo(tmp_path / "output")
+    assert bdo_reader.parse_bdo_name(member) == ("PRO", 100.0, 1)
+    for got, want in zip(bdo_reader.read_bdo(member), (E_SEC, ANGLE, YLD)):
+        np.testing.assert_array_equal(got, want)
+
+
+def make_parquet(root, out, *extra):
+    res = subprocess.run(["python3", str(MAKE_PARQUET), str(root), "--out", str(out), "--ab", "2", "--eb", "10",
+                          *extra], cwd=MAKE_PARQUET.parent, capture_output=True, text=True)
+    assert res.returncode == 0, res.stdout + res.stderr
+    return pd.read_parquet(out)
+
+
+def test_make_parquet_bdo_matches_dat(tmp_path):
+    """--bdo (one cycle plain, one staged) gives the table of the convertmc .dat route."""
+    bdo_root, dat_root = tmp_path / "bdo", tmp_path / "dat"
+    e_dir = bdo_root / "E_100"
+    e_dir.mkdir(parents=True)
+    dat_root.mkdir()
+    cycles = {1: YLD, 2: YLD[::-1] * 2.0}
+    with_data(e_dir / "dd_PRO_1.bdo", cycles[1])
+    pack(e_dir / "results_7.zip", [with_data(tmp_path / "dd_PRO_2.bdo", cycles[2])])
+    for c, yld in cycles.items():
+        np.savetxt(dat_root / f"100_PRO_{c}.dat", np.column_stack([E_SEC, ANGLE, yld]))
+
+    from_bdo = make_parquet(bdo_root, tmp_path / "bdo.parquet", "--bdo", "--workers", "2")
+    from_dat = make_parquet(dat_root, tmp_path / "dat.parquet")
+
+    assert len(from_bdo) == 6
+    pd.testing.assert_frame_equal(from_bdo, from_dat)
+
+
+def test_rel_err_tracker(tmp_path):
+    runner = load_script("shieldhit_mc/run_scripts/runner_script.py", "shieldhit_runner")
+    cycles = [YLD, YLD * 1.5, YLD * 0.5]
+    tracker = runner.RelErrTracker(["PRO"])
+    for c, yld in enumerate(cycles, 1):
+        tracker.add_cycle({"PRO": str(with_data(tmp_path / f"dd_PRO_{c}.bdo", yld))})
+
+    stack = np.stack(cycles)
+    want = (stack.std(axis=0, ddof=1) / np.sqrt(len(cycles)) / stack.mean(axis=0) * 100.0).max()
+    assert tracker.n["PRO"] == 3
+    assert tracker.max_rel_err() == pytest.approx(want)
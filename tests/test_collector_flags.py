@@ -0,0 +1,22 @@
+import subprocess
+
+import pytest
+
+from conftest import ROOT
+
+SCRIPTS = ["parquet_creater_usryield.py", "parquet_creater_usrtrack.py"]
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+@pytest.mark.parametrize("flags, message", [
+    (["--incremental", "--compact"], "cannot be combined with --incremental"),
+    (["--incremental", "--compact", "--float32"], "cannot be combined with --incremental"),
+    (["--compact", "--partitioned"], "different layouts"),
+    (["--float32"], "only applies to --compact"),
+    (["--incremental", "--float32"], "only applies to --compact"),
+])
+def test_ignored_flag_combinations_are_rejected(tmp_path, script, flags, message):
+    res = subprocess.run(["python3", str(ROOT / "fluka_mc" / "scripts" / script), "--dir", str(tmp_path), *flags],
+                         cwd=ROOT / "fluka_mc" / "scripts", capture_output=True, text=True)
+    assert res.returncode == 2
+    assert message in res.stderr
@@ -0,0 +1,22 @@
+from deck_cache import deck_key, output_mode
+
+DECK = "* comment\nBEAM      -0.1\nSTART     1000.0\nSTOP\n"
+
+
+def key(**env):
+    return deck_key(DECK, 5, "parallel", output_mode(env))
+
+
+def test_output_mode_enters_the_key():
+    base = key(FORT_MERGE="text", STAGE="archive")
+    assert key(FORT_MERGE="text", STAGE="archive", USBREA="1") == base
+    assert key(FORT_MERGE="numpy", STAGE="archive") != base
+    assert key(FORT_MERGE="text", STAGE="files") != base
+    assert key(FORT_MERGE="text", STAGE="archive", USBREA="0") != base
+    # fort_reader.py does not run usbrea
+    assert key(FORT_MERGE="numpy", STAGE="files", USBREA="0") == key(FORT_MERGE="numpy", STAGE="files")
+
+
+def test_deck_comments_do_not_enter_the_key():
+    mode = output_mode({"FORT_MERGE": "text", "STAGE": "archive"})
+    assert deck_key(DECK, 5, "serial", mode) == deck_key(DECK.replace("* comment\n", "") + "\n", 5, "serial", mode)
@@ -0,0 +1,43 @@
+import subprocess
+
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+
+SCRIPT = ROOT / "fluka_mc" / "scripts" / "dose_avg_let.py"
+V = 1.0
+
+
+@pytest.fixture
+def tables(tmp_path):
+    """usrtrack / usrbin parquets of one species: E_dep / L = 2 MeV/cm."""
+    track = pd.DataFrame({"secondary": ["proton"] * 2, "primary_energy": [100.0] * 2,
+                          "E_low": [0.0, 1.0], "E_high": [1.0, 2.0], "yld": [1.0, 1.0]})
+    bins = pd.DataFrame({"secondary": ["proton"], "primary_energy": [100.0], "dose": [4.0]})
+    track.set_index(["secondary", "primary_energy", "E_low", "E_high"]).to_parquet(tmp_path / "trk.parquet")
+    bins.set_index(["secondary", "primary_energy"]).to_parquet(tmp_path / "bin.parquet")
+    return tmp_path
+
+
+def let(tables, *extra):
+    out = tables / "let.csv"
+    res = subprocess.run(["python3", str(SCRIPT), "--track", str(tables / "trk.parquet"),
+                          "--bin", str(tables / "bin.parquet"), "--V", str(V), "--out", str(out), *extra],
+                         cwd=SCRIPT.parent, capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    return pd.read_csv(out)["LET"].item()
+
+
+@pytest.mark.parametrize("extra, rho", [((), 1.4), (("--material", "pmma"), 1.4),
+                                        (("--material", "pmma", "--rho", "1.19"), 1.19)])
+def test_usrbin_density_is_rho(tables, extra, rho):
+    assert let(tables, *extra) == pytest.approx(2.0 / rho)
+
+
+def test_unknown_material_needs_rho(tables):
+    res = subprocess.run(["python3", str(SCRIPT), "--spectrum", "--track", str(tables / "trk.parquet"),
+                          "--material", "lead"],
+                         cwd=SCRIPT.parent, capture_output=True, text=True)
+    assert res.returncode == 2
+    assert "give --rho" in res.stderr
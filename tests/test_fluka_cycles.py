@@ -0,0 +1,72 @@
+import subprocess
+
+import pytest
+
+from conftest import load_script, write_exe
+
+runner = load_script("fluka_mc/scripts/runner_script.py", "fluka_runner")
+
+DECK = "RANDOMIZ         1.0       42.0\nSTART        1000.0\nSTOP\n"
+
+# stub rfluka: logs "<args> <seed>" and leaves one output of cycle 001, as -N0 -M1 does
+RFLUKA = """\
+#!/usr/bin/env python3
+import os, pathlib, re, sys
+inp = pathlib.Path(sys.argv[-1])
+seed = re.search(r"^RANDOMIZ  .{10}(.{10})", inp.read_text(), re.MULTILINE).group(1).strip()
+with open(os.environ["STUB_LOG"], "a") as fh:
+    fh.write(" ".join(a for a in sys.argv[1:-1] if a.startswith(("-N", "-M"))) + f"\\t{seed}\\n")
+(inp.parent / f"{inp.stem}001_fort.101").write_text(seed + "\\n")
+sys.exit(int(os.environ.get("STUB_RC", "0")))
+"""
+
+
+@pytest.fixture
+def deck(tmp_path, bin_dir, monkeypatch):
+    write_exe(bin_dir / "rfluka", RFLUKA)
+    log = tmp_path / "rfluka_calls.tsv"
+    monkeypatch.setenv("STUB_LOG", str(log))
+    monkeypatch.chdir(tmp_path)
+    inp = tmp_path / "deck_E0000100000_.inp"
+    inp.write_text(DECK)
+    return inp, log
+
+
+def calls(log):
+    return [line.split("\t") for line in log.read_text().splitlines()]
+
+
+def test_adaptive_batches_stay_parallel(deck, monkeypatch):
+    inp, log = deck
+    monkeypatch.setattr(runner, "max_rel_err", lambda units, floor=0.0: 100.0)
+
+    done, converged = runner.run_fluka_adaptive(5, 2, 1.0, [101], inp, 0.1, workers=2)
+
+    assert (done, converged) == (5, False)
+    args, seeds = zip(*calls(log))
+    # the last batch has one cycle and still runs as -M1, no -N4 restart
+    assert set(args) == {"-N0 -M1"}
+    assert len(set(seeds)) == 5
+    assert sorted(p.name for p in inp.parent.glob("deck_*_fort.101")) == \
+        [f"deck_E0000100000_{c:03d}_fort.101" for c in range(1, 6)]
+
+
+def test_failing_rfluka_raises(deck, monkeypatch):
+    inp, _ = deck
+    monkeypatch.setenv("STUB_RC", "1")
+    with pytest.raises(subprocess.CalledProcessError):
+        runner.run_fluka(2, inp, 0.1)
+
+
+def test_seeds_follow_the_cycle_number(deck, monkeypatch):
+    inp, log = deck
+    monkeypatch.setattr(runner, "max_rel_err", lambda units, floor=0.0: 100.0)
+
+    runner.run_fluka_adaptive(7, 3, 1.0, [101], inp, 0.1, workers=3)
+
+    seeds = sorted(int(float(seed)) for _, seed in calls(log))
+    base = seeds[0] - 1
+    assert seeds == [base + c for c in range(1, 8)]
+    assert 0 < base and seeds[-1] < runner.MAX_SEED
+    for c in range(1, 8):
+        assert int(float((inp.parent / f"deck_E0000100000_{c:03d}_fort.101").read_text())) == base + c
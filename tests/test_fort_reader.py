@@ -0,0 +1,102 @@
+import struct
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+from fort_reader import USRYIELD_HEADER, _fmt, unit_species
+from tab_reader import YIELD_COLUMNS, usryield_columns
+
+SPECIES = ["PROTON", "NEUTRON"]
+ANGLES = (5, 15)
+NE, ELOW, DE = 4, 0.0, 0.025  # GeV
+WEIGHTS = (1000.0, 1000.0, 500.0)
+FORT_READER = ROOT / "fluka_mc" / "scripts" / "fort_reader.py"
+
+
+def record(payload):
+    return struct.pack("=i", len(payload)) + payload + struct.pack("=i", len(payload))
+
+
+def cycle_values(rng):
+    """values[cycle][species][angle] of NE float32 yields."""
+    return rng.random((len(WEIGHTS), len(SPECIES), len(ANGLES), NE)).astype(np.float32) + 0.5
+
+
+def write_cycles(d, values):
+    """Raw USRYIELD units 101.. as rfluka leaves them, one deck_00<c>_fort.<N> per cycle."""
+    for c, w in enumerate(WEIGHTS):
+        for s, sp in enumerate(SPECIES):
+            out = record(struct.pack("=80s32sfii", b"synthetic", b"now", w, int(w), 1))
+            for a, angle in enumerate(ANGLES):
+                name = f"{sp[:4]}{angle}".encode()
+                out += record(struct.pack(_fmt(USRYIELD_HEADER), a + 1, name, 1, 0, 1, 2, 1.0, 0,
+                                          ELOW, ELOW + NE * DE, NE, DE, angle - 5.0, angle + 5.0))
+                out += record(values[c, s, a].tobytes())
+            (d / f"deck_00{c + 1}_fort.{101 + s}").write_bytes(out)
+
+
+def write_tab_lis(d, values, E_tag):
+    """The usysuw route: merged (weighted mean, error of the mean in %) as _tab.lis text."""
+    w = np.asarray(WEIGHTS)
+    vals = values.astype(np.float64)
+    mean = np.average(vals, axis=0, weights=w)
+    var = np.average((vals - mean) ** 2, axis=0, weights=w)
+    err = np.sqrt(var / (len(w) - 1)) / mean * 100.0
+    edges = ELOW + np.arange(NE + 1) * np.float64(np.float32(DE))
+    for s, sp in enumerate(SPECIES):
+        lines = []
+        for a, angle in enumerate(ANGLES):
+            lines.append(f" # Detector n:  {a + 1:3d}  {sp[:4]}{angle}   (bin/GeV/sr)\n")
+            lines.append(f" # N. of x1 intervals {NE:4d}\n")
+            for j in range(NE):
+                lines.append(f"  {edges[j]:.6E}  {edges[j + 1]:.6E}  {mean[s, a, j]:.6E}  {err[s, a, j]:.6E}\n")
+            lines.append("\n")
+        (d / f"compiled_{sp.lower()}_{E_tag}_{101 + s}_tab.lis").write_text("".join(lines))
+
+
+def table(paths):
+    cols = [usryield_columns(p)[0] for p in paths]
+    return pd.DataFrame({k: np.concatenate([c[k] for c in cols]) for k in YIELD_COLUMNS})
+
+
+def test_fort_reader_matches_text_route(tmp_path):
+    values = cycle_values(np.random.default_rng(3))
+    fort_dir, text_dir = tmp_path / "fort", tmp_path / "text"
+    fort_dir.mkdir()
+    text_dir.mkdir()
+    write_cycles(fort_dir, values)
+    write_tab_lis(text_dir, values, "0100000000")
+
+    res = subprocess.run(["python3", str(FORT_READER), " ".join(SPECIES), "0.1", "--dir", str(fort_dir)],
+                         capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+
+    npz = sorted(fort_dir.glob("compiled_*_tab.npz"))
+    lis = sorted(text_dir.glob("compiled_*_tab.lis"))
+    assert [p.name[:-4] for p in npz] == [p.name[:-4] for p in lis]
+    # the text tools print 7 significant digits
+    pd.testing.assert_frame_equal(table(npz), table(lis), check_exact=False, rtol=2e-6)
+
+
+def test_unit_numbering():
+    assert unit_species(101, SPECIES) == ("usryield", "PROTON")
+    assert unit_species(82, SPECIES) == ("usrtrack", "NEUTRON")
+    assert unit_species(60, SPECIES) == ("usrbin", "PROTON")
+    assert unit_species(21, SPECIES) is None
+    for N in (103, 100, 83, 80, 62):
+        with pytest.raises(ValueError, match=f"fort.{N}:"):
+            unit_species(N, SPECIES)
+
+
+def test_extra_unit_is_fatal(tmp_path):
+    write_cycles(tmp_path, cycle_values(np.random.default_rng(0)))
+    (tmp_path / "deck_001_fort.101").rename(tmp_path / "deck_001_fort.103")
+
+    res = subprocess.run(["python3", str(FORT_READER), " ".join(SPECIES), "0.1", "--dir", str(tmp_path)],
+                         capture_output=True, text=True)
+    assert res.returncode != 0
+    assert "[FATAL] fort.103" in res.stderr
+    assert not list(tmp_path.glob("compiled_*"))
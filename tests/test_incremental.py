@@ -0,0 +1,34 @@
+import json
+
+from incremental import MANIFEST_NAME, update_dataset
+from tab_reader import YIELD_COLUMNS, _write_synthetic_tree, find_compiled, usryield_columns
+from yield_dataset import read_yields
+
+INDEX = ["secondary", "primary_energy", "angle_lower_deg", "angle_upper_deg", "E_low", "E_high"]
+
+
+def update(root, out):
+    return update_dataset(find_compiled(str(root)), str(root), out, usryield_columns, YIELD_COLUMNS, INDEX)
+
+
+def test_unparsed_file_is_retried(tmp_path):
+    root, out = tmp_path / "output", tmp_path / "ds"
+    root.mkdir()
+    _write_synthetic_tree(root, 3, n_det=2, n_e=4)
+    files = sorted(root.rglob("compiled_*_tab.lis"))
+    full = files[1].read_text()
+    lines = full.splitlines(keepends=True)
+    files[1].write_text("".join(lines[:5]) + lines[5].rstrip()[:-2])  # job still writing: a row cut short
+
+    n_rows, bad = update(root, out)
+    assert bad and {name for name, _ in bad} == {files[1].name}
+    manifest = json.loads((out / MANIFEST_NAME).read_text())["files"]
+    assert files[1].name not in {p.rsplit("/", 1)[-1] for p in manifest}
+    assert len(manifest) == 2
+
+    files[1].write_text(full)
+    n_rows, bad = update(root, out)
+    assert bad == []
+    assert n_rows == 3 * 2 * 4  # the energy point of the retried file is re-parsed
+    assert len(json.loads((out / MANIFEST_NAME).read_text())["files"]) == 3
+    assert len(read_yields(str(out))) == 3 * 2 * 4
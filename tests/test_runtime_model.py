@@ -0,0 +1,38 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from runtime_model import CAMPAIGN_NAME, TIMINGS_NAME, RuntimeModel, load_history
+
+PARAMS = {"primaries": 1e6, "cycles": 1, "n_species": 2, "beam": "PROTON", "cpus": 1}
+
+
+def write_history(job_dir, lines):
+    job_dir.mkdir(parents=True)
+    (job_dir / CAMPAIGN_NAME).write_text(json.dumps({"project": job_dir.name, "template": "t.pbs",
+                                                     "params": PARAMS, "subs": {}}))
+    (job_dir / TIMINGS_NAME).write_text("".join("\t".join(map(str, l)) + "\n" for l in lines))
+
+
+def test_failed_runs_are_not_fitted(tmp_path):
+    cost = (1e6, 1, 2, "PROTON", 1)
+    ok = [(E, 100 * E, 0, 7, *cost) for E in (1.0, 2.0, 4.0)]
+    # a failed energy dies after a few seconds: its wall time is no runtime
+    write_history(tmp_path / "p", ok + [(8.0, 2, 3, 7, *cost)])
+
+    hist = load_history(tmp_path, project="p")
+    assert sorted(hist["energy"]) == [1.0, 2.0, 4.0]
+
+    model = RuntimeModel().fit(hist)
+    assert model.n_points == 3
+    assert model.predict([8.0], PARAMS)[0] == pytest.approx(800.0, rel=1e-3)
+
+
+def test_fit_drops_failed_rows_of_a_raw_frame():
+    rows = [(E, 100 * E, rc, 7, 1e6, 1, 2, "PROTON", 1) for E, rc in ((1.0, 0), (2.0, 0), (4.0, 1))]
+    hist = pd.DataFrame(rows, columns=["energy", "seconds", "rc", "job_id", "primaries", "cycles",
+                                       "n_species", "beam", "cpus"])
+    assert RuntimeModel().fit(hist).n_points == 2
+    assert np.isfinite(RuntimeModel().fit(hist).coef).all()
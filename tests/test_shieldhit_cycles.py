@@ -0,0 +1,91 @@
+import json
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+import bdo_reader
+from conftest import ROOT, load_script, write_exe
+
+runner = load_script("shieldhit_mc/run_scripts/runner_script.py", "shieldhit_runner")
+
+# stub shieldhit: every Output of detect.dat becomes a text file "<seed> <cwd name>"
+SHIELDHIT = """\
+#!/usr/bin/env python3
+import os, pathlib, re, time
+cwd = pathlib.Path.cwd()
+seed = re.search(r"RNDSEED\\s+(\\d+)", (cwd / "beam.dat").read_text()).group(1)
+names = re.findall(r"^Filename\\s+(\\S+)", (cwd / "detect.dat").read_text(), re.MULTILINE)
+if list(cwd.glob("dd_*")):
+    raise SystemExit("outputs of another cycle in " + str(cwd))
+with open(os.environ["STUB_LOG"], "a") as fh:
+    fh.write(f"{cwd.name}\\t{seed}\\n")
+time.sleep(0.1)  # keep concurrent cycles overlapping
+for name in names:
+    (cwd / name).write_text(f"{seed} {cwd.name}\\n")
+"""
+
+
+@pytest.fixture
+def job(tmp_path, bin_dir, monkeypatch):
+    """Scratch dir as the job template prepares it, with the stub shieldhit on PATH."""
+    write_exe(bin_dir / "shieldhit", SHIELDHIT)
+    work = tmp_path / "scratch"
+    shutil.copytree(ROOT / "shieldhit_mc" / "dat_templates", work)
+    log = tmp_path / "shieldhit_calls.tsv"
+    monkeypatch.setenv("STUB_LOG", str(log))
+    for key in ("ADAPTIVE_TARGET", "ADAPTIVE_BATCH", "ADAPTIVE_DETECTORS", "ADAPTIVE_PRIOR"):
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.chdir(work)
+    return work, log
+
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["runner_script.py", *map(str, args)])
+    runner.main()
+
+
+def calls(log):
+    return [line.split("\t") for line in log.read_text().splitlines()]
+
+
+def test_concurrent_cycles_are_isolated(job, monkeypatch):
+    work, log = job
+    tags = runner.DETECT_OUTPUT_RX.findall((work / "detect.dat.template").read_text())
+
+    run(monkeypatch, 10, 100, 4, "bdo", 4, 4)
+
+    dirs, seeds = zip(*calls(log))
+    assert sorted(dirs) == [f"cycle_{c}" for c in range(1, 5)]
+    assert len(set(seeds)) == 4
+    # every output came back from its own cycle dir, none overwritten
+    for c in range(1, 5):
+        for tag in tags:
+            seed, origin = (work / f"dd_{tag}_{c}.bdo").read_text().split()
+            assert origin == f"cycle_{c}"
+            assert seed == seeds[dirs.index(origin)]
+    assert not list(work.glob("cycle_*"))
+
+
+def test_adaptive_stops_at_target(job, monkeypatch):
+    work, log = job
+
+    def read_bdo(path):
+        seed = int(open(path).read().split()[0])
+        return np.array([1.0]), np.array([5.0]), np.array([100.0 + seed % 10])
+
+    monkeypatch.setattr(bdo_reader, "read_bdo", read_bdo)
+    monkeypatch.setenv("ADAPTIVE_TARGET", "20")
+    monkeypatch.setenv("ADAPTIVE_BATCH", "2")
+    monkeypatch.setenv("ADAPTIVE_DETECTORS", "PRO")
+
+    run(monkeypatch, 10, 100, 4, "bdo", 6, 2)
+
+    # one batch of two isolated cycles reaches 20 %, the other four are not run
+    dirs, seeds = zip(*calls(log))
+    assert sorted(dirs) == ["cycle_1", "cycle_2"] and len(set(seeds)) == 2
+    marker = json.loads((work / runner.ADAPTIVE_MARKER).read_text())
+    assert marker["converged"] and marker["cycles"] == [1, 2]
+    assert sorted(p.name for p in work.glob("dd_PRO_*")) == ["dd_PRO_1.bdo", "dd_PRO_2.bdo"]
+    assert len((work / "adaptive.tsv").read_text().splitlines()) == 1
@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import ROOT, write_exe
+from ledger import LEDGER_NAME
+from runtime_model import CACHE_HIT_NOTE, TIMINGS_NAME, campaign_params, load_history
+from slurm_array import PLACEHOLDER_RX, write_arrays, write_campaign
+
+# stub runner: leaves one output behind, fails for E = 2.0, finds E = 3.0 in the deck cache
+RUNNER = """\
+import pathlib, sys
+pathlib.Path("{prefix}" + sys.argv[1] + "{suffix}").write_text("x\\n")
+if sys.argv[1] == "3.0":
+    pathlib.Path("deck_cache.hit").write_text("0123abcd")
+sys.exit(3 if sys.argv[1] == "2.0" else 0)
+"""
+
+ENGINES = {
+    # engine: (submit dir, template, stub files, output name prefix/suffix)
+    "fluka": ("fluka_mc", "fluka_mc/templates/cluster_run_template.pbs",
+              ["scripts/compiler.sh", "scripts/fort_reader.py", "scripts/deck_cache.py",
+               "templates/deck.inp.template"], "scripts/runner_script.py", ("deck_", ".inp")),
+    "shieldhit": ("shieldhit_mc", "shieldhit_mc/run_scripts/shieldhit_template.pbs",
+                  ["bdo_reader.py", "dat_templates/geo.dat"], "run_scripts/runner_script.py",
+                  ("dd_PRO_", ".bdo")),
+}
+
+
+def job_tree(tmp_path, engine):
+    """Submit dir for engine with stub job scripts and the real template; returns (submit dir, template, subs)."""
+    sub_name, template, stubs, runner, (prefix, suffix) = ENGINES[engine]
+    root = tmp_path / "tree"
+    (root / "campaign").mkdir(parents=True)
+    shutil.copy(ROOT / "campaign" / "stage.py", root / "campaign")
+    submit_dir = root / sub_name
+    for stub in stubs:
+        write_exe(submit_dir / stub, "" if stub.endswith(".py") else "#!/bin/bash\nexit 0\n")
+    write_exe(submit_dir / runner, RUNNER.format(prefix=prefix, suffix=suffix))
+    env = tmp_path / "env.sh"
+    env.write_text("")
+
+    text = (ROOT / template).read_text()
+    subs = {k: "0" for k in PLACEHOLDER_RX.findall(text)}
+    subs.update(PROJ_NAME="t", SPECIES_N="PROTON", STAGE="files", FORT_MERGE="numpy",
+                DECK_CACHE="", ENVIROMENT=str(env), CYCLE_LIST="all", ADAPTIVE_DETECTORS="")
+    return submit_dir, ROOT / template, subs
+
+
+def run_array(script, submit_dir, tmp_path, task=0):
+    env = dict(os.environ, SLURM_SUBMIT_DIR=str(submit_dir), SLURM_ARRAY_TASK_ID=str(task),
+               SLURM_ARRAY_JOB_ID="7", SLURM_JOB_ID="7", SCRATCH_ROOT=str(tmp_path / "scratch"))
+    return subprocess.run(["bash", str(script)], env=env, capture_output=True, text=True)
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_failing_energy_is_reported(tmp_path, engine):
+    submit_dir, template, subs = job_tree(tmp_path, engine)
+    energies = ["1.0", "2.0"]
+    job_dir = write_campaign(template, "t", energies, subs, submit_dir / "jobs", 1, "1:00:00", "1G")
+    (array,) = write_arrays(job_dir, "t", [("1:00:00", [energies])], 1, "q48", "1G",
+                            params=campaign_params(subs, 1))
+
+    res = run_array(array, submit_dir, tmp_path)
+
+    assert res.returncode == 1, res.stdout + res.stderr
+    assert "FAILED E = 2.0" in res.stdout
+    assert "FAILED E = 1.0" not in res.stdout
+    log = (job_dir / "E_2.0.log").read_text()
+    assert "FAILED: runner_script.py (exit 3)" in log
+    assert "Job finished" not in log
+    assert "Job finished" in (job_dir / "E_1.0.log").read_text()
+
+    rc = {line.split("\t")[0]: line.split("\t")[2]
+          for line in (job_dir / TIMINGS_NAME).read_text().splitlines()}
+    assert rc == {"1.0": "0", "2.0": "3"}
+
+
+def test_deck_cache_hit_is_kept_out_of_timings(tmp_path):
+    submit_dir, template, subs = job_tree(tmp_path, "fluka")
+    energies = ["1.0", "3.0"]
+    job_dir = write_campaign(template, "t", energies, subs, submit_dir / "jobs", 1, "1:00:00", "1G")
+    (array,) = write_arrays(job_dir, "t", [("1:00:00", [energies])], 1, "q48", "1G",
+                            params=campaign_params(subs, 1))
+
+    res = run_array(array, submit_dir, tmp_path)
+
+    assert res.returncode == 0, res.stdout + res.stderr
+    assert "DECK_CACHE_HIT 0123abcd" in (job_dir / "E_3.0.log").read_text()
+    note = {line.split("\t")[0]: line.split("\t")[-1]
+            for line in (job_dir / TIMINGS_NAME).read_text().splitlines()}
+    assert note == {"1.0": "", "3.0": CACHE_HIT_NOTE}
+    assert list(load_history(submit_dir / "jobs")["energy"]) == [1.0]
+
+
+def test_submit_with_fake_sbatch_resumes_missing(tmp_path, bin_dir):
+    submit_dir = tmp_path / "fluka_mc"
+    template = ROOT / "fluka_mc" / "templates" / "cluster_run_template.pbs"
+    calls = tmp_path / "sbatch_calls"
+    write_exe(bin_dir / "sbatch", f'#!/bin/bash\necho "$@" >> {calls}\necho "4242;cluster"\n')
+
+    # E = 1.0 left complete by an earlier submission
+    e_dir = submit_dir / "output" / "t" / "t_1.0"
+    e_dir.mkdir(parents=True)
+    for unit in (101, 81):
+        (e_dir / f"compiled_proton_1000000000_{unit}_tab.lis").write_text(" # Detector n:  1\n")
+    (e_dir / "compiled_proton_1000000000_60.ascii").write_text("0\n" * 15)
+
+    sets = {k: "0" for k in PLACEHOLDER_RX.findall(template.read_text())
+            if k not in ("ENERGY", "CPUS", "TIME", "MEM")}
+    sets.update(PROJ_NAME="t", SPECIES_N="PROTON", DECK_CACHE="", ADAPTIVE_DETECTORS="")
+    cmd = ["python3", str(ROOT / "campaign" / "slurm_array.py"), "--template", str(template),
+           "--name", "t", "--energies", "1.0", "2.0", "3.0", "4.0", "--per-task", "2",
+           "--cpus-per-energy", "4", "--mem-per-energy", "3G", "--max-parallel", "3",
+           "--resume", "fluka"]
+    for k, v in sets.items():
+        cmd += ["--set", f"{k}={v}"]
+    res = subprocess.run(cmd, cwd=submit_dir, capture_output=True, text=True)
+    assert res.returncode == 0, res.stdout + res.stderr
+    assert "1 of 4 energy points complete" in res.stdout
+    assert "submitted array job 4242" in res.stdout
+
+    job_dir = submit_dir / "jobs" / "t"
+    assert sorted(p.name for p in job_dir.glob("E_*.sh")) == ["E_2.0.sh", "E_3.0.sh", "E_4.0.sh"]
+    array = (job_dir / "array.sh").read_text()
+    assert "#SBATCH --array=0-1%3" in array
+    assert "#SBATCH --cpus-per-task=8" in array
+    assert "#SBATCH --mem=6G" in array
+    assert '  "2.0 3.0"\n  "4.0"\n)' in array
+    for script in job_dir.glob("*.sh"):
+        assert not PLACEHOLDER_RX.search(script.read_text()), script.name
+    assert "ENERGY=3.0\n" in (job_dir / "E_3.0.sh").read_text()
+    assert "#SBATCH --mem=3G\n" in (job_dir / "E_3.0.sh").read_text()
+
+    (call,) = calls.read_text().splitlines()
+    assert call.split() == ["--parsable", "jobs/t/array.sh"]
+    ledger = json.loads((job_dir / LEDGER_NAME).read_text())
+    assert {E: p["complete"] for E, p in ledger.items()} == {"1.0": True, "2.0": False, "3.0": False, "4.0": False}
@@ -0,0 +1,39 @@
+import subprocess
+
+from conftest import ROOT, write_exe
+from stage import extract, pack, verify
+
+
+def test_extract_members(tmp_path):
+    for name in ("dd_PRO_1.bdo", "dd_NEU_1.bdo", "adaptive.tsv"):
+        (tmp_path / name).write_text(name)
+    archive = tmp_path / "results_1.zip"
+    pack(archive, sorted(tmp_path.glob("*.*")))
+    assert verify(archive) == []
+
+    paths = extract(archive, tmp_path / "x", "*.bdo")
+    assert [p.name for p in paths] == ["dd_NEU_1.bdo", "dd_PRO_1.bdo"]
+    assert (tmp_path / "x" / "dd_PRO_1.bdo").read_text() == "dd_PRO_1.bdo"
+
+
+def test_convertmc_reads_staged_archives(tmp_path, bin_dir):
+    calls = tmp_path / "convertmc_calls"
+    write_exe(bin_dir / "convertmc", f'#!/bin/bash\necho "$3 $(cat "$2")" >> {calls}\n')
+    e_dir = tmp_path / "output" / "E_5"
+    e_dir.mkdir(parents=True)
+    staged = tmp_path / "staged"
+    staged.mkdir()
+    for c in (1, 2):
+        (staged / f"dd_PRO_{c}.bdo").write_text(f"archived {c}")
+    pack(e_dir / "results_9.zip", sorted(staged.iterdir()))
+    (e_dir / "dd_PRO_1.bdo").write_text("loose 1")
+
+    res = subprocess.run(["bash", str(ROOT / "shieldhit_mc" / "run_convertmc.sh")], cwd=tmp_path,
+                         capture_output=True, text=True)
+
+    assert res.returncode == 0, res.stdout + res.stderr
+    # every .bdo converted once; the loose copy wins over its archived twin
+    assert sorted(calls.read_text().splitlines()) == [
+        "output/converts/5_PRO_1 loose 1",
+        "output/converts/5_PRO_2 archived 2",
+    ]
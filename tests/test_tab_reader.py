@@ -0,0 +1,49 @@
+import numpy as np
+
+from tab_reader import _write_synthetic_tree, read_tab_lis, usrtrack_columns, usryield_columns
+
+
+def synthetic_tab(tmp_path, n_det=3, n_e=5):
+    _write_synthetic_tree(tmp_path, 1, n_det=n_det, n_e=n_e)
+    (path,) = tmp_path.rglob("compiled_*_tab.lis")
+    return path
+
+
+def test_malformed_row_falls_back_to_line_parse(tmp_path):
+    path = synthetic_tab(tmp_path)
+    clean = read_tab_lis(path)
+    assert clean["bad"] == []
+
+    lines = path.read_text().splitlines(keepends=True)
+    rows = [i for i, line in enumerate(lines) if line.startswith("  ")]
+    broken, short = rows[7], rows[12]  # detector 2, detector 3
+    parts = lines[broken].split()
+    lines[broken] = f"  {parts[0]}  {parts[1]}  **********  {parts[3]}\n"  # FLUKA field overflow
+    lines[short] = "  1.0E-02\n"
+    path.write_text("".join(lines))
+
+    tab = read_tab_lis(path)
+    assert tab["bad"] == ["malformed numeric row under det_n=2"]
+    keep = np.ones(len(clean["data"]), bool)
+    keep[[7, 12]] = False
+    np.testing.assert_array_equal(tab["data"], clean["data"][keep])
+    np.testing.assert_array_equal(tab["block"], clean["block"][keep])
+    np.testing.assert_array_equal(tab["det_n"], clean["det_n"])
+    assert tab["det_name"] == clean["det_name"]
+
+    cols, bad = usryield_columns(path)
+    assert bad == [(path.name, "malformed numeric row under det_n=2")]
+    assert len(cols["yld"]) == keep.sum()
+
+
+def test_usrtrack_reports_malformed_rows(tmp_path):
+    path = synthetic_tab(tmp_path, n_det=1)
+    lines = path.read_text().splitlines(keepends=True)
+    i = next(i for i, line in enumerate(lines) if line.startswith("  "))
+    lines[i] = "  0.0  nan?  1.0  2.0\n"
+    track = path.with_name(path.name.replace("_101_", "_81_"))
+    track.write_text("".join(lines))
+
+    cols, bad = usrtrack_columns(track)
+    assert bad == [(track.name, "malformed numeric row under det_n=1")]
+    assert len(cols["yld"]) == 4